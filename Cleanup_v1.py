@@ -1,15 +1,82 @@
-import boto3
 import logging
+from aws_clients import get_client
+from cleanup_engine import (
+    CLEANUP_WORKERS, discover_stale_builders, discover_superseded_images, run_cleanup
+)
+from instrumentation import instrumented
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+DEFAULT_STALE_BUILDER_HOURS = 6
+DEFAULT_KEEP_IMAGES_PER_ASG = 3
+DEFAULT_MIN_IMAGE_AGE_DAYS = 7
+
+
+def collect_targets(event, ec2, asg):
+    """Merge the explicit IDs in the event with the resources found by discovery."""
+    instance_ids = list(event.get('InstanceIds', []))
+    image_ids = list(event.get('AmiIds', []))
+    discover = event.get('Discover')
+    if discover is not None:
+        instance_ids += discover_stale_builders(
+            ec2, discover.get('StaleBuilderHours', DEFAULT_STALE_BUILDER_HOURS)
+        )
+        if discover.get('Images', True):
+            image_ids += discover_superseded_images(
+                ec2, asg,
+                discover.get('KeepImagesPerAsg', DEFAULT_KEEP_IMAGES_PER_ASG),
+                discover.get('MinImageAgeDays', DEFAULT_MIN_IMAGE_AGE_DAYS)
+            )
+    return instance_ids, image_ids
+
+
+def cleanup_copies(event):
+    """Delete the superseded cross-region copies in every region of Discover.Regions."""
+    discover = event['Discover']
+    reports = {}
+    for region in discover['Regions']:
+        ec2 = get_client('ec2', region)
+        image_ids = discover_superseded_images(
+            ec2, get_client('autoscaling', region),
+            discover.get('KeepImagesPerAsg', DEFAULT_KEEP_IMAGES_PER_ASG),
+            discover.get('MinImageAgeDays', DEFAULT_MIN_IMAGE_AGE_DAYS),
+            copies=True
+        )
+        logger.info(f"Starting cleanup of {len(image_ids)} AMI copies in {region}")
+        reports[region] = run_cleanup(ec2, [], image_ids, event.get('DryRun', False),
+                                      event.get('MaxWorkers', CLEANUP_WORKERS))
+    return reports
+
+
+@instrumented
 def lambda_handler(event, context):
     """
-    Lambda handler to cleanup EC2 instance and AMI.
+    Lambda handler to cleanup EC2 instances, AMIs and their snapshots.
+
+    Called by the state machine with one InstanceId and AmiId, or in bulk with
+    InstanceIds/AmiIds lists and/or a Discover block, optionally as a DryRun.
+    Region selects the region of the IDs (default: the function's region);
+    Discover.Regions also cleans the superseded copies in those regions.
     """
     try:
+        # Get the shared EC2 client
+        region = event.get('Region')
+        ec2 = get_client('ec2', region)
+
+        # Bulk mode: explicit lists and/or discovery by tag and age
+        if 'InstanceIds' in event or 'AmiIds' in event or 'Discover' in event:
+            instance_ids, image_ids = collect_targets(event, ec2, get_client('autoscaling', region))
+            logger.info(f"Starting bulk cleanup of {len(instance_ids)} instances and {len(image_ids)} AMIs")
+            report = run_cleanup(ec2, instance_ids, image_ids, event.get('DryRun', False),
+                                 event.get('MaxWorkers', CLEANUP_WORKERS))
+            if event.get('Discover', {}).get('Regions'):
+                report['Regions'] = cleanup_copies(event)
+                report['FailureCount'] += sum(regional['FailureCount']
+                                              for regional in report['Regions'].values())
+            return report
+
         # Validate input
         if 'InstanceId' not in event or 'AmiId' not in event:
             error_msg = "Missing required parameters: InstanceId or AmiId"
@@ -19,32 +86,26 @@ def lambda_handler(event, context):
         # Extract the instance ID and AMI ID from the event input
         instance_id = event['InstanceId']
         ami_id = event['AmiId']
-        
+
         logger.info(f"Starting cleanup for Instance: {instance_id}, AMI: {ami_id}")
 
-        # Initialize the EC2 client
-        ec2 = boto3.client('ec2')
-
-        # Terminate the EC2 instance
-        try:
-            response = ec2.terminate_instances(InstanceIds=[instance_id])
-            instance_state = response['TerminatingInstances'][0]['CurrentState']['Name']
-            logger.info(f"Instance {instance_id} state: {instance_state}")
-        except Exception as e:
-            logger.error(f"Error terminating instance {instance_id}: {str(e)}")
-            raise
-
-        # Deregister the AMI
-        try:
-            ec2.deregister_image(ImageId=ami_id)
-            logger.info(f"AMI {ami_id} deregistered successfully")
-        except Exception as e:
-            logger.error(f"Error deregistering AMI {ami_id}: {str(e)}")
-            raise
+        # Terminate the instance, deregister the AMI and delete its snapshots
+        report = run_cleanup(ec2, [instance_id], [ami_id])
+        if report['Instances']['Failed']:
+            raise RuntimeError(f"Error terminating instance {instance_id}: "
+                               f"{report['Instances']['Failed'][0]['Error']}")
+        if report['MissingImages'] or not report['Images'][0]['Deregistered']:
+            errors = report['Images'][0]['Errors'] if report['Images'] else []
+            raise RuntimeError(f"Error deregistering AMI {ami_id}: "
+                               f"{errors[0]['Error'] if errors else 'image not found'}")
+        deleted_snapshots = report['Images'][0]['DeletedSnapshots']
+        for error in report['Images'][0]['Errors']:
+            logger.warning(f"Could not delete snapshot {error['Id']}: {error['Error']}")
 
         return {
-            'InstanceState': instance_state,
-            'AmiStatus': f'AMI {ami_id} deregistered'
+            'InstanceState': report['Instances']['States'][instance_id],
+            'AmiStatus': f'AMI {ami_id} deregistered',
+            'DeletedSnapshots': deleted_snapshots
         }
 
     except Exception as e:
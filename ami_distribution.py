@@ -0,0 +1,179 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+from botocore.exceptions import ClientError
+import polling
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Auto Scaling group tag listing the regions that run the same application, e.g.
+#   ami-bake:copy-regions = "us-west-2,eu-west-1"
+# Each baked AMI is copied there and the group of the same name in each region
+# is switched to its copy
+COPY_REGIONS_TAG = 'ami-bake:copy-regions'
+# Put on every copy and its snapshots as '<region>/<image>' of the baked AMI
+SOURCE_IMAGE_TAG = 'ami-bake:source-image'
+DISTRIBUTION_WORKERS = int(os.environ.get('DISTRIBUTION_WORKERS', '10'))
+IMAGE_BATCH_SIZE = 100
+FAILED_IMAGE_STATES = ('invalid', 'deregistered', 'failed', 'error')
+
+# Copy states
+PENDING = 'pending'
+AVAILABLE = 'available'
+FAILED = 'failed'
+
+ClientFactory = Callable[[str, str], Any]
+
+
+def distribution_config(asg_group: Dict) -> Dict:
+    """Read the regions to copy baked AMIs to from the Auto Scaling group tags."""
+    tags = {tag['Key']: tag['Value'] for tag in asg_group.get('Tags', [])}
+    regions = []
+    for region in tags.get(COPY_REGIONS_TAG, '').split(','):
+        if region.strip() and region.strip() not in regions:
+            regions.append(region.strip())
+    return {'Enabled': bool(regions), 'Regions': regions}
+
+
+def _pool(jobs: int, max_workers: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=max(1, min(max_workers, jobs)))
+
+
+def copy_tags(image: Dict, source_region: str) -> List[Dict]:
+    """The tags of the baked AMI plus its origin; aws: tags cannot be set."""
+    tags = [{'Key': tag['Key'], 'Value': tag['Value']} for tag in image.get('Tags', [])
+            if not tag['Key'].startswith('aws:') and tag['Key'] != SOURCE_IMAGE_TAG]
+    return tags + [{'Key': SOURCE_IMAGE_TAG, 'Value': f"{source_region}/{image['ImageId']}"}]
+
+
+def start_copies(get_client: ClientFactory, image_id: str, source_region: str, regions: List[str],
+                 max_workers: int = DISTRIBUTION_WORKERS) -> List[Dict]:
+    """Start copying an AMI to every region at once.
+
+    Returns one record per region with the Region, the ImageId of the copy, its
+    State and StartedAt; a copy that could not be started is FAILED with an
+    Error. The ClientToken makes a retried call return the copy it already
+    started instead of starting another.
+    """
+    image = get_client('ec2', source_region).describe_images(ImageIds=[image_id])['Images'][0]
+    tags = copy_tags(image, source_region)
+    targets = [region for region in regions if region != source_region]
+
+    def copy(region: str) -> Dict:
+        started_at = polling.clock()
+        try:
+            copy_id = get_client('ec2', region).copy_image(
+                SourceImageId=image_id,
+                SourceRegion=source_region,
+                Name=image.get('Name', image_id),
+                Description=f"Copy of {image_id} from {source_region}",
+                ClientToken=f"ami-bake-{image_id}",
+                TagSpecifications=[{'ResourceType': 'image', 'Tags': tags},
+                                   {'ResourceType': 'snapshot', 'Tags': tags}]
+            )['ImageId']
+            logger.info(f"Copying {image_id} to {region} as {copy_id}")
+            return {'Region': region, 'ImageId': copy_id, 'State': PENDING, 'StartedAt': started_at}
+        except ClientError as e:
+            logger.error(f"Could not copy {image_id} to {region}: {str(e)}")
+            return {'Region': region, 'ImageId': None, 'State': FAILED, 'StartedAt': started_at,
+                    'Error': str(e)}
+
+    with _pool(len(targets), max_workers) as executor:
+        return list(executor.map(copy, targets))
+
+
+def describe_copy_states(ec2_client, image_ids: List[str]) -> Dict[str, str]:
+    """Return the state of many AMIs in one region, 100 per call.
+
+    The IDs go in an image-id filter, so a copy that is not visible yet right
+    after CopyImage does not fail the call; it is simply not listed.
+    """
+    states = {}
+    # Not backup_job_resolver.chunked: that module imports distribution_config from here
+    image_ids = sorted(set(image_ids))
+    for start in range(0, len(image_ids), IMAGE_BATCH_SIZE):
+        chunk = image_ids[start:start + IMAGE_BATCH_SIZE]
+        response = ec2_client.describe_images(Filters=[{'Name': 'image-id', 'Values': chunk}])
+        for image in response['Images']:
+            states[image['ImageId']] = image['State']
+    return states
+
+
+def copy_status(get_client: ClientFactory, copies: List[Dict],
+                max_workers: int = DISTRIBUTION_WORKERS) -> List[Dict]:
+    """Refresh the copies that are still pending, one describe_images call per region.
+
+    Regions are checked in parallel. A copy that became available records
+    CompletedAt and CopySeconds, the time from the copy request to the check
+    that saw it available.
+    """
+    pending: Dict[str, List[str]] = {}
+    for copy in copies:
+        if copy['State'] == PENDING:
+            pending.setdefault(copy['Region'], []).append(copy['ImageId'])
+
+    def describe(region: str):
+        return region, describe_copy_states(get_client('ec2', region), pending[region])
+
+    with _pool(len(pending), max_workers) as executor:
+        states = dict(executor.map(describe, sorted(pending)))
+    now = polling.clock()
+    updated = []
+    for copy in copies:
+        copy = dict(copy)
+        state = states.get(copy['Region'], {}).get(copy['ImageId'])
+        if copy['State'] == PENDING and state == AVAILABLE:
+            copy.update(State=AVAILABLE, CompletedAt=now, CopySeconds=int(now - copy['StartedAt']))
+            logger.info(f"Copy {copy['ImageId']} in {copy['Region']} available after {copy['CopySeconds']}s")
+        elif copy['State'] == PENDING and state in FAILED_IMAGE_STATES:
+            copy.update(State=FAILED, Error=f"Copy {copy['ImageId']} is {state}")
+            logger.error(f"Copy {copy['ImageId']} in {copy['Region']} is {state}")
+        updated.append(copy)
+    return updated
+
+
+def expire_copies(copies: List[Dict], reason: str) -> List[Dict]:
+    """Mark the copies that are still pending as failed, e.g. after the polling deadline."""
+    return [dict(copy, State=FAILED, Error=reason) if copy['State'] == PENDING else copy
+            for copy in copies]
+
+
+def regional_target(autoscaling_client, asg_name: str, copy: Dict) -> Dict:
+    """Build the updateASG event for the group of the same name in the copy's region."""
+    groups = autoscaling_client.describe_auto_scaling_groups(
+        AutoScalingGroupNames=[asg_name]
+    )['AutoScalingGroups']
+    if not groups or 'LaunchTemplate' not in groups[0]:
+        raise ValueError(f"No Auto Scaling group {asg_name} with a launch template in {copy['Region']}")
+    return {
+        'Region': copy['Region'],
+        'ImageId': copy['ImageId'],
+        'AutoScalingGroupName': asg_name,
+        'LaunchTemplateName': groups[0]['LaunchTemplate']['LaunchTemplateName'],
+        'LaunchTemplateId': groups[0]['LaunchTemplate']['LaunchTemplateId']
+    }
+
+
+def distribution_report(copies: List[Dict], rollout: Dict) -> Dict:
+    """Merge the copy records with the regional update results, one entry per region."""
+    updates = {result['Name']: result for result in rollout['Results']}
+    regions = []
+    for copy in copies:
+        entry = {key: copy.get(key) for key in ('Region', 'ImageId', 'StartedAt', 'CompletedAt', 'CopySeconds')}
+        update = updates.get(copy['Region'])
+        if copy['State'] != AVAILABLE:
+            entry.update(Status='CopyFailed', Error=copy.get('Error'))
+        elif update is None or update['Status'] != 'Succeeded':
+            entry.update(Status='UpdateFailed', Error=update and update['Error'])
+        else:
+            entry.update(Status='Updated', UpdatedAt=update['Output']['UpdatedAt'],
+                         TotalSeconds=int(update['Output']['UpdatedAt'] - copy['StartedAt']))
+        regions.append(entry)
+    return {
+        'Regions': regions,
+        'UpdatedCount': sum(entry['Status'] == 'Updated' for entry in regions),
+        'FailedCount': sum(entry['Status'] != 'Updated' for entry in regions)
+    }
@@ -0,0 +1,112 @@
+import os
+import json
+import threading
+import logging
+import boto3
+from botocore.config import Config
+from instrumentation import instrument_client
+from rate_limiter import TokenBucket, attach_rate_limiter
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Clients are built once per container and reused by every warm invocation,
+# so endpoint resolution and the TLS handshake are only paid on cold start.
+CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '20')),
+    tcp_keepalive=True,
+    connect_timeout=int(os.environ.get('AWS_CONNECT_TIMEOUT', '5')),
+    read_timeout=int(os.environ.get('AWS_READ_TIMEOUT', '60'))
+)
+
+# Central retry policy. Adaptive mode retries throttling errors with backoff and
+# slows the client down after throttles; the token buckets below cap the request
+# rate of a whole container so its threads do not trigger throttling to begin with.
+RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '5'))
+# Per-service max attempts (first call included), e.g. {"ec2": 10}
+SERVICE_MAX_ATTEMPTS = json.loads(
+    os.environ.get('AWS_SERVICE_MAX_ATTEMPTS', '{"ec2": 10, "autoscaling": 10}')
+)
+# Client-side requests per second per service and region; 0 disables the bucket
+CLIENT_RATE_LIMITS = json.loads(
+    os.environ.get('AWS_CLIENT_RATE_LIMITS', '{"ec2": 20, "autoscaling": 10}')
+)
+
+_session = None
+_clients = {}
+_rate_limiters = {}
+# botocore sessions are not thread safe when creating clients
+_lock = threading.RLock()
+
+
+def get_session() -> boto3.session.Session:
+    """Return the boto3 session shared by every client in this container."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def client_config(service_name: str) -> Config:
+    """Return the pooled client config with the retry policy for the service."""
+    return CLIENT_CONFIG.merge(Config(retries={
+        'mode': RETRY_MODE,
+        # botocore's max_attempts counts retries only; total_max_attempts includes the first call
+        'total_max_attempts': int(SERVICE_MAX_ATTEMPTS.get(service_name, DEFAULT_MAX_ATTEMPTS))
+    }))
+
+
+def get_rate_limiter(service_name: str, region_name: str = None) -> TokenBucket:
+    """Return the token bucket shared by every client of the service and region, if any."""
+    region = region_name or get_session().region_name
+    return _rate_limiters.get((service_name, region))
+
+
+def set_rate_limit(service_name: str, rate: float, region_name: str = None) -> TokenBucket:
+    """Change (or start) client-side rate limiting for a service and region."""
+    client = get_client(service_name, region_name)
+    region = region_name or get_session().region_name
+    with _lock:
+        bucket = _rate_limiters.get((service_name, region))
+        if bucket is None:
+            bucket = _rate_limiters[(service_name, region)] = TokenBucket(rate)
+            attach_rate_limiter(client, bucket)
+        else:
+            bucket.rate = rate
+            bucket.capacity = max(1.0, rate)
+    return bucket
+
+
+def get_client(service_name: str, region_name: str = None):
+    """Return a cached client for the service and region, creating it on first use."""
+    region = region_name or get_session().region_name
+    key = (service_name, region)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                logger.info(f"Creating {service_name} client for region {region}")
+                client = get_session().client(
+                    service_name, region_name=region, config=client_config(service_name)
+                )
+                instrument_client(client)
+                rate = float(CLIENT_RATE_LIMITS.get(service_name, 0))
+                if rate > 0:
+                    _rate_limiters[key] = TokenBucket(rate)
+                    attach_rate_limiter(client, _rate_limiters[key])
+                _clients[key] = client
+    return client
+
+
+def reset_clients() -> None:
+    """Drop the cached session and clients, e.g. after a credential change."""
+    global _session
+    with _lock:
+        _clients.clear()
+        _rate_limiters.clear()
+        _session = None
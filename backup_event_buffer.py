@@ -0,0 +1,209 @@
+import os
+import re
+import time
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# A bake starts once an ASG has had no new backup completion for the window,
+# or at the latest max wait after its first buffered completion
+DEFAULT_WINDOW_SECONDS = int(os.environ.get('COALESCE_WINDOW_SECONDS', '300'))
+DEFAULT_MAX_WAIT_SECONDS = int(os.environ.get('COALESCE_MAX_WAIT_SECONDS', '1800'))
+DEFAULT_BUFFER_TTL_SECONDS = 7 * 24 * 3600
+# Step Functions execution names: at most 80 characters of [A-Za-z0-9_-]
+_NAME_UNSAFE = re.compile(r'[^A-Za-z0-9_-]')
+
+# Wall clock used for the windows; replaced by a virtual clock in simulations
+clock = time.time
+
+
+def parse_backup_event(event: Dict) -> Optional[Dict]:
+    """Return the job of a completed EC2 'Backup Job State Change' event, else None."""
+    if event.get('detail-type') != 'Backup Job State Change':
+        return None
+    detail = event.get('detail', {})
+    if detail.get('state') != 'COMPLETED' or detail.get('resourceType') != 'EC2':
+        return None
+    return {
+        'BackupJobId': detail['backupJobId'],
+        'InstanceId': detail['resourceArn'].split('/')[-1],
+        'CreationDate': detail.get('creationDate') or event.get('time')
+    }
+
+
+def execution_name(asg_name: str, backup_job_id: str) -> str:
+    """Deterministic execution name, so a repeated flush cannot start a second bake."""
+    return f"{_NAME_UNSAFE.sub('-', asg_name)[:40]}-{_NAME_UNSAFE.sub('-', backup_job_id)}"[:80]
+
+
+class DynamoDBEventBuffer:
+    """Newest pending backup job per ASG in a table keyed by 'AutoScalingGroupName'.
+
+    'LastReceivedAt' moves with every event while 'FirstReceivedAt' is kept
+    from the first one, which bounds how long a steady stream can hold a bake
+    back; 'ExpiresAt' is for DynamoDB TTL.
+    """
+
+    def __init__(self, table_name: str, dynamodb_client=None):
+        self.table_name = table_name
+        self.dynamodb = dynamodb_client or get_client('dynamodb')
+
+    def put_newest(self, asg_name: str, job: Dict, now: float) -> bool:
+        """Buffer the job unless a newer recovery point is already buffered."""
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={'AutoScalingGroupName': {'S': asg_name}},
+                UpdateExpression='SET BackupJobId = :job, CreationDate = :created, '
+                                 'LastReceivedAt = :now, '
+                                 'FirstReceivedAt = if_not_exists(FirstReceivedAt, :now), '
+                                 'ExpiresAt = :expires ADD EventCount :one',
+                ConditionExpression='attribute_not_exists(CreationDate) OR CreationDate < :created',
+                ExpressionAttributeValues={
+                    ':job': {'S': job['BackupJobId']},
+                    ':created': {'S': job['CreationDate']},
+                    ':now': {'N': str(now)},
+                    ':expires': {'N': str(int(now) + DEFAULT_BUFFER_TTL_SECONDS)},
+                    ':one': {'N': '1'}
+                }
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def due(self, quiet_since: float, first_before: float) -> List[Dict]:
+        """Return the jobs of ASGs quiet since quiet_since or first buffered before first_before."""
+        items = []
+        paginator = self.dynamodb.get_paginator('scan')
+        for page in paginator.paginate(
+            TableName=self.table_name,
+            FilterExpression='LastReceivedAt <= :quiet OR FirstReceivedAt <= :first',
+            ExpressionAttributeValues={':quiet': {'N': str(quiet_since)},
+                                       ':first': {'N': str(first_before)}},
+            ConsistentRead=True
+        ):
+            for item in page['Items']:
+                items.append({
+                    'AutoScalingGroupName': item['AutoScalingGroupName']['S'],
+                    'BackupJobId': item['BackupJobId']['S'],
+                    'CreationDate': item['CreationDate']['S'],
+                    'EventCount': int(item.get('EventCount', {}).get('N', '1'))
+                })
+        return items
+
+    def remove(self, asg_name: str, backup_job_id: str) -> bool:
+        """Remove the entry if it still holds backup_job_id; False if a newer job replaced it."""
+        try:
+            self.dynamodb.delete_item(
+                TableName=self.table_name,
+                Key={'AutoScalingGroupName': {'S': asg_name}},
+                ConditionExpression='BackupJobId = :job',
+                ExpressionAttributeValues={':job': {'S': backup_job_id}}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+
+class InMemoryEventBuffer:
+    """Process-local buffer for running the coalescer locally."""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def put_newest(self, asg_name: str, job: Dict, now: float) -> bool:
+        with self._lock:
+            entry = self.entries.get(asg_name)
+            if entry and entry['CreationDate'] >= job['CreationDate']:
+                return False
+            self.entries[asg_name] = {
+                'AutoScalingGroupName': asg_name,
+                'BackupJobId': job['BackupJobId'],
+                'CreationDate': job['CreationDate'],
+                'FirstReceivedAt': entry['FirstReceivedAt'] if entry else now,
+                'LastReceivedAt': now,
+                'EventCount': (entry['EventCount'] if entry else 0) + 1
+            }
+            return True
+
+    def due(self, quiet_since: float, first_before: float) -> List[Dict]:
+        with self._lock:
+            return [dict(entry) for entry in self.entries.values()
+                    if entry['LastReceivedAt'] <= quiet_since or entry['FirstReceivedAt'] <= first_before]
+
+    def remove(self, asg_name: str, backup_job_id: str) -> bool:
+        with self._lock:
+            entry = self.entries.get(asg_name)
+            if entry is None or entry['BackupJobId'] != backup_job_id:
+                return False
+            del self.entries[asg_name]
+            return True
+
+
+_buffer = None
+
+
+def get_event_buffer():
+    """Return the configured buffer, the DynamoDB table named by COALESCE_BUFFER_TABLE.
+
+    A process-local buffer would lose events across Lambda containers, so it is
+    only used when installed explicitly with set_event_buffer.
+    """
+    global _buffer
+    if _buffer is None:
+        table_name = os.environ.get('COALESCE_BUFFER_TABLE')
+        if not table_name:
+            raise RuntimeError("COALESCE_BUFFER_TABLE is not set; the event buffer needs a DynamoDB table")
+        _buffer = DynamoDBEventBuffer(table_name)
+    return _buffer
+
+
+def set_event_buffer(buffer) -> None:
+    """Replace the configured buffer, e.g. with an InMemoryEventBuffer locally."""
+    global _buffer
+    _buffer = buffer
+
+
+def buffer_job(buffer, asg_name: str, job: Dict, now: float = None) -> bool:
+    """Buffer a completed backup job for its ASG; False if a newer one is already held."""
+    return buffer.put_newest(asg_name, job, clock() if now is None else now)
+
+
+def flush_due(buffer, start_bake: Callable[[str, str], str],
+              window_seconds: float = DEFAULT_WINDOW_SECONDS,
+              max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS, now: float = None) -> List[Dict]:
+    """Start one bake per ASG whose window has closed and drop it from the buffer.
+
+    The bake is started before the entry is removed, so a crash in between
+    only repeats the start; the deterministic execution name makes start_bake
+    return the existing execution instead of a second one. An ASG whose start
+    fails stays buffered for the next flush and is returned with its Error,
+    without holding back the other ASGs.
+    """
+    now = clock() if now is None else now
+    started = []
+    for entry in buffer.due(now - window_seconds, now - max_wait_seconds):
+        asg_name, backup_job_id = entry['AutoScalingGroupName'], entry['BackupJobId']
+        try:
+            execution_arn = start_bake(asg_name, backup_job_id)
+        except Exception as e:
+            logger.error(f"Could not start bake for {asg_name}, keeping it buffered: {str(e)}")
+            started.append(dict(entry, Error=str(e)))
+            continue
+        if not buffer.remove(asg_name, backup_job_id):
+            logger.info(f"A newer backup job arrived for {asg_name}, it will be flushed next time")
+        logger.info(f"Started bake {execution_arn} for {asg_name} with backup job {backup_job_id}, "
+                    f"coalescing {entry['EventCount']} events")
+        started.append(dict(entry, ExecutionArn=execution_arn))
+    return started
@@ -0,0 +1,252 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from botocore.exceptions import BotoCoreError, ClientError
+import metadata_cache
+from image_acceleration import acceleration_config
+from instance_refresh import instance_refresh_config
+from ami_distribution import distribution_config
+from builder_launch import builder_launch_config
+from capacity_guard import NONE, PIN_MAX, apply_capacity_mode
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ASG_NAME_TAG = 'aws:autoscaling:groupName'
+# DescribeInstances has no hard ID limit, but very large filters slow the call down
+INSTANCE_BATCH_SIZE = 500
+# DescribeAutoScalingGroups accepts at most 50 group names per call
+ASG_BATCH_SIZE = 50
+# DescribeAutoScalingInstances accepts at most 50 instance IDs per call
+AUTO_SCALING_INSTANCE_BATCH_SIZE = 50
+BACKUP_JOB_WORKERS = 10
+
+
+def chunked(items: List, size: int) -> List[List]:
+    """Split items into consecutive lists of at most size elements."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def describe_backup_job(backup_client, backup_job_id: str) -> Tuple[str, str]:
+    """Return the recovery point AMI ID and source instance ID of a backup job."""
+    response = backup_client.describe_backup_job(BackupJobId=backup_job_id)
+    ami_id = response['RecoveryPointArn'].split('/')[-1]
+    instance_id = response['ResourceArn'].split('/')[-1]
+    return ami_id, instance_id
+
+
+def get_asg_name_from_tags(instance: Dict) -> str:
+    """Return the Auto Scaling group name tag of an instance, if any."""
+    for tag in instance.get('Tags', []):
+        if tag['Key'] == ASG_NAME_TAG:
+            return tag['Value']
+    return None
+
+
+def describe_instances_bulk(ec2_client, instance_ids: List[str]) -> Dict[str, Dict]:
+    """Describe many instances with as few calls as possible, keyed by instance ID.
+
+    A chunk that fails (e.g. because one ID no longer exists) is retried one ID at a
+    time so a single bad instance does not hide the others. Missing IDs are absent
+    from the result.
+    """
+    instances = {}
+    paginator = ec2_client.get_paginator('describe_instances')
+    for chunk in chunked(sorted(set(instance_ids)), INSTANCE_BATCH_SIZE):
+        try:
+            for page in paginator.paginate(InstanceIds=chunk):
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        instances[instance['InstanceId']] = instance
+        except ClientError as e:
+            if len(chunk) == 1:
+                logger.warning(f"Could not describe instance {chunk[0]}: {str(e)}")
+                continue
+            logger.warning(f"Bulk describe_instances failed, retrying individually: {str(e)}")
+            instances.update(describe_instances_bulk_individually(ec2_client, chunk))
+    return instances
+
+
+def describe_instances_bulk_individually(ec2_client, instance_ids: List[str]) -> Dict[str, Dict]:
+    """Describe instances one at a time, skipping those that cannot be described."""
+    instances = {}
+    for instance_id in instance_ids:
+        try:
+            response = ec2_client.describe_instances(InstanceIds=[instance_id])
+            for reservation in response['Reservations']:
+                for instance in reservation['Instances']:
+                    instances[instance['InstanceId']] = instance
+        except ClientError as e:
+            logger.warning(f"Could not describe instance {instance_id}: {str(e)}")
+    return instances
+
+
+def describe_auto_scaling_instances_bulk(asg_client, instance_ids: List[str]) -> Dict[str, Dict]:
+    """Return the Auto Scaling group membership of many instances, 50 per call.
+
+    Each entry carries the group name, instance type and launch template in a
+    far smaller response than describe_instances. Instances outside any group
+    are absent from the result.
+    """
+    members = {}
+    paginator = asg_client.get_paginator('describe_auto_scaling_instances')
+    for chunk in chunked(sorted(set(instance_ids)), AUTO_SCALING_INSTANCE_BATCH_SIZE):
+        for page in paginator.paginate(InstanceIds=chunk):
+            for member in page['AutoScalingInstances']:
+                members[member['InstanceId']] = member
+    return members
+
+
+def _index_entry(instance_id: str, asg_name: str, instance_type: str, launch_template: Dict = None) -> Dict:
+    entry = {'InstanceId': instance_id, 'AutoScalingGroupName': asg_name, 'InstanceType': instance_type}
+    if launch_template:
+        entry['LaunchTemplate'] = launch_template
+    return entry
+
+
+def index_instances(ec2_client, asg_client, instance_ids: List[str]) -> Dict[str, Dict]:
+    """Map instance IDs to their Auto Scaling group, instance type and launch template.
+
+    Membership comes from describe_auto_scaling_instances. Only the instances
+    it does not list (e.g. detached or already terminated ones) are described
+    with describe_instances and resolved by their group name tag. Instances
+    neither call finds are absent; AutoScalingGroupName is None for instances
+    outside any group.
+    """
+    index = {}
+    try:
+        members = describe_auto_scaling_instances_bulk(asg_client, instance_ids)
+    except ClientError as e:
+        logger.warning(f"describe_auto_scaling_instances failed, falling back to instance tags: {str(e)}")
+        members = {}
+    for instance_id, member in members.items():
+        index[instance_id] = _index_entry(instance_id, member['AutoScalingGroupName'],
+                                          member['InstanceType'], member.get('LaunchTemplate'))
+
+    missing = sorted(set(instance_ids) - set(index))
+    if missing:
+        logger.info(f"{len(missing)} instances are not Auto Scaling instances, checking their tags")
+        for instance_id, instance in describe_instances_bulk(ec2_client, missing).items():
+            index[instance_id] = _index_entry(instance_id, get_asg_name_from_tags(instance),
+                                              instance['InstanceType'], instance.get('LaunchTemplate'))
+    return index
+
+
+def describe_auto_scaling_groups_bulk(asg_client, asg_names: List[str]) -> Dict[str, Dict]:
+    """Describe Auto Scaling groups 50 names per call, keyed by group name.
+
+    Every group returned is also stored in the shared metadata cache.
+    """
+    groups = {}
+    paginator = asg_client.get_paginator('describe_auto_scaling_groups')
+    for chunk in chunked(sorted(set(asg_names)), ASG_BATCH_SIZE):
+        for page in paginator.paginate(AutoScalingGroupNames=chunk):
+            for group in page['AutoScalingGroups']:
+                groups[group['AutoScalingGroupName']] = group
+                metadata_cache.put_auto_scaling_group(group)
+    return groups
+
+
+def get_launch_template(instance: Dict, asg_group: Dict = None) -> Tuple[str, str]:
+    """Return the launch template name and ID the ASG launches from.
+
+    Falls back to the instance's own launch template, e.g. for groups with a
+    mixed instances policy. The group comes first because an instance keeps
+    the template it was launched from after the group has moved to another.
+    """
+    if asg_group and 'LaunchTemplate' in asg_group:
+        return (asg_group['LaunchTemplate']['LaunchTemplateName'],
+                asg_group['LaunchTemplate']['LaunchTemplateId'])
+    if 'LaunchTemplate' in instance:
+        return (instance['LaunchTemplate']['LaunchTemplateName'],
+                instance['LaunchTemplate']['LaunchTemplateId'])
+    return None, None
+
+
+def resolve_backup_jobs(backup_client, ec2_client, asg_client, backup_job_ids: List[str],
+                        mode: str = PIN_MAX) -> List[Dict]:
+    """Resolve many backup jobs to their ASG and launch template with bulk API calls.
+
+    Returns one record per backup job, in input order. Records carry the same
+    fields as the single-job handler plus 'BackupJobId'; a job that cannot be
+    resolved gets an 'Error' field instead and does not fail the batch.
+    """
+    records = {job_id: {'BackupJobId': job_id} for job_id in backup_job_ids}
+
+    # DescribeBackupJob has no bulk form, so fan the calls out over a small pool.
+    # A job without a recovery point or resource ARN, or whose call hit a
+    # connection error or read timeout, fails on its own too
+    def describe(job_id):
+        try:
+            return job_id, describe_backup_job(backup_client, job_id), None
+        except (ClientError, BotoCoreError) as e:
+            return job_id, None, str(e)
+        except KeyError as e:
+            return job_id, None, f"Backup job has no {e.args[0]}"
+
+    with ThreadPoolExecutor(max_workers=BACKUP_JOB_WORKERS) as executor:
+        for job_id, details, error in executor.map(describe, list(records)):
+            if error:
+                logger.error(f"Error describing backup job {job_id}: {error}")
+                records[job_id]['Error'] = error
+            else:
+                records[job_id]['BackupAMIId'], records[job_id]['InstanceId'] = details
+
+    pending = [r for r in records.values() if 'Error' not in r]
+    instances = index_instances(ec2_client, asg_client, [r['InstanceId'] for r in pending])
+
+    for record in pending:
+        instance = instances.get(record['InstanceId'])
+        if instance is None:
+            record['Error'] = f"Instance {record['InstanceId']} not found"
+            continue
+        record['AutoScalingGroupName'] = instance['AutoScalingGroupName']
+        record['InstanceType'] = instance['InstanceType']
+        if record['AutoScalingGroupName'] is None:
+            record['Error'] = f"Instance {record['InstanceId']} is not part of an Auto Scaling group"
+
+    pending = [r for r in pending if 'Error' not in r]
+    # The group tags carry the acceleration and refresh settings, so every group is looked up
+    needs_group = [r['AutoScalingGroupName'] for r in pending]
+    groups = {}
+    if needs_group:
+        try:
+            groups = describe_auto_scaling_groups_bulk(asg_client, needs_group)
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Error describing Auto Scaling groups: {str(e)}")
+            for record in pending:
+                record['Error'] = str(e)
+            pending = []
+
+    capacity_states = {}
+    for record in pending:
+        asg_name = record['AutoScalingGroupName']
+        asg_group = groups.get(asg_name)
+        record['LaunchTemplateName'], record['LaunchTemplateId'] = get_launch_template(
+            instances[record['InstanceId']], asg_group
+        )
+        record['Acceleration'] = acceleration_config(asg_group or {})
+        record['InstanceRefresh'] = instance_refresh_config(asg_group or {})
+        record['Distribution'] = distribution_config(asg_group or {})
+        record['BuilderLaunch'] = builder_launch_config(asg_group or {}, record['InstanceType'])
+        record['CapacityMode'] = mode
+        record['OriginalMaxCapacity'] = None
+        if mode == NONE:
+            continue
+        if asg_group is None:
+            record['Error'] = f"Auto Scaling group {asg_name} not found"
+            continue
+        # Several jobs can belong to the same group; apply the mode only once
+        if asg_name not in capacity_states:
+            try:
+                capacity_states[asg_name] = apply_capacity_mode(asg_client, asg_group, mode)
+            except (ClientError, BotoCoreError) as e:
+                logger.error(f"Error applying capacity mode {mode} to ASG {asg_name}: {str(e)}")
+                capacity_states[asg_name] = e
+        if isinstance(capacity_states[asg_name], Exception):
+            record['Error'] = str(capacity_states[asg_name])
+        elif mode == PIN_MAX:
+            record['OriginalMaxCapacity'] = capacity_states[asg_name]['MaxSize']
+
+    return [records[job_id] for job_id in backup_job_ids]
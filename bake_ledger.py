@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import sqlite3
+import datetime
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Pipeline stages in order; a bake resumes after the last one recorded
+RESOLVED = 'RESOLVED'
+LAUNCHED = 'LAUNCHED'
+SYSPREP_STARTED = 'SYSPREP_STARTED'
+SYSPREPPED = 'SYSPREPPED'
+AMI_CREATED = 'AMI_CREATED'
+ASG_UPDATED = 'ASG_UPDATED'
+STAGES = [RESOLVED, LAUNCHED, SYSPREP_STARTED, SYSPREPPED, AMI_CREATED, ASG_UPDATED]
+COMPLETE = ASG_UPDATED
+# Attributes recorded by later stages and handed back to a resumed execution
+PROGRESS_ATTRIBUTES = ['BuilderInstanceId', 'SysprepCommandId', 'ImageId']
+DEFAULT_TTL_DAYS = int(os.environ.get('BAKE_LEDGER_TTL_DAYS', '90'))
+
+
+class BakeInProgressError(Exception):
+    """Another execution that is still running owns the bake."""
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def stage_index(stage: str) -> int:
+    return STAGES.index(stage)
+
+
+class DynamoDBBakeLedger:
+    """Bakes in a DynamoDB table with a 'BakeKey' string partition key.
+
+    The resolved ASG and launch template details are stored as a JSON string in
+    'Resolved'; items carry an 'ExpiresAt' epoch attribute for DynamoDB TTL.
+    """
+
+    def __init__(self, table_name: str, dynamodb_client=None, ttl_days: int = DEFAULT_TTL_DAYS):
+        self.table_name = table_name
+        self.dynamodb = dynamodb_client or get_client('dynamodb')
+        self.ttl_days = ttl_days
+
+    def _key(self, bake_key: str) -> Dict:
+        return {'BakeKey': {'S': bake_key}}
+
+    def get(self, bake_key: str) -> Optional[Dict]:
+        item = self.dynamodb.get_item(
+            TableName=self.table_name, Key=self._key(bake_key), ConsistentRead=True
+        ).get('Item')
+        if not item:
+            return None
+        record = {name: int(value['N']) if 'N' in value else value['S'] for name, value in item.items()}
+        record['Resolved'] = json.loads(record.get('Resolved', '{}'))
+        return record
+
+    def create(self, bake_key: str, execution_id: str, resolved: Dict) -> bool:
+        """Store a new bake at RESOLVED; False if the key already exists."""
+        try:
+            self.dynamodb.put_item(
+                TableName=self.table_name,
+                Item={
+                    'BakeKey': {'S': bake_key},
+                    'Stage': {'S': RESOLVED},
+                    'StageIndex': {'N': '0'},
+                    'ExecutionId': {'S': execution_id or ''},
+                    'Resolved': {'S': json.dumps(resolved)},
+                    'UpdatedAt': {'S': _now_iso()},
+                    'ExpiresAt': {'N': str(int(time.time()) + self.ttl_days * 86400)}
+                },
+                ConditionExpression='attribute_not_exists(BakeKey)'
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def claim(self, bake_key: str, execution_id: str, previous_owner: str) -> bool:
+        """Hand the bake to execution_id; False if someone else took it first."""
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key=self._key(bake_key),
+                UpdateExpression='SET ExecutionId = :owner, UpdatedAt = :now',
+                ConditionExpression='ExecutionId = :previous',
+                ExpressionAttributeValues={
+                    ':owner': {'S': execution_id or ''},
+                    ':previous': {'S': previous_owner or ''},
+                    ':now': {'S': _now_iso()}
+                }
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def record_stage(self, bake_key: str, stage: str, attributes: Dict[str, str] = None) -> bool:
+        """Move the bake forward to stage; False if it was already at or past it."""
+        values = dict(attributes or {}, Stage=stage, UpdatedAt=_now_iso())
+        expression_values = {f":{name}": {'S': str(value)} for name, value in values.items()}
+        expression_values[':StageIndex'] = {'N': str(stage_index(stage))}
+        assignments = ', '.join(f"{name} = :{name}" for name in list(values) + ['StageIndex'])
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key=self._key(bake_key),
+                UpdateExpression=f"SET {assignments}",
+                ConditionExpression='attribute_exists(BakeKey) AND StageIndex < :StageIndex',
+                ExpressionAttributeValues=expression_values
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+
+class SQLiteBakeLedger:
+    """Local stand-in for the DynamoDB ledger, backed by a SQLite file (or memory)."""
+
+    def __init__(self, path: str = ':memory:'):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS bakes (bake_key TEXT PRIMARY KEY, record TEXT NOT NULL)'
+        )
+        self.connection.commit()
+        self._lock = threading.Lock()
+
+    def get(self, bake_key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT record FROM bakes WHERE bake_key = ?', (bake_key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, record: Dict) -> None:
+        self.connection.execute(
+            'INSERT OR REPLACE INTO bakes (bake_key, record) VALUES (?, ?)',
+            (record['BakeKey'], json.dumps(record))
+        )
+        self.connection.commit()
+
+    def create(self, bake_key: str, execution_id: str, resolved: Dict) -> bool:
+        record = {'BakeKey': bake_key, 'Stage': RESOLVED, 'StageIndex': 0,
+                  'ExecutionId': execution_id or '', 'Resolved': resolved, 'UpdatedAt': _now_iso()}
+        with self._lock:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO bakes (bake_key, record) VALUES (?, ?)',
+                (bake_key, json.dumps(record))
+            )
+            self.connection.commit()
+            return cursor.rowcount == 1
+
+    def _update(self, bake_key: str, condition: Callable[[Dict], bool], changes: Dict) -> bool:
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT record FROM bakes WHERE bake_key = ?', (bake_key,)
+            ).fetchone()
+            if row is None or not condition(json.loads(row[0])):
+                return False
+            record = dict(json.loads(row[0]), **changes, UpdatedAt=_now_iso())
+            self._put(record)
+            return True
+
+    def claim(self, bake_key: str, execution_id: str, previous_owner: str) -> bool:
+        return self._update(bake_key, lambda record: record['ExecutionId'] == (previous_owner or ''),
+                            {'ExecutionId': execution_id or ''})
+
+    def record_stage(self, bake_key: str, stage: str, attributes: Dict[str, str] = None) -> bool:
+        index = stage_index(stage)
+        return self._update(bake_key, lambda record: record['StageIndex'] < index,
+                            dict(attributes or {}, Stage=stage, StageIndex=index))
+
+
+_ledger = None
+_configured = False
+
+
+def get_bake_ledger():
+    """Return the configured ledger: DynamoDB when BAKE_LEDGER_TABLE is set, SQLite
+    when BAKE_LEDGER_PATH is set, otherwise None (bakes are not tracked)."""
+    global _ledger, _configured
+    if not _configured:
+        table_name = os.environ.get('BAKE_LEDGER_TABLE')
+        path = os.environ.get('BAKE_LEDGER_PATH')
+        if table_name:
+            _ledger = DynamoDBBakeLedger(table_name)
+        elif path:
+            _ledger = SQLiteBakeLedger(path)
+        _configured = True
+    return _ledger
+
+
+def set_bake_ledger(ledger) -> None:
+    """Replace the configured ledger, e.g. with a SQLiteBakeLedger locally."""
+    global _ledger, _configured
+    _ledger, _configured = ledger, True
+
+
+def begin_bake(ledger, bake_key: str, execution_id: str, resolve: Callable[[], Dict],
+               is_running: Callable[[str], bool],
+               prepare: Callable[[Dict], Dict] = None) -> Dict:
+    """Return the ledger record for a bake, creating or taking it over as needed.
+
+    resolve() is only called for a bake the ledger has never seen and must not
+    change anything. A completed bake is returned as is; an unfinished one is
+    handed to this execution unless the execution that owns it is still running.
+    Only once this execution owns the bake does prepare(resolved) apply the side
+    effects (e.g. the capacity mode); its result replaces record['Resolved'].
+    It runs again on every takeover, so it must be safe to repeat.
+    """
+    record = ledger.get(bake_key)
+    if record is None:
+        if ledger.create(bake_key, execution_id, resolve()):
+            logger.info(f"Started bake {bake_key}")
+            return _prepared(ledger.get(bake_key), prepare)
+        # Another execution created it between our read and write
+        record = ledger.get(bake_key)
+
+    if record['Stage'] == COMPLETE:
+        logger.info(f"Bake {bake_key} already completed with image {record.get('ImageId')}")
+        return record
+    owner = record.get('ExecutionId')
+    if owner != (execution_id or ''):
+        if owner and is_running(owner):
+            raise BakeInProgressError(f"Bake {bake_key} is in progress in execution {owner}")
+        if not ledger.claim(bake_key, execution_id, owner):
+            raise BakeInProgressError(f"Bake {bake_key} was claimed by another execution")
+        record['ExecutionId'] = execution_id or ''
+    logger.info(f"Resuming bake {bake_key} after stage {record['Stage']}")
+    return _prepared(record, prepare)
+
+
+def _prepared(record: Dict, prepare: Callable[[Dict], Dict] = None) -> Dict:
+    if prepare is not None:
+        record['Resolved'] = prepare(record['Resolved'])
+    return record
+
+
+def bake_output(record: Dict, ledger_enabled: bool = True) -> Dict[str, Any]:
+    """Flatten a ledger record into the get-asg-and-launch-template output.
+
+    BakeLedger tells the state machine whether to run its Record* states.
+    """
+    output = dict(record['Resolved'], BakeKey=record['BakeKey'], BakeStage=record['Stage'],
+                  BakeLedger=ledger_enabled)
+    for name in PROGRESS_ATTRIBUTES:
+        if record.get(name):
+            output[name] = record[name]
+    return output
@@ -0,0 +1,89 @@
+import importlib.util
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Benchmarks never talk to AWS; every client is stubbed. Fake credentials
+# keep botocore from searching the environment for real ones.
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+# Keep EMF metric lines out of benchmark reports unless a benchmark asks for them
+os.environ.setdefault('API_METRICS_ENABLED', 'false')
+# Stubbed calls cost nothing, so do not rate limit them unless a benchmark asks to
+os.environ.setdefault('AWS_CLIENT_RATE_LIMITS', '{}')
+
+
+def load_handler(filename: str):
+    """Import a handler file such as 'check-instance-state_v1.py' as a module."""
+    module_name = os.path.splitext(filename)[0].replace('-', '_')
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(REPO_ROOT, filename)
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(fn, iterations: int) -> list:
+    """Call fn repeatedly and return the latency of each call in milliseconds."""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(label: str, latencies: list) -> str:
+    """Format p50/p95/mean latency for a benchmark report line."""
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    return (f"{label:<40} n={len(ordered):<5} p50={statistics.median(ordered):8.3f}ms "
+            f"p95={p95:8.3f}ms mean={statistics.mean(ordered):8.3f}ms")
+
+
+class StubbedClients:
+    """Activate botocore Stubbers on the shared pooled clients and count API calls.
+
+    Every call is tallied per operation, so scenarios can assert exact call counts;
+    the stubbers themselves fail on any call that was not queued.
+    """
+
+    def __init__(self, *service_names: str):
+        import aws_clients
+        from botocore.stub import Stubber
+        aws_clients.reset_clients()
+        self.calls = {}
+        self.stubbers = {}
+        for service_name in service_names:
+            client = aws_clients.get_client(service_name)
+            client.meta.events.register('before-parameter-build.*.*', self._count)
+            self.stubbers[service_name] = Stubber(client)
+            self.stubbers[service_name].activate()
+
+    def _count(self, model, **kwargs):
+        self.calls[model.name] = self.calls.get(model.name, 0) + 1
+
+    def add(self, service_name: str, operation: str, response: dict, params: dict = None):
+        self.stubbers[service_name].add_response(operation, response, params)
+
+    def add_error(self, service_name: str, operation: str, code: str, status: int = 400):
+        self.stubbers[service_name].add_client_error(
+            operation, service_error_code=code, http_status_code=status
+        )
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def assert_done(self):
+        for stubber in self.stubbers.values():
+            stubber.assert_no_pending_responses()
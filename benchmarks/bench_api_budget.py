@@ -0,0 +1,374 @@
+"""AWS API call budget per handler, checked against benchmarks/api_budget.json.
+
+Every handler runs against an in-memory account that pages its responses the
+way the real APIs do, so call counts follow the fixture size. For each
+scenario the report lists the calls per operation, the bytes returned
+(JSON-encoded responses) and the handler latency. The run exits non-zero when
+any operation makes more calls than its budget, or when an operation without
+a budget shows up.
+
+Usage: python benchmarks/bench_api_budget.py [--scale] [--repeat N] [--update]
+  --scale   also run the scaling scenarios at every size in SCALING_SIZES
+  --update  write the measured counts as the new budget
+"""
+import os
+import json
+import argparse
+import statistics
+import threading
+import time
+
+import fixtures
+from _support import REPO_ROOT, load_handler
+from bench_pipeline import builder_instance_detail
+
+import bake_ledger
+import metadata_cache
+
+BUDGET_PATH = os.path.join(REPO_ROOT, 'benchmarks', 'api_budget.json')
+BASE_SIZE = 10
+SCALING_SIZES = [1, 10, 100, 1000]
+INSTANCES_PER_ASG = 10
+# Page sizes of the paginated operations when the caller does not set one
+DEFAULT_PAGE_SIZES = {
+    'describe_auto_scaling_groups': 50,
+    'describe_auto_scaling_instances': 50,
+    'describe_launch_template_versions': 200,
+    'describe_instance_status': 1000,
+    'describe_images': 1000,
+    'list_command_invocations': 50,
+}
+
+
+class FakeAccount:
+    """Instances, ASGs, launch templates, AMIs and SSM commands for one fixture size.
+
+    Instance i is backed up by job-i to AMI i and belongs to ASG
+    1 + (i - 1) // INSTANCES_PER_ASG. Every launch template has size versions.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.asg_count = max(1, -(-size // INSTANCES_PER_ASG))
+        self.version_count = max(size, 1)
+        self.commands = {}
+        self.calls = {}
+        self.bytes = {}
+        self.lock = threading.Lock()
+        self.instance_detail = {key: value for key, value in builder_instance_detail().items()
+                                if key != 'ResponseMetadata'}
+
+    def get_client(self, service_name, region_name=None):
+        return FakeClient(self)
+
+    def call(self, operation, **params):
+        response = getattr(self, operation)(**params)
+        size = len(json.dumps(response, default=str))
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            self.bytes[operation] = self.bytes.get(operation, 0) + size
+        return response
+
+    @staticmethod
+    def _page(items: list, key: str, params: dict, operation: str, token_key: str = 'NextToken',
+              limit_key: str = 'MaxResults') -> dict:
+        start = int(params.get(token_key) or 0)
+        limit = int(params.get(limit_key) or DEFAULT_PAGE_SIZES[operation])
+        response = {key: items[start:start + limit]}
+        if start + limit < len(items):
+            response[token_key] = str(start + limit)
+        return response
+
+    def asg_of(self, instance_index: int) -> int:
+        return 1 + (instance_index - 1) // INSTANCES_PER_ASG
+
+    @staticmethod
+    def index_of(resource_id: str) -> int:
+        return int(resource_id.split('-')[-1], 16)
+
+    # --- backup / instances ---
+    def describe_backup_job(self, BackupJobId):
+        return fixtures.backup_job(int(BackupJobId.split('-')[-1]))
+
+    def describe_instances(self, InstanceIds=None, Filters=None, **params):
+        if InstanceIds is None:
+            # Discovery of builder instances by tag; the fixture has none
+            return {'Reservations': []}
+        instances = []
+        for instance_id in InstanceIds:
+            instance = fixtures.instance(self.index_of(instance_id), self.asg_of(self.index_of(instance_id)))
+            # Network interfaces, placement and the rest of a real description
+            instance.update(self.instance_detail)
+            instances.append(instance)
+        return fixtures.describe_instances(instances)
+
+    def describe_instance_status(self, InstanceIds=None, IncludeAllInstances=False, **params):
+        return {'InstanceStatuses': [{
+            'InstanceId': instance_id, 'AvailabilityZone': f"{fixtures.REGION}a",
+            'InstanceState': {'Code': 16, 'Name': 'running'},
+            'SystemStatus': {'Status': 'ok', 'Details': [{'Name': 'reachability', 'Status': 'passed'}]},
+            'InstanceStatus': {'Status': 'ok', 'Details': [{'Name': 'reachability', 'Status': 'passed'}]}
+        } for instance_id in InstanceIds]}
+
+    def terminate_instances(self, InstanceIds):
+        return {'TerminatingInstances': [{
+            'InstanceId': instance_id, 'CurrentState': {'Code': 32, 'Name': 'shutting-down'},
+            'PreviousState': {'Code': 16, 'Name': 'running'}} for instance_id in InstanceIds]}
+
+    # --- Auto Scaling ---
+    def describe_auto_scaling_instances(self, InstanceIds, **params):
+        members = [fixtures.auto_scaling_instance(self.index_of(instance_id), self.asg_of(self.index_of(instance_id)))
+                   for instance_id in InstanceIds]
+        return self._page(members, 'AutoScalingInstances', params, 'describe_auto_scaling_instances',
+                          limit_key='MaxRecords')
+
+    def describe_auto_scaling_groups(self, AutoScalingGroupNames=None, **params):
+        indexes = ([int(name.split('-')[-1]) for name in AutoScalingGroupNames]
+                   if AutoScalingGroupNames else range(1, self.asg_count + 1))
+        groups = [fixtures.auto_scaling_group(index) for index in indexes if index <= self.asg_count]
+        return self._page(groups, 'AutoScalingGroups', params, 'describe_auto_scaling_groups',
+                          limit_key='MaxRecords')
+
+    def update_auto_scaling_group(self, **params):
+        return {}
+
+    def create_or_update_tags(self, Tags):
+        return {}
+
+    # --- launch templates ---
+    def describe_launch_templates(self, LaunchTemplateIds):
+        return {'LaunchTemplates': [fixtures.launch_template(self.index_of(template_id),
+                                                             self.version_count, self.version_count)
+                                    for template_id in LaunchTemplateIds]}
+
+    def _version(self, template_index: int, number: int) -> dict:
+        return fixtures.launch_template_version(template_index, number, fixtures.ami_id(0),
+                                                default=number == self.version_count)
+
+    def describe_launch_template_versions(self, LaunchTemplateId=None, LaunchTemplateName=None,
+                                          Versions=None, MaxVersion=None, **params):
+        index = self.index_of(LaunchTemplateId) if LaunchTemplateId else int(LaunchTemplateName.split('-')[-1])
+        if Versions:
+            aliases = {'$Latest': self.version_count, '$Default': self.version_count}
+            numbers = sorted({aliases.get(version) or int(version) for version in Versions})
+            return {'LaunchTemplateVersions': [self._version(index, number) for number in numbers]}
+        last = int(MaxVersion) if MaxVersion else self.version_count
+        versions = [self._version(index, number) for number in range(last, 0, -1)]
+        return self._page(versions, 'LaunchTemplateVersions', params, 'describe_launch_template_versions')
+
+    def create_launch_template_version(self, LaunchTemplateName, SourceVersion, LaunchTemplateData):
+        version = fixtures.launch_template_version(int(LaunchTemplateName.split('-')[-1]),
+                                                   self.version_count + 1, LaunchTemplateData['ImageId'])
+        return {'LaunchTemplateVersion': version}
+
+    def modify_launch_template(self, LaunchTemplateName, DefaultVersion):
+        return {'LaunchTemplate': fixtures.launch_template(int(LaunchTemplateName.split('-')[-1]),
+                                                           int(DefaultVersion), int(DefaultVersion))}
+
+    def delete_launch_template_versions(self, LaunchTemplateId, Versions):
+        return {'SuccessfullyDeletedLaunchTemplateVersions': [
+            {'LaunchTemplateId': LaunchTemplateId, 'VersionNumber': int(version)} for version in Versions],
+            'UnsuccessfullyDeletedLaunchTemplateVersions': []}
+
+    # --- AMIs ---
+    def _image(self, image_id: str) -> dict:
+        return {
+            'ImageId': image_id, 'State': 'available', 'Name': f"backup-{image_id}",
+            'OwnerId': fixtures.ACCOUNT_ID, 'CreationDate': '2024-01-01T00:00:00.000Z',
+            'Architecture': 'x86_64', 'PlatformDetails': 'Windows', 'RootDeviceName': '/dev/sda1',
+            'BlockDeviceMappings': [{'DeviceName': '/dev/sda1', 'Ebs': {
+                'SnapshotId': f"snap-{self.index_of(image_id):017x}", 'VolumeSize': 50,
+                'VolumeType': 'gp3', 'DeleteOnTermination': True}}],
+            'Tags': []
+        }
+
+    def describe_images(self, ImageIds=None, Filters=None, Owners=None, **params):
+        if ImageIds is None and Owners:
+            # Discovery of baked images by tag; the fixture has none
+            return {'Images': []}
+        image_ids = ImageIds or next(f['Values'] for f in Filters if f['Name'] == 'image-id')
+        return {'Images': [self._image(image_id) for image_id in image_ids]}
+
+    def deregister_image(self, ImageId):
+        return {}
+
+    def delete_snapshot(self, SnapshotId):
+        return {}
+
+    # --- SSM ---
+    def send_command(self, InstanceIds, DocumentName, **params):
+        command_id = f"0b2f1c3e-0000-0000-0000-{len(self.commands):012x}"
+        self.commands[command_id] = list(InstanceIds)
+        return {'Command': {'CommandId': command_id, 'DocumentName': DocumentName,
+                            'InstanceIds': InstanceIds, 'Status': 'Pending'}}
+
+    def _invocation(self, command_id: str, instance_id: str) -> dict:
+        return {'CommandId': command_id, 'InstanceId': instance_id, 'Status': 'Success',
+                'DocumentName': 'AWSEC2-RunSysprep', 'StatusDetails': 'Success'}
+
+    def get_command_invocation(self, CommandId, InstanceId):
+        return self._invocation(CommandId, InstanceId)
+
+    def list_command_invocations(self, CommandId, **params):
+        invocations = [self._invocation(CommandId, instance_id) for instance_id in self.commands[CommandId]]
+        return self._page(invocations, 'CommandInvocations', params, 'list_command_invocations')
+
+
+class FakeClient:
+    def __init__(self, account):
+        self.account = account
+
+    def __getattr__(self, operation):
+        return lambda **params: self.account.call(operation, **params)
+
+    def get_paginator(self, operation):
+        return FakePaginator(self.account, operation)
+
+
+class FakePaginator:
+    """Follows NextToken like a botocore paginator, one call per page."""
+
+    def __init__(self, account, operation):
+        self.account = account
+        self.operation = operation
+
+    def paginate(self, PaginationConfig=None, **params):
+        if PaginationConfig and 'PageSize' in PaginationConfig:
+            params['MaxRecords' if self.operation.startswith('describe_auto_scaling')
+                   else 'MaxResults'] = PaginationConfig['PageSize']
+        while True:
+            page = self.account.call(self.operation, **params)
+            yield page
+            if not page.get('NextToken'):
+                return
+            params['NextToken'] = page['NextToken']
+
+
+def instance_ids(size: int) -> list:
+    return [fixtures.instance_id(index) for index in range(1, size + 1)]
+
+
+def seed_sysprep(account: FakeAccount, size: int) -> dict:
+    """Commands as sysprep_v1 sends them, 50 instances each, created outside the budget."""
+    ids = instance_ids(size)
+    command_ids = [account.send_command(InstanceIds=ids[i:i + 50], DocumentName='AWSEC2-RunSysprep')
+                   ['Command']['CommandId'] for i in range(0, len(ids), 50)]
+    return {'CommandIds': command_ids, 'InstanceIds': ids}
+
+
+# name -> (handler file, event for a fixture size, grows with the size)
+SCENARIOS = {
+    'resolve-backup-job': ('get-asg-and-launch-template_v3.py',
+                           lambda account, n: {'backupJobId': 'job-1'}, False),
+    'resolve-backup-jobs-batch': ('get-asg-and-launch-template_v3.py',
+                                  lambda account, n: {'backupJobIds': [f"job-{i}" for i in range(1, n + 1)]}, True),
+    'update-asg': ('updateASG_v1.py', lambda account, n: {
+        'LaunchTemplateId': fixtures.launch_template_id(1), 'LaunchTemplateName': fixtures.launch_template_name(1),
+        'AutoScalingGroupName': fixtures.asg_name(1), 'ImageId': fixtures.ami_id(1),
+        'CapacityMode': 'none'}, False),
+    'update-asg-with-retention': ('updateASG_v1.py', lambda account, n: {
+        'LaunchTemplateId': fixtures.launch_template_id(1), 'LaunchTemplateName': fixtures.launch_template_name(1),
+        'AutoScalingGroupName': fixtures.asg_name(1), 'ImageId': fixtures.ami_id(1),
+        'CapacityMode': 'none', 'RetainVersions': 10}, True),
+    'check-instance-state': ('check-instance-state_v1.py',
+                             lambda account, n: {'InstanceId': fixtures.instance_id(1)}, False),
+    'check-instance-state-batch': ('check-instance-state_v1.py',
+                                   lambda account, n: {'InstanceIds': instance_ids(n)}, True),
+    'sysprep': ('sysprep_v1.py', lambda account, n: {'InstanceId': fixtures.instance_id(1)}, False),
+    'sysprep-batch': ('sysprep_v1.py', lambda account, n: {'InstanceIds': instance_ids(n)}, True),
+    'check-sysprep-status': ('check-sysprep-status_v1.py', lambda account, n: {
+        'CommandId': seed_sysprep(account, 1)['CommandIds'][0], 'InstanceId': fixtures.instance_id(1)}, False),
+    'check-sysprep-status-batch': ('check-sysprep-status_v1.py', seed_sysprep, True),
+    'check-ami-status': ('check-ami-status-function_v1.py',
+                         lambda account, n: {'BackupAMIId': fixtures.ami_id(1)}, False),
+    'check-ami-status-batch': ('check-ami-status-function_v1.py', lambda account, n: {
+        'BackupAMIIds': [fixtures.ami_id(index) for index in range(1, n + 1)]}, True),
+    'cleanup': ('Cleanup_v1.py', lambda account, n: {
+        'InstanceId': fixtures.instance_id(1), 'AmiId': fixtures.ami_id(1)}, False),
+    'cleanup-bulk': ('Cleanup_v1.py', lambda account, n: {
+        'InstanceIds': instance_ids(n), 'AmiIds': [fixtures.ami_id(index) for index in range(1, n + 1)]}, True),
+}
+
+
+def operation_name(operation: str) -> str:
+    return ''.join(part.capitalize() for part in operation.split('_'))
+
+
+def run_scenario(name: str, size: int, repeat: int) -> dict:
+    """Run a scenario repeat times on fresh accounts; calls and bytes come from the first run."""
+    filename, make_event, _ = SCENARIOS[name]
+    module = load_handler(filename)
+    latencies, first = [], None
+    for _ in range(repeat):
+        account = FakeAccount(size)
+        module.get_client = account.get_client
+        metadata_cache.cache.clear()
+        event = make_event(account, size)
+        account.calls.clear()
+        start = time.perf_counter()
+        module.lambda_handler(event, None)
+        latencies.append((time.perf_counter() - start) * 1000)
+        first = first or account
+    return {
+        'Calls': {operation_name(op): count for op, count in sorted(first.calls.items())},
+        'Bytes': sum(first.bytes.values()),
+        'LatencyMs': statistics.median(latencies)
+    }
+
+
+def check_budget(calls: dict, budget: dict) -> list:
+    """Return one message per operation over its budget or without one."""
+    if budget is None:
+        return ['no budget recorded']
+    return [f"{operation}: {count} calls, budget {budget.get(operation, 0)}"
+            for operation, count in calls.items() if count > budget.get(operation, 0)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='AWS API call budget per handler')
+    parser.add_argument('--scale', action='store_true', help='run the scaling scenarios at every size')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario for the latency median')
+    parser.add_argument('--update', action='store_true', help='write the measured counts as the budget')
+    args = parser.parse_args()
+
+    # The handlers run without a bake ledger, as in a deployment without BAKE_LEDGER_TABLE
+    bake_ledger.set_bake_ledger(None)
+    budget = {}
+    if os.path.exists(BUDGET_PATH):
+        with open(BUDGET_PATH) as f:
+            budget = json.load(f)
+
+    failures, measured = [], {}
+    print(f"{'scenario':<28} {'size':>5} {'calls':>6} {'budget':>6} {'bytes':>10} {'p50 ms':>8}  operations")
+    for name, (_, _, scales) in SCENARIOS.items():
+        sizes = (SCALING_SIZES if args.scale else [BASE_SIZE]) if scales else [1]
+        for size in sizes:
+            result = run_scenario(name, size, args.repeat)
+            measured.setdefault(name, {})[str(size)] = result['Calls']
+            allowed = budget.get(name, {}).get(str(size))
+            problems = [] if args.update else check_budget(result['Calls'], allowed)
+            failures.extend(f"{name} @ {size}: {problem}" for problem in problems)
+            print(f"{name:<28} {size:>5} {sum(result['Calls'].values()):>6} "
+                  f"{'-' if allowed is None else sum(allowed.values()):>6} {result['Bytes']:>10} "
+                  f"{result['LatencyMs']:>8.2f}  "
+                  f"{' '.join(f'{op}={count}' for op, count in result['Calls'].items())}"
+                  f"{'  OVER BUDGET' if problems else ''}")
+
+    if args.update:
+        for name, sizes in measured.items():
+            budget.setdefault(name, {}).update(sizes)
+        with open(BUDGET_PATH, 'w') as f:
+            json.dump(budget, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nWrote {BUDGET_PATH}")
+    elif failures:
+        print('\nAPI call budget exceeded:')
+        for failure in failures:
+            print(f"  {failure}")
+        raise SystemExit(1)
+    else:
+        print('\nAll scenarios within their API call budget')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Builder time saved by the bake ledger when an execution is retried or an event is duplicated.
+
+Runs StepFunction_v4 offline (see bench_pipeline.py) three times against one
+simulated account and one SQLite ledger:
+1. an execution that crashes in the AMI status check after CreateAMI (its
+   Catch path restores the ASG's MaxSize),
+2. a retry of the same backup job, which resumes at the AMI status check,
+3. a duplicate delivery after completion, which stops right after the lookup.
+Usage: python benchmarks/bench_bake_resume.py
+"""
+import json
+
+from _support import REPO_ROOT
+from bench_pipeline import FakeAws, build_tasks
+
+import bake_ledger
+import local_stepfunctions
+import metadata_cache
+import polling
+
+
+def main() -> None:
+    with open(f"{REPO_ROOT}/StepFunction_v4") as f:
+        definition = json.load(f)
+    clock = local_stepfunctions.VirtualClock()
+    polling.clock = clock.time
+    metadata_cache.cache.clear()
+    aws = FakeAws(clock, instance_ready_after=200, sysprep_seconds=240, ami_seconds=600)
+    ledger = bake_ledger.SQLiteBakeLedger()
+    tasks = build_tasks(aws, ledger)
+
+    check_ami = tasks['CheckAMIState2']
+    crashes = {'remaining': 1}
+
+    def crashing_check_ami(payload):
+        if crashes['remaining']:
+            crashes['remaining'] -= 1
+            raise RuntimeError('Lambda runtime exited')
+        return check_ami(payload)
+    tasks['CheckAMIState2'] = crashing_check_ami
+
+    print(f"{'execution':<22}{'status':<11}{'simulated s':>12}{'lambdas':>9}{'runInstances':>14}"
+          f"{'createImage':>13}{'MaxSize':>9}  stage")
+    for index, label in enumerate(['crashes after AMI', 'retry resumes', 'duplicate event']):
+        before = dict(aws.calls)
+        machine = local_stepfunctions.LocalStateMachine(definition, tasks, clock)
+        started = clock.time()
+        report = machine.run({'backupJobId': 'job-1'}, execution_name=f"attempt-{index}")
+        calls = {name: aws.calls.get(name, 0) - before.get(name, 0) for name in aws.calls}
+        record = ledger.get(aws.describe_backup_job('job-1')['RecoveryPointArn'].split('/')[-1])
+        print(f"{label:<22}{report.status:<11}{clock.time() - started:>12.1f}"
+              f"{report.lambda_invocations:>9}{calls.get('run_instances', 0):>14}"
+              f"{calls.get('create_image', 0):>13}{aws.max_size:>9}  {record['Stage']}")
+        if index == 0:
+            assert aws.max_size == 4 and not aws.asg_tags, (aws.max_size, aws.asg_tags)
+
+    assert aws.calls['run_instances'] == 1 and aws.calls['create_image'] == 1, aws.calls
+    assert record['Stage'] == bake_ledger.COMPLETE
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Bulk cleanup vs one Cleanup invocation per bake.
+
+A thread-safe fake EC2 client sleeps for a fixed latency on every call, so the
+report shows both API call counts and what the bounded worker pool saves in
+wall time. One image fails to deregister and one snapshot is still in use, to
+show that single failures do not stop the rest.
+Usage: python benchmarks/bench_cleanup.py [images] [latency_ms]
+"""
+import sys
+import time
+import threading
+
+from _support import load_handler
+
+from botocore.exceptions import ClientError
+
+import cleanup_engine
+
+cleanup = load_handler('Cleanup_v1.py')
+
+
+class FakeEc2:
+    def __init__(self, images: int, latency: float):
+        self.latency = latency
+        self.images = {f"ami-{index:017x}": [f"snap-{index:08x}a", f"snap-{index:08x}b"]
+                       for index in range(images)}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        time.sleep(self.latency)
+
+    def terminate_instances(self, InstanceIds):
+        self._call('TerminateInstances')
+        return {'TerminatingInstances': [{'InstanceId': instance_id,
+                                          'CurrentState': {'Name': 'shutting-down'}}
+                                         for instance_id in InstanceIds]}
+
+    def describe_images(self, ImageIds):
+        self._call('DescribeImages')
+        return {'Images': [{'ImageId': image_id, 'BlockDeviceMappings': [
+            {'DeviceName': f"/dev/sd{chr(97 + i)}", 'Ebs': {'SnapshotId': snapshot_id}}
+            for i, snapshot_id in enumerate(self.images[image_id])
+        ]} for image_id in ImageIds if image_id in self.images]}
+
+    def deregister_image(self, ImageId):
+        self._call('DeregisterImage')
+        if ImageId == 'ami-00000000000000003':
+            raise ClientError({'Error': {'Code': 'InvalidAMIID.Unavailable', 'Message': 'busy'}},
+                              'DeregisterImage')
+        return {}
+
+    def delete_snapshot(self, SnapshotId):
+        self._call('DeleteSnapshot')
+        if SnapshotId == 'snap-00000005b':
+            raise ClientError({'Error': {'Code': 'InvalidSnapshot.InUse', 'Message': 'in use'}},
+                              'DeleteSnapshot')
+        return {}
+
+
+def main() -> None:
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    instance_ids = [f"i-{index:017x}" for index in range(images)]
+    image_ids = [f"ami-{index:017x}" for index in range(images)]
+
+    # Before: one invocation per bake, serial calls, snapshots left behind
+    ec2 = FakeEc2(images, latency)
+    started = time.perf_counter()
+    for instance_id, image_id in zip(instance_ids, image_ids):
+        ec2.terminate_instances(InstanceIds=[instance_id])
+        try:
+            ec2.deregister_image(ImageId=image_id)
+        except ClientError:
+            pass
+    elapsed = time.perf_counter() - started
+    print(f"per-bake cleanup: {elapsed:6.2f}s calls={ec2.calls} snapshots left={images * 2}")
+
+    ec2 = FakeEc2(images, latency)
+    cleanup.get_client = lambda service_name, region_name=None: ec2
+    started = time.perf_counter()
+    report = cleanup.lambda_handler({'InstanceIds': instance_ids, 'AmiIds': image_ids}, None)
+    elapsed = time.perf_counter() - started
+    deleted = sum(len(image['DeletedSnapshots']) for image in report['Images'])
+    print(f"bulk cleanup ({cleanup_engine.CLEANUP_WORKERS} workers): {elapsed:6.2f}s calls={ec2.calls} "
+          f"snapshots deleted={deleted} failures={report['FailureCount']}")
+    assert report['FailureCount'] == 2, report['FailureCount']
+    assert deleted == (images - 1) * 2 - 1
+
+    ec2 = FakeEc2(images, latency)
+    cleanup.get_client = lambda service_name, region_name=None: ec2
+    report = cleanup.lambda_handler({'InstanceIds': instance_ids, 'AmiIds': image_ids,
+                                     'DryRun': True}, None)
+    assert set(ec2.calls) == {'DescribeImages'}, ec2.calls
+    print(f"dry run: would delete {len(report['Images'])} images and {report['SnapshotCount']} "
+          f"snapshots with calls={ec2.calls}")
+
+
+if __name__ == '__main__':
+    main()
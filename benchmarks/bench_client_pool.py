@@ -0,0 +1,84 @@
+"""Client construction count and warm-invocation latency, per-call clients vs the shared pool.
+
+Usage: python benchmarks/bench_client_pool.py [iterations]
+"""
+import sys
+
+from _support import load_handler, measure, summarize
+
+import boto3
+import botocore.session
+from botocore.stub import Stubber
+
+import aws_clients
+
+STATUS_RESPONSE = {
+    'InstanceStatuses': [{
+        'InstanceId': 'i-0123456789abcdef0',
+        'InstanceState': {'Code': 16, 'Name': 'running'},
+        'SystemStatus': {'Status': 'ok'},
+        'InstanceStatus': {'Status': 'ok'}
+    }]
+}
+EVENT = {'InstanceId': 'i-0123456789abcdef0'}
+
+constructions = 0
+_create_client = botocore.session.Session.create_client
+
+
+def _counting_create_client(self, *args, **kwargs):
+    global constructions
+    constructions += 1
+    return _create_client(self, *args, **kwargs)
+
+
+def run_per_call_clients(handler, iterations: int) -> list:
+    """Reproduce the old behaviour: a brand new client on every invocation."""
+    def fresh_client(service_name, region_name=None):
+        client = boto3.client(service_name, region_name=region_name)
+        stubber = Stubber(client)
+        stubber.add_response('describe_instance_status', STATUS_RESPONSE)
+        stubber.activate()
+        return client
+
+    handler.get_client = fresh_client
+    try:
+        return measure(lambda: handler.lambda_handler(EVENT, None), iterations)
+    finally:
+        handler.get_client = aws_clients.get_client
+
+
+def run_pooled_clients(handler, iterations: int) -> list:
+    """Use the shared pool: one client built on first use, reused afterwards."""
+    aws_clients.reset_clients()
+    stubber = Stubber(aws_clients.get_client('ec2'))
+    for _ in range(iterations):
+        stubber.add_response('describe_instance_status', STATUS_RESPONSE)
+    stubber.activate()
+    latencies = measure(lambda: handler.lambda_handler(EVENT, None), iterations)
+    stubber.assert_no_pending_responses()
+    return latencies
+
+
+def main(iterations: int) -> None:
+    global constructions
+    botocore.session.Session.create_client = _counting_create_client
+    handler = load_handler('check-instance-state_v1.py')
+
+    constructions = 0
+    before = run_per_call_clients(handler, iterations)
+    before_constructions = constructions
+
+    constructions = 0
+    after = run_pooled_clients(handler, iterations)
+    after_constructions = constructions
+
+    print(summarize('per-invocation boto3.client', before))
+    print(f"{'':<40} client constructions={before_constructions}")
+    print(summarize('shared aws_clients.get_client', after))
+    print(f"{'':<40} client constructions={after_constructions}")
+    print('Note: clients are stubbed, so TLS handshake savings are not included.')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
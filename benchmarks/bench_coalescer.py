@@ -0,0 +1,117 @@
+"""Bakes started for a burst of backup completions, with and without the coalescer.
+
+A burst of backup jobs for instances spread over a few ASGs arrives over
+several minutes of virtual time; a scheduled flush runs every minute. The
+per-bake cost (simulated minutes, Lambda invocations and AWS API calls) comes
+from running StepFunction_v4 offline as in bench_pipeline.py.
+Usage: python benchmarks/bench_coalescer.py [jobs] [asgs] [burst_minutes]
+"""
+import sys
+import random
+import statistics
+
+from _support import REPO_ROOT, load_handler
+from bench_pipeline import run_definition
+
+import backup_event_buffer
+import local_stepfunctions
+
+coalescer = load_handler('coalesce-backup-events_v1.py')
+
+
+class FakeAws:
+    def __init__(self, instance_asgs):
+        self.instance_asgs = instance_asgs
+        self.calls = {}
+        self.executions = []
+
+    def get_client(self, service_name, region_name=None):
+        return self
+
+    def _count(self, operation):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, InstanceIds):
+        return [self.describe_auto_scaling_instances(InstanceIds)]
+
+    def describe_auto_scaling_instances(self, InstanceIds):
+        self._count('DescribeAutoScalingInstances')
+        return {'AutoScalingInstances': [{
+            'InstanceId': InstanceIds[0], 'InstanceType': 'm5.large',
+            'AutoScalingGroupName': self.instance_asgs[InstanceIds[0]]
+        }]}
+
+    def start_execution(self, stateMachineArn, name, input):
+        self._count('StartExecution')
+        self.executions.append(name)
+        return {'executionArn': f"{stateMachineArn.replace('stateMachine', 'execution')}:{name}"}
+
+
+def backup_event(index: int, instance_id: str, created_at: float) -> dict:
+    created = local_stepfunctions.datetime.datetime.fromtimestamp(
+        created_at, local_stepfunctions.datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return {'detail-type': 'Backup Job State Change', 'detail': {
+        'backupJobId': f"job-{index:04d}", 'state': 'COMPLETED', 'resourceType': 'EC2',
+        'resourceArn': f"arn:aws:ec2:us-east-1:123456789012:instance/{instance_id}",
+        'creationDate': created}}
+
+
+def main() -> None:
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    asgs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    burst_minutes = float(sys.argv[3]) if len(sys.argv) > 3 else 8
+    window = backup_event_buffer.DEFAULT_WINDOW_SECONDS
+    rng = random.Random(3)
+
+    instance_asgs = {f"i-{index:017x}": f"asg-{index % asgs}" for index in range(jobs)}
+    aws = FakeAws(instance_asgs)
+    coalescer.get_client = aws.get_client
+    coalescer.os.environ.setdefault('STATE_MACHINE_ARN',
+                                    'arn:aws:states:us-east-1:123456789012:stateMachine:bake')
+    backup_event_buffer.set_event_buffer(backup_event_buffer.InMemoryEventBuffer())
+    clock = local_stepfunctions.VirtualClock(1_700_000_000)
+    backup_event_buffer.clock = clock.time
+
+    arrivals = sorted((rng.uniform(0, burst_minutes * 60), instance_id)
+                      for instance_id in instance_asgs)
+    events = [(at, backup_event(index, instance_id, clock.time() + at - 300))
+              for index, (at, instance_id) in enumerate(arrivals)]
+    first_bake_delay = []
+    invocations = 0
+    end = burst_minutes * 60 + window + 120
+    next_flush = 60.0
+    start = clock.time()
+    for at, event in events + [(end, None)]:
+        while next_flush <= at:
+            clock.advance(start + next_flush - clock.time())
+            result = coalescer.lambda_handler({'detail-type': 'Scheduled Event'}, None)
+            invocations += 1
+            first_bake_delay += [next_flush] * result['StartedCount']
+            next_flush += 60
+        if event is not None:
+            clock.advance(start + at - clock.time())
+            coalescer.lambda_handler(event, None)
+            invocations += 1
+
+    per_bake = run_definition(f"{REPO_ROOT}/StepFunction_v4", 20, 42)
+    minutes = statistics.mean(s['SimulatedSeconds'] for s in per_bake) / 60
+    lambdas = statistics.mean(s['LambdaInvocations'] for s in per_bake)
+    api_calls = statistics.mean(s['ApiCalls'] for s in per_bake)
+    bakes = len(aws.executions)
+    print(f"{jobs} backup jobs for {asgs} ASGs over {burst_minutes} min, window {window}s")
+    print(f"{'':<16}{'bakes':>7}{'builder min':>13}{'lambdas':>9}{'API calls':>11}")
+    for label, count, extra_lambdas, extra_calls in (
+        ('one per job', jobs, 0, 0),
+        ('coalesced', bakes, invocations, sum(aws.calls.values()))
+    ):
+        print(f"{label:<16}{count:>7}{count * minutes:>13.0f}{count * lambdas + extra_lambdas:>9.0f}"
+              f"{count * api_calls + extra_calls:>11.0f}")
+    print(f"coalescer API calls: {aws.calls}; bakes started at t={sorted(set(first_bake_delay))}s")
+    assert bakes == asgs, aws.executions
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Init time per handler: one function per handler vs the single dispatcher function.
+
+Each measurement runs in a fresh interpreter, standing in for a new Lambda
+container. "separate" imports one handler file on its own, as a function per
+handler does on every cold start. "dispatcher" loads the same handler through
+dispatcher.py in a fresh container, and "warm container" loads it after the
+container has already served the actions before it in the pipeline, which is
+the common case once every Task shares one function.
+Usage: python benchmarks/bench_cold_start.py [repeats]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+from _support import REPO_ROOT
+
+import dispatcher
+
+# The order a bake invokes them in; the rest run outside the state machine
+PIPELINE = [
+    'get-asg-and-launch-template', 'launch-builder', 'check-instance-state', 'sysprep',
+    'check-sysprep-status', 'check-ami-status', 'copy-ami-to-regions', 'check-ami-copies',
+    'enable-image-acceleration', 'check-image-acceleration', 'update-asg', 'check-instance-refresh',
+    'update-regional-asgs', 'restore-asg-capacity', 'cleanup', 'register-task-token',
+    'task-token-callback', 'prune-launch-template-versions', 'coalesce-backup-events',
+]
+
+PROBE = """
+import sys, time, json
+sys.path.insert(0, {benchmarks!r})
+import _support
+mode, action, warm = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+import dispatcher
+for other in warm:
+    dispatcher.load_action(other)
+start = time.perf_counter()
+if mode == 'separate':
+    _support.load_handler(dispatcher.ACTIONS[action])
+else:
+    dispatcher.load_action(action)
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def init_ms(mode: str, action: str, warm: list, repeats: int) -> float:
+    """Median init time of an action over fresh interpreters, in milliseconds."""
+    probe = PROBE.format(benchmarks=os.path.join(REPO_ROOT, 'benchmarks'))
+    samples = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', probe, mode, action, json.dumps(warm)],
+            check=True, capture_output=True, text=True, cwd=REPO_ROOT
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def main() -> None:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    assert sorted(PIPELINE) == sorted(dispatcher.ACTIONS), 'PIPELINE is missing an action'
+
+    print(f"{'action':<32} {'separate ms':>12} {'dispatcher ms':>14} {'warm container ms':>18}")
+    totals = [0.0, 0.0, 0.0]
+    for index, action in enumerate(PIPELINE):
+        row = (
+            init_ms('separate', action, [], repeats),
+            init_ms('dispatcher', action, [], repeats),
+            init_ms('dispatcher', action, PIPELINE[:index], repeats),
+        )
+        totals = [total + value for total, value in zip(totals, row)]
+        print(f"{action:<32} {row[0]:12.2f} {row[1]:14.2f} {row[2]:18.2f}")
+    print(f"{'total':<32} {totals[0]:12.2f} {totals[1]:14.2f} {totals[2]:18.2f}")
+    print(f"\nFunctions that can cold start: {len(PIPELINE)} with a function per handler, "
+          f"1 with the dispatcher (median of {repeats} runs per cell)")
+
+
+if __name__ == '__main__':
+    main()
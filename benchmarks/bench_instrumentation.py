@@ -0,0 +1,96 @@
+"""Check the per-API-call metrics and measure what the hooks cost per call.
+
+Runs the instance status handler against stubbed clients, parses the EMF lines
+it writes to stdout and checks call, error and throttle counts, then compares
+stubbed call latency with and without the hooks attached.
+Usage: python benchmarks/bench_instrumentation.py [iterations]
+"""
+import io
+import os
+import sys
+import json
+import contextlib
+
+os.environ['API_METRICS_ENABLED'] = 'true'
+
+from _support import StubbedClients, load_handler, measure, summarize
+
+import boto3
+from botocore.stub import Stubber
+
+import instrumentation
+
+check_instance = load_handler('check-instance-state_v1.py')
+
+STATUS_RESPONSE = {
+    'InstanceStatuses': [{
+        'InstanceId': 'i-0123456789abcdef0',
+        'InstanceState': {'Code': 16, 'Name': 'running'},
+        'SystemStatus': {'Status': 'ok'},
+        'InstanceStatus': {'Status': 'ok'}
+    }]
+}
+
+
+class LambdaContext:
+    function_name = 'check-instance-state'
+
+
+def invoke(event: dict) -> list:
+    """Run the handler and return the EMF documents it printed."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            check_instance.lambda_handler(event, LambdaContext())
+        except Exception:
+            pass
+    return [json.loads(line) for line in output.getvalue().splitlines() if line.startswith('{')]
+
+
+def check_metrics() -> None:
+    stubs = StubbedClients('ec2')
+    stubs.add('ec2', 'describe_instance_status', STATUS_RESPONSE)
+    documents = invoke({'InstanceId': 'i-0123456789abcdef0'})
+    stubs.assert_done()
+    operation, summary = documents
+    assert operation['Operation'] == 'ec2.DescribeInstanceStatus', operation
+    assert operation['Calls'] == 1 and operation['Errors'] == 0, operation
+    assert operation['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['FunctionName', 'Operation']]
+    assert summary['FunctionName'] == 'check-instance-state' and summary['ApiCalls'] == 1, summary
+
+    # A throttled call is counted once as an error and once as a throttle
+    stubs = StubbedClients('ec2')
+    stubs.add_error('ec2', 'describe_instance_status', 'RequestLimitExceeded', 503)
+    documents = invoke({'InstanceId': 'i-0123456789abcdef0'})
+    stubs.assert_done()
+    operation, summary = documents
+    assert operation['Errors'] == 1 and operation['Throttles'] == 1, operation
+    assert summary['ApiThrottles'] == 1 and summary['ApiErrors'] == 1, summary
+    print("EMF output: per-operation and summary documents match the stubbed calls")
+
+
+def stubbed_client(instrumented: bool, iterations: int):
+    client = boto3.client('ec2', region_name='us-east-1')
+    if instrumented:
+        instrumentation.instrument_client(client)
+    stubber = Stubber(client)
+    for _ in range(iterations):
+        stubber.add_response('describe_instance_status', STATUS_RESPONSE)
+    stubber.activate()
+    return client
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    check_metrics()
+    for instrumented in (False, True):
+        client = stubbed_client(instrumented, iterations)
+        latencies = measure(
+            lambda: client.describe_instance_status(InstanceIds=['i-0123456789abcdef0']), iterations
+        )
+        label = 'with metric hooks' if instrumented else 'without metric hooks'
+        print(summarize(f"describe_instance_status {label}", latencies))
+
+
+if __name__ == '__main__':
+    main()
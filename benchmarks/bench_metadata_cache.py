@@ -0,0 +1,112 @@
+"""Exact AWS API call counts per code path with the shared metadata cache.
+
+Each scenario queues exactly the calls it expects; an extra or missing call
+fails the run. Usage: python benchmarks/bench_metadata_cache.py
+"""
+import fixtures
+from _support import StubbedClients, load_handler
+
+import metadata_cache
+
+get_asg = load_handler('get-asg-and-launch-template_v3.py')
+update_asg = load_handler('updateASG_v1.py')
+
+
+def fresh(*services) -> StubbedClients:
+    metadata_cache.cache.clear()
+    return StubbedClients(*services)
+
+
+def resolve_event(pin_capacity: bool) -> dict:
+    return {'backupJobId': 'job-1', 'setMaxCapacityEqualToDesiredCapacity': pin_capacity}
+
+
+def scenario_resolve_and_pin_capacity():
+    """Launch template fallback and capacity pin share one describe_auto_scaling_groups."""
+    stubs = fresh('backup', 'ec2', 'autoscaling')
+    stubs.add('backup', 'describe_backup_job', fixtures.backup_job(1))
+    stubs.add('autoscaling', 'describe_auto_scaling_instances',
+              fixtures.describe_auto_scaling_instances([fixtures.auto_scaling_instance(1, 1)]))
+    stubs.add('autoscaling', 'describe_auto_scaling_groups',
+              fixtures.describe_auto_scaling_groups([fixtures.auto_scaling_group(1)]))
+    stubs.add('autoscaling', 'create_or_update_tags', {})
+    stubs.add('autoscaling', 'update_auto_scaling_group', {})
+    result = get_asg.lambda_handler(resolve_event(True), None)
+    assert result['OriginalMaxCapacity'] == 4
+    return stubs, {'DescribeBackupJob': 1, 'DescribeAutoScalingInstances': 1, 'DescribeAutoScalingGroups': 1,
+                   'CreateOrUpdateTags': 1, 'UpdateAutoScalingGroup': 1}
+
+
+def scenario_resolve_without_capacity_pin():
+    stubs = fresh('backup', 'ec2', 'autoscaling')
+    stubs.add('backup', 'describe_backup_job', fixtures.backup_job(1))
+    stubs.add('autoscaling', 'describe_auto_scaling_instances',
+              fixtures.describe_auto_scaling_instances([fixtures.auto_scaling_instance(1, 1)]))
+    stubs.add('autoscaling', 'describe_auto_scaling_groups',
+              fixtures.describe_auto_scaling_groups([fixtures.auto_scaling_group(1)]))
+    get_asg.lambda_handler(resolve_event(False), None)
+    return stubs, {'DescribeBackupJob': 1, 'DescribeAutoScalingInstances': 1,
+                   'DescribeAutoScalingGroups': 1}
+
+
+def update_event(image_id: str) -> dict:
+    return {
+        'LaunchTemplateId': fixtures.launch_template_id(1),
+        'LaunchTemplateName': fixtures.launch_template_name(1),
+        'AutoScalingGroupName': fixtures.asg_name(1),
+        'ImageId': image_id
+    }
+
+
+def scenario_update_already_current_warm():
+    """A second warm invocation within the TTL reuses the launch template metadata."""
+    stubs = fresh('ec2', 'autoscaling')
+    current = fixtures.ami_id(7)
+    stubs.add('ec2', 'describe_launch_template_versions', {'LaunchTemplateVersions': [
+        fixtures.launch_template_version(1, 3, current, default=True)]})
+    update_asg.lambda_handler(update_event(current), None)
+    update_asg.lambda_handler(update_event(current), None)
+    return stubs, {'DescribeLaunchTemplateVersions': 1}
+
+
+def scenario_update_invalidates_after_write():
+    """Creating a version invalidates the cache, so the next invocation re-reads it."""
+    stubs = fresh('ec2', 'autoscaling')
+    old, new = fixtures.ami_id(7), fixtures.ami_id(8)
+    stubs.add('ec2', 'describe_launch_template_versions', {'LaunchTemplateVersions': [
+        fixtures.launch_template_version(1, 3, old, default=True)]})
+    stubs.add('ec2', 'create_launch_template_version', {
+        'LaunchTemplateVersion': fixtures.launch_template_version(1, 4, new)})
+    stubs.add('ec2', 'modify_launch_template', {'LaunchTemplate': fixtures.launch_template(1, 4, 4)})
+    stubs.add('autoscaling', 'update_auto_scaling_group', {})
+    stubs.add('ec2', 'describe_launch_template_versions', {'LaunchTemplateVersions': [
+        fixtures.launch_template_version(1, 4, new, default=True)]})
+    update_asg.lambda_handler(update_event(new), None)
+    update_asg.lambda_handler(update_event(new), None)
+    return stubs, {'DescribeLaunchTemplateVersions': 2, 'CreateLaunchTemplateVersion': 1,
+                   'ModifyLaunchTemplate': 1, 'UpdateAutoScalingGroup': 1}
+
+
+SCENARIOS = [
+    scenario_resolve_and_pin_capacity,
+    scenario_resolve_without_capacity_pin,
+    scenario_update_already_current_warm,
+    scenario_update_invalidates_after_write,
+]
+
+
+def main() -> None:
+    failures = 0
+    for scenario in SCENARIOS:
+        stubs, expected = scenario()
+        stubs.assert_done()
+        status = 'ok' if stubs.calls == expected else 'FAIL'
+        failures += status != 'ok'
+        print(f"{status:<5}{scenario.__name__:<45} calls={stubs.calls}")
+        if status != 'ok':
+            print(f"{'':<5}expected={expected}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,502 @@
+"""End-to-end bake latency and cost of a state machine definition, offline.
+
+Runs the definition in local_stepfunctions with the real Python handlers wired
+to a simulated AWS account whose resources become ready on a virtual clock.
+Compare definitions by passing several files, e.g. the baseline one:
+    git show de60a4d:StepFunction_v4 > /tmp/StepFunction_fixed
+    python benchmarks/bench_pipeline.py /tmp/StepFunction_fixed StepFunction_v4
+"""
+import argparse
+import json
+import math
+import random
+import statistics
+import types
+
+from botocore.exceptions import ClientError
+
+import fixtures
+from _support import REPO_ROOT, load_handler
+
+import bake_ledger
+import dispatcher
+import local_stepfunctions
+import metadata_cache
+import polling
+
+HANDLER_FILES = {
+    'get-asg-and-launch-template': 'get-asg-and-launch-template_v3.py',
+    'LaunchInstance': 'launch-builder_v1.py',
+    'CheckInstanceState': 'check-instance-state_v1.py',
+    'SysprepInstance': 'sysprep_v1.py',
+    'CheckSysprepStatus': 'check-sysprep-status_v1.py',
+    'CheckAMIState2': 'check-ami-status-function_v1.py',
+    'EnableImageAcceleration': 'enable-image-acceleration_v1.py',
+    'CheckImageAcceleration': 'check-image-acceleration_v1.py',
+    'updateASG': 'updateASG_v1.py',
+    'CopyAMIToRegions': 'copy-ami-to-regions_v1.py',
+    'CheckAMICopies': 'check-ami-copies_v1.py',
+    'UpdateRegionalASGs': 'update-regional-asgs_v1.py',
+    'CheckInstanceRefresh': 'check-instance-refresh_v1.py',
+    'RestoreCapacityOnFailure': 'restore-asg-capacity_v1.py',
+    'cleanup': 'Cleanup_v1.py',
+    'CleanupAfterRefreshFailure': 'Cleanup_v1.py',
+}
+CHILD_EXECUTION_RESOURCE = 'arn:aws:states:::states:startExecution.sync:2'
+BUILDER_ID = 'i-0b1d0e2a3f4c5d6e7'
+BAKED_AMI_ID = 'ami-0b1d0e2a3f4c5d6e7'
+BAKED_SNAPSHOT_ID = 'snap-0b1d0e2a3f4c5d6e7'
+# ASG tags that turn on Fast Launch and Fast Snapshot Restore (--accelerate)
+ACCELERATION_TAGS = [{'Key': 'ami-bake:fast-launch', 'Value': 'true'},
+                     {'Key': 'ami-bake:fsr-azs', 'Value': 'us-east-1a,us-east-1b'}]
+# ASG tag that replaces the running instances after the switch (--refresh)
+REFRESH_TAGS = [{'Key': 'ami-bake:instance-refresh', 'Value': 'true'}]
+HOME_REGION = 'us-east-1'
+# A second builder subnet in another AZ, and the AZ of each (--shortage)
+FALLBACK_SUBNET_ID = 'subnet-0fedcba9876543210'
+SUBNET_AZS = {FALLBACK_SUBNET_ID: 'us-east-1b'}
+FALLBACK_SUBNET_TAGS = [{'Key': 'ami-bake:builder-subnets', 'Value': FALLBACK_SUBNET_ID}]
+
+
+class FakeAws:
+    """A tiny AWS account: one ASG, one builder instance, one baked AMI."""
+
+    def __init__(self, clock, instance_ready_after: float, sysprep_seconds: float,
+                 ami_seconds: float, acceleration_seconds: float = 1200, asg_tags=None,
+                 fleet_size: int = 2, replace_seconds: float = 420):
+        self.clock = clock
+        self.instance_ready_after = instance_ready_after
+        self.sysprep_seconds = sysprep_seconds
+        self.ami_seconds = ami_seconds
+        self.acceleration_seconds = acceleration_seconds
+        self.asg_tags = list(asg_tags or [])
+        self.max_size = fixtures.auto_scaling_group(1)['MaxSize']
+        self.suspended_processes = set()
+        self.launched_at = self.sysprep_started_at = self.image_started_at = None
+        self.builder = None
+        self.fast_launch_at = None
+        self.fleet_size = fleet_size
+        self.replace_seconds = replace_seconds
+        self.refresh_started_at = None
+        self.fast_snapshot_restores = {}
+        self.image_tags = []
+        self.regions = {}
+        # (instance type, AZ) pairs without capacity for the builder
+        self.no_capacity = set()
+        self.calls = {}
+
+    def get_client(self, service_name, region_name=None):
+        return FakeClient(self, service_name, region_name or HOME_REGION)
+
+    def call(self, operation, region=HOME_REGION, **params):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        return getattr(self if region == HOME_REGION else self.regions[region], operation)(**params)
+
+    # --- backup / autoscaling / launch templates ---
+    def describe_backup_job(self, BackupJobId):
+        return fixtures.backup_job(1)
+
+    def describe_auto_scaling_instances(self, InstanceIds):
+        return fixtures.describe_auto_scaling_instances([fixtures.auto_scaling_instance(1, 1)])
+
+    def describe_auto_scaling_groups(self, AutoScalingGroupNames):
+        group = fixtures.auto_scaling_group(1, max_size=self.max_size)
+        group['Tags'] = self.asg_tags
+        group['SuspendedProcesses'] = [{'ProcessName': name} for name in sorted(self.suspended_processes)]
+        return fixtures.describe_auto_scaling_groups([group])
+
+    def update_auto_scaling_group(self, **params):
+        self.max_size = params.get('MaxSize', self.max_size)
+        return {}
+
+    def create_or_update_tags(self, Tags):
+        keys = {tag['Key'] for tag in Tags}
+        self.asg_tags = [tag for tag in self.asg_tags if tag['Key'] not in keys] + [
+            {'Key': tag['Key'], 'Value': tag['Value']} for tag in Tags]
+        return {}
+
+    def delete_tags(self, Tags):
+        keys = {tag['Key'] for tag in Tags}
+        self.asg_tags = [tag for tag in self.asg_tags if tag['Key'] not in keys]
+        return {}
+
+    def suspend_processes(self, AutoScalingGroupName, ScalingProcesses):
+        self.suspended_processes.update(ScalingProcesses)
+        return {}
+
+    def resume_processes(self, AutoScalingGroupName, ScalingProcesses):
+        self.suspended_processes.difference_update(ScalingProcesses)
+        return {}
+
+    def start_instance_refresh(self, **params):
+        self.refresh_started_at = self.clock.time()
+        return {'InstanceRefreshId': '5f0a1b2c-0000-0000-0000-000000000000'}
+
+    def describe_instance_refreshes(self, AutoScalingGroupName, InstanceRefreshIds=None, MaxRecords=None):
+        # MinHealthyPercentage 100 with 10% headroom replaces one instance at a time
+        replaced = min(self.fleet_size,
+                       int((self.clock.time() - self.refresh_started_at) // self.replace_seconds))
+        return {'InstanceRefreshes': [{
+            'InstanceRefreshId': '5f0a1b2c-0000-0000-0000-000000000000',
+            'AutoScalingGroupName': AutoScalingGroupName,
+            'Status': 'Successful' if replaced == self.fleet_size else 'InProgress',
+            'PercentageComplete': 100 * replaced // self.fleet_size,
+            'InstancesToUpdate': self.fleet_size - replaced
+        }]}
+
+    def describe_launch_template_versions(self, LaunchTemplateName, Versions=None):
+        return {'LaunchTemplateVersions': [
+            fixtures.launch_template_version(1, 41, fixtures.ami_id(0), default=True)]}
+
+    def create_launch_template_version(self, **params):
+        return {'LaunchTemplateVersion': fixtures.launch_template_version(1, 42, BAKED_AMI_ID)}
+
+    def modify_launch_template(self, **params):
+        return {'LaunchTemplate': fixtures.launch_template(1, 42, 42)}
+
+    # --- builder instance ---
+    def describe_instance_types(self, InstanceTypes):
+        return {'InstanceTypes': [{'InstanceType': instance_type,
+                                   'ProcessorInfo': {'SupportedArchitectures': ['x86_64']}}
+                                  for instance_type in InstanceTypes]}
+
+    def run_instances(self, **params):
+        subnet_id = params['NetworkInterfaces'][0]['SubnetId']
+        az = SUBNET_AZS.get(subnet_id, 'us-east-1a')
+        if (params['InstanceType'], az) in self.no_capacity:
+            raise ClientError({'Error': {'Code': 'InsufficientInstanceCapacity',
+                                         'Message': f"No {params['InstanceType']} capacity in {az}"}},
+                              'RunInstances')
+        self.launched_at = self.clock.time()
+        instance = fixtures.instance(99, instance_type=params['InstanceType'])
+        instance.update(builder_instance_detail())
+        instance['Placement'] = dict(instance['Placement'], AvailabilityZone=az)
+        instance['SubnetId'] = subnet_id
+        instance['Tags'] = [tag for spec in params.get('TagSpecifications', [])
+                            if spec['ResourceType'] == 'instance' for tag in spec['Tags']]
+        self.builder = instance
+        return {'ReservationId': 'r-0123456789abcdef0', 'OwnerId': fixtures.ACCOUNT_ID,
+                'Groups': [], 'Instances': [instance]}
+
+    def describe_instances(self, Filters):
+        # Only the builder lookup by tag: a retried launch finds the instance it started
+        tags = {f"tag:{tag['Key']}": tag['Value'] for tag in (self.builder or {}).get('Tags', [])}
+        matches = self.builder is not None and all(
+            tags.get(f['Name']) in f['Values'] for f in Filters if f['Name'].startswith('tag:'))
+        return {'Reservations': [{'Instances': [self.builder]}] if matches else []}
+
+    def describe_instance_status(self, InstanceIds, IncludeAllInstances=False):
+        ready = self.clock.time() >= self.launched_at + self.instance_ready_after
+        check = 'ok' if ready else 'initializing'
+        return {'InstanceStatuses': [{
+            'InstanceId': InstanceIds[0],
+            'InstanceState': {'Code': 16, 'Name': 'running'},
+            'SystemStatus': {'Status': check},
+            'InstanceStatus': {'Status': check}
+        }]}
+
+    def send_command(self, **params):
+        self.sysprep_started_at = self.clock.time()
+        return {'Command': {'CommandId': '0b2f1c3e-4d5a-6b7c-8d9e-0f1a2b3c4d5e'}}
+
+    def get_command_invocation(self, CommandId, InstanceId):
+        done = self.clock.time() >= self.sysprep_started_at + self.sysprep_seconds
+        return {'Status': 'Success' if done else 'InProgress'}
+
+    # --- AMI ---
+    def create_image(self, **params):
+        self.image_started_at = self.clock.time()
+        return {'ImageId': BAKED_AMI_ID, 'ResponseMetadata': response_metadata()}
+
+    def describe_images(self, ImageIds=None, Filters=None):
+        if ImageIds and BAKED_AMI_ID not in ImageIds:
+            # Cleanup looks up the snapshots of the backup AMI before deregistering it
+            return {'Images': [{'ImageId': image_id, 'State': 'available', 'BlockDeviceMappings': [
+                {'DeviceName': '/dev/sda1', 'Ebs': {'SnapshotId': 'snap-0123456789abcdef0'}}
+            ]} for image_id in ImageIds]}
+        done = self.clock.time() >= self.image_started_at + self.ami_seconds
+        return {'Images': [{'ImageId': BAKED_AMI_ID, 'State': 'available' if done else 'pending',
+                            'Tags': self.image_tags, 'BlockDeviceMappings': [
+                                {'DeviceName': '/dev/sda1', 'Ebs': {'SnapshotId': BAKED_SNAPSHOT_ID}}]}]}
+
+    def create_tags(self, Resources, Tags):
+        self.image_tags = Tags
+        return {}
+
+    # --- Fast Launch / Fast Snapshot Restore ---
+    def enable_fast_launch(self, **params):
+        self.fast_launch_at = self.clock.time()
+        return {'ImageId': params['ImageId'], 'State': 'enabling'}
+
+    def describe_fast_launch_images(self, ImageIds):
+        if self.fast_launch_at is None:
+            return {'FastLaunchImages': []}
+        done = self.clock.time() >= self.fast_launch_at + self.acceleration_seconds / 2
+        return {'FastLaunchImages': [{'ImageId': ImageIds[0], 'State': 'enabled' if done else 'enabling'}]}
+
+    def enable_fast_snapshot_restores(self, AvailabilityZones, SourceSnapshotIds):
+        for snapshot_id in SourceSnapshotIds:
+            for az in AvailabilityZones:
+                self.fast_snapshot_restores[(snapshot_id, az)] = self.clock.time()
+        return {'Successful': [], 'Unsuccessful': []}
+
+    def describe_fast_snapshot_restores(self, Filters):
+        now = self.clock.time()
+        return {'FastSnapshotRestores': [
+            {'SnapshotId': snapshot_id, 'AvailabilityZone': az,
+             'State': 'enabled' if now >= enabled_at + self.acceleration_seconds else 'optimizing'}
+            for (snapshot_id, az), enabled_at in self.fast_snapshot_restores.items()
+            if snapshot_id in Filters[0]['Values']]}
+
+    # --- cleanup / notification ---
+    def terminate_instances(self, InstanceIds):
+        return {'TerminatingInstances': [{'InstanceId': InstanceIds[0],
+                                          'CurrentState': {'Name': 'shutting-down'}}]}
+
+    def deregister_image(self, ImageId):
+        return {}
+
+    def delete_snapshot(self, SnapshotId):
+        return {}
+
+    def publish(self, **params):
+        return {'MessageId': 'c0ffee00-0000-0000-0000-000000000000'}
+
+    # --- bake ledger ---
+    def describe_execution(self, executionArn):
+        # Earlier local executions are never still running
+        return {'executionArn': executionArn, 'status': 'FAILED'}
+
+
+class FakeRegion:
+    """Another region running the same ASG, where the baked AMI is copied (--regions)."""
+
+    def __init__(self, clock, index: int, copy_seconds: float):
+        self.clock = clock
+        self.copy_id = fixtures.ami_id(100 + index)
+        self.copy_seconds = copy_seconds
+        self.copy_started_at = None
+
+    def copy_image(self, **params):
+        self.copy_started_at = self.copy_started_at or self.clock.time()
+        return {'ImageId': self.copy_id}
+
+    def describe_images(self, Filters):
+        done = self.clock.time() >= self.copy_started_at + self.copy_seconds
+        return {'Images': [{'ImageId': self.copy_id, 'State': 'available' if done else 'pending'}]}
+
+    def describe_auto_scaling_groups(self, AutoScalingGroupNames):
+        return fixtures.describe_auto_scaling_groups([fixtures.auto_scaling_group(1)])
+
+    def update_auto_scaling_group(self, **params):
+        return {}
+
+    def describe_launch_template_versions(self, LaunchTemplateName, Versions=None):
+        return {'LaunchTemplateVersions': [
+            fixtures.launch_template_version(1, 41, fixtures.ami_id(0), default=True)]}
+
+    def create_launch_template_version(self, **params):
+        return {'LaunchTemplateVersion': fixtures.launch_template_version(1, 42, self.copy_id)}
+
+    def modify_launch_template(self, **params):
+        return {'LaunchTemplate': fixtures.launch_template(1, 42, 42)}
+
+
+class FakeClient:
+    def __init__(self, aws, service_name, region_name=HOME_REGION):
+        self.aws = aws
+        self.service_name = service_name
+        self.region_name = region_name
+        self.meta = types.SimpleNamespace(region_name=region_name)
+
+    def __getattr__(self, operation):
+        return lambda **params: self.aws.call(operation, region=self.region_name, **params)
+
+    def get_paginator(self, operation):
+        return FakePaginator(self.aws, operation)
+
+
+class FakePaginator:
+    def __init__(self, aws, operation):
+        self.aws = aws
+        self.operation = operation
+
+    def paginate(self, **params):
+        return [self.aws.call(self.operation, **params)]
+
+
+def response_metadata() -> dict:
+    return {'RequestId': '5f8e2c1a-0000-0000-0000-000000000000', 'HTTPStatusCode': 200,
+            'HTTPHeaders': {'content-type': 'text/xml;charset=UTF-8', 'server': 'AmazonEC2'},
+            'RetryAttempts': 0}
+
+
+def builder_instance_detail() -> dict:
+    """The bulk of a real runInstances response that the pipeline never reads."""
+    return {
+        'AmiLaunchIndex': 0, 'Architecture': 'x86_64', 'Hypervisor': 'xen',
+        'Placement': {'AvailabilityZone': 'us-east-1a', 'GroupName': '', 'Tenancy': 'default'},
+        'PrivateDnsName': 'ip-10-0-1-23.ec2.internal', 'PrivateIpAddress': '10.0.1.23',
+        'SubnetId': 'subnet-0123456789abcdef0', 'VpcId': 'vpc-0123456789abcdef0',
+        'NetworkInterfaces': [{
+            'Attachment': {'AttachmentId': 'eni-attach-0123456789abcdef0', 'DeviceIndex': 0,
+                           'Status': 'attaching', 'DeleteOnTermination': True},
+            'Groups': [{'GroupId': 'sg-0123456789abcdef0', 'GroupName': 'builder'}],
+            'MacAddress': '0a:1b:2c:3d:4e:5f', 'NetworkInterfaceId': 'eni-0123456789abcdef0',
+            'OwnerId': fixtures.ACCOUNT_ID, 'PrivateIpAddress': '10.0.1.23',
+            'PrivateIpAddresses': [{'Primary': True, 'PrivateIpAddress': '10.0.1.23'}],
+            'SourceDestCheck': True, 'Status': 'in-use', 'InterfaceType': 'interface'
+        }],
+        'SecurityGroups': [{'GroupId': 'sg-0123456789abcdef0', 'GroupName': 'builder'}],
+        'CpuOptions': {'CoreCount': 1, 'ThreadsPerCore': 2},
+        'MetadataOptions': {'State': 'pending', 'HttpTokens': 'required', 'HttpPutResponseHopLimit': 2,
+                            'HttpEndpoint': 'enabled'},
+        'EnclaveOptions': {'Enabled': False}, 'BootMode': 'uefi', 'PlatformDetails': 'Windows',
+        'UsageOperation': 'RunInstances:0002', 'RootDeviceName': '/dev/sda1', 'RootDeviceType': 'ebs',
+        'PrivateDnsNameOptions': {'HostnameType': 'ip-name', 'EnableResourceNameDnsARecord': False},
+        'ResponseMetadata': response_metadata()
+    }
+
+
+def ledger_update_item(ledger):
+    """The dynamodb:updateItem integration of the Record* states, applied to a local ledger."""
+    def update_item(params: dict) -> dict:
+        values = {name[1:]: next(iter(value.values()))
+                  for name, value in params['ExpressionAttributeValues'].items()}
+        stage = values.pop('Stage')
+        for derived in ('StageIndex', 'UpdatedAt'):
+            values.pop(derived)
+        ledger.record_stage(params['Key']['BakeKey']['S'], stage, values)
+        return {}
+    return update_item
+
+
+def build_tasks(aws, ledger=None) -> dict:
+    tasks = {}
+    for state_name, filename in HANDLER_FILES.items():
+        module = load_handler(filename)
+        module.get_client = aws.get_client
+        # Run through the dispatcher, as deployed, so every Task's action is checked
+        tasks[state_name] = lambda payload: dispatcher.lambda_handler(payload, None)
+    tasks['arn:aws:states:::aws-sdk:ec2:runInstances'] = lambda p: aws.call('run_instances', **p)
+    tasks['arn:aws:states:::aws-sdk:ec2:createImage'] = lambda p: aws.call('create_image', **p)
+    tasks['arn:aws:states:::sns:publish'] = lambda p: aws.call('publish', **p)
+    ledger = ledger or bake_ledger.SQLiteBakeLedger()
+    bake_ledger.set_bake_ledger(ledger)
+    tasks['arn:aws:states:::dynamodb:updateItem'] = ledger_update_item(ledger)
+    return tasks
+
+
+def child_executions(children: dict, tasks: dict, clock, reports: list):
+    """The startExecution.sync:2 integration, running child definitions by ARN on the same clock."""
+    def start_execution(params: dict) -> dict:
+        child = local_stepfunctions.LocalStateMachine(children[params['StateMachineArn']], tasks, clock)
+        report = child.run(params['Input'])
+        reports.append(report)
+        if report.status != 'SUCCEEDED':
+            raise local_stepfunctions.StatesError('States.TaskFailed', f"{report.error}: {report.cause}")
+        return {'Output': report.output, 'Status': report.status}
+    return start_execution
+
+
+def run_definition(path: str, runs: int, seed: int, accelerate: bool = False,
+                   refresh: bool = False, regions: list = (), shortage: float = 0.0) -> dict:
+    with open(path) as f:
+        return run_pipeline(json.load(f), runs, seed, accelerate, refresh, label=path, regions=regions,
+                            shortage=shortage)
+
+
+def run_pipeline(definition: dict, runs: int, seed: int, accelerate: bool = False,
+                 refresh: bool = False, label: str = 'definition', children: dict = None,
+                 regions: list = (), shortage: float = 0.0) -> dict:
+    """Run a definition; children maps state machine ARNs to Express child definitions.
+
+    With regions the ASG is tagged to copy each baked AMI there, and the
+    summary gets the distribution report entry of every region. With a
+    shortage, that fraction of runs has no capacity for the group's instance
+    type in the builder subnet's AZ, and the group lists a fallback subnet.
+    """
+    rng = random.Random(seed)
+    summaries = []
+    for _ in range(runs):
+        clock = local_stepfunctions.VirtualClock()
+        polling.clock = clock.time
+        metadata_cache.cache.clear()
+        aws = FakeAws(clock,
+                      instance_ready_after=200 * math.exp(rng.gauss(0, 0.35)),
+                      sysprep_seconds=240 * math.exp(rng.gauss(0, 0.4)),
+                      ami_seconds=600 * math.exp(rng.gauss(0, 0.6)),
+                      asg_tags=(ACCELERATION_TAGS if accelerate else []) + (REFRESH_TAGS if refresh else [])
+                      + ([{'Key': 'ami-bake:copy-regions', 'Value': ','.join(regions)}] if regions else [])
+                      + (FALLBACK_SUBNET_TAGS if shortage else []))
+        if shortage and rng.random() < shortage:
+            aws.no_capacity.add(('m5.large', 'us-east-1a'))
+        for index, region in enumerate(regions):
+            aws.regions[region] = FakeRegion(clock, index, copy_seconds=1200 * math.exp(rng.gauss(0, 0.5)))
+        tasks, child_reports, regional, launch = build_tasks(aws), [], {}, {}
+        launch_builder = tasks['LaunchInstance']
+        tasks['LaunchInstance'] = lambda payload: launch.setdefault('Result', launch_builder(payload))
+        # cleanup replaces the state, so keep the regional report as it is returned
+        update_regions = tasks['UpdateRegionalASGs']
+        tasks['UpdateRegionalASGs'] = lambda payload: regional.setdefault('Report', update_regions(payload))
+        tasks[CHILD_EXECUTION_RESOURCE] = child_executions(children or {}, tasks, clock, child_reports)
+        machine = local_stepfunctions.LocalStateMachine(definition, tasks, clock)
+        report = machine.run({'backupJobId': 'job-1'})
+        if report.status != 'SUCCEEDED':
+            raise SystemExit(f"{label}: execution failed: {report.error} {report.cause}")
+        summary = report.summary()
+        summary['ApiCalls'] = sum(aws.calls.values())
+        summary['ChildExecutions'] = len(child_reports)
+        summary['ChildTransitions'] = sum(child.transitions for child in child_reports)
+        summary['LambdaInvocations'] += sum(child.lambda_invocations for child in child_reports)
+        if 'Result' in launch:
+            summary['Builder'] = (f"{launch['Result']['InstanceType']} in {launch['Result']['AvailabilityZone']}"
+                                  f" after {len(launch['Result']['Attempts'])} attempts")
+        summary['Regions'] = {entry['Region']: entry for entry in regional.get('Report', {}).get('Regions', [])}
+        summaries.append(summary)
+    return summaries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Offline end-to-end pipeline benchmark')
+    parser.add_argument('definitions', nargs='*', default=[f"{REPO_ROOT}/StepFunction_v4"])
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--accelerate', action='store_true',
+                        help='tag the ASG for Fast Launch and Fast Snapshot Restore')
+    parser.add_argument('--refresh', action='store_true',
+                        help='tag the ASG for an instance refresh after the switch')
+    parser.add_argument('--regions', type=lambda value: value.split(','), default=[],
+                        help='comma-separated regions to copy the AMI to, e.g. us-west-2,eu-west-1')
+    parser.add_argument('--shortage', type=float, default=0.0,
+                        help="fraction of runs without capacity for the group's instance type in the "
+                             "builder subnet's AZ; the group gets a fallback subnet")
+    args = parser.parse_args()
+
+    for path in args.definitions:
+        summaries = run_definition(path, args.runs, args.seed, args.accelerate, args.refresh, args.regions,
+                                   args.shortage)
+        mean = lambda key: statistics.mean(s[key] for s in summaries)
+        print(f"{path}: {args.runs} runs")
+        print(f"  simulated wall time mean={mean('SimulatedSeconds'):8.1f}s  "
+              f"lambda invocations mean={mean('LambdaInvocations'):6.1f}  "
+              f"state transitions mean={mean('StateTransitions'):6.1f}  "
+              f"AWS API calls mean={mean('ApiCalls'):6.1f}")
+        print(f"  max payload={max(s['MaxPayloadBytes'] for s in summaries)} bytes")
+        builders = [s['Builder'] for s in summaries if 'Builder' in s]
+        for builder in sorted(set(builders)):
+            print(f"  builder {builder}: {builders.count(builder)} runs")
+        for region in args.regions:
+            entries = [s['Regions'].get(region, {}) for s in summaries]
+            failed = sum(entry.get('Status') != 'Updated' for entry in entries)
+            if failed:
+                print(f"  {region}: not updated in {failed} runs")
+                continue
+            print(f"  {region}: copy available mean={statistics.mean(e['CopySeconds'] for e in entries):8.1f}s  "
+                  f"ASG switched mean={statistics.mean(e['TotalSeconds'] for e in entries):8.1f}s after the copy request")
+        for state, size in summaries[-1]['PayloadBytesByState'].items():
+            print(f"    {state:<32} {size:>7} bytes")
+
+
+if __name__ == '__main__':
+    main()
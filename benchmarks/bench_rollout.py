@@ -0,0 +1,55 @@
+"""Rollout throughput as the number of ASGs grows, against stubbed clients.
+
+Each target makes a fixed number of EC2 calls with simulated service latency;
+all targets share one EC2 token bucket. Usage:
+python benchmarks/bench_rollout.py [concurrency] [ec2_rate_per_second]
+"""
+import sys
+import time
+
+import fixtures
+from _support import StubbedClients
+
+import rollout_orchestrator
+
+CALLS_PER_TARGET = 5
+CALL_LATENCY_SECONDS = 0.02
+FAILURE_EVERY = 25
+STATUS_RESPONSE = {'InstanceStatuses': []}
+
+
+def make_pipeline(ec2):
+    def pipeline(target):
+        index = int(target['AutoScalingGroupName'].rsplit('-', 1)[-1])
+        for _ in range(CALLS_PER_TARGET):
+            ec2.describe_instance_status(InstanceIds=[fixtures.instance_id(index)])
+            time.sleep(CALL_LATENCY_SECONDS)
+        # Prove that one failing target does not stop the rest
+        if index % FAILURE_EVERY == FAILURE_EVERY - 1:
+            raise RuntimeError('simulated failure')
+        return {'ok': True}
+    return pipeline
+
+
+def main(concurrency: int, rate: float) -> None:
+    print(f"concurrency={concurrency} ec2 rate={rate}/s calls/target={CALLS_PER_TARGET} "
+          f"latency/call={CALL_LATENCY_SECONDS * 1000:.0f}ms")
+    for target_count in (10, 50, 200, 500):
+        stubs = StubbedClients('ec2')
+        for _ in range(target_count * CALLS_PER_TARGET):
+            stubs.add('ec2', 'describe_instance_status', STATUS_RESPONSE)
+        targets = [{'AutoScalingGroupName': fixtures.asg_name(i)} for i in range(target_count)]
+        report = rollout_orchestrator.run_rollout(
+            targets, make_pipeline(stubs.stubbers['ec2'].client), concurrency, {'ec2': rate}
+        )
+        stubs.assert_done()
+        limiter = report['RateLimiters']['ec2']
+        print(f"N={target_count:<5} elapsed={report['ElapsedSeconds']:8.2f}s "
+              f"targets/min={report['TargetsPerMinute']:9.1f} failed={report['Failed']:<3} "
+              f"p95 target={report['TargetDurationSeconds']['p95']:.2f}s "
+              f"limiter wait={limiter['WaitedSeconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 100)
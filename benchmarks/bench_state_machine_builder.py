@@ -0,0 +1,84 @@
+"""Payload size and transitions of the generated state machines, offline.
+
+Builds StepFunction_v4 three ways with state_machine_builder and runs each in
+bench_pipeline's simulated account: the checked-in template, the compacted
+build (ResultSelectors on the fixed-shape service integrations) and the
+compacted build with the short polling loops split into Express children.
+Express transitions are billed per request and duration instead of per
+transition, so they are reported separately. Every generated definition and
+child is validated first, and both checked-in definitions are validated with
+their placeholders rendered.
+Usage: python benchmarks/bench_state_machine_builder.py [--runs N]
+"""
+import os
+import json
+import argparse
+import statistics
+
+from _support import REPO_ROOT
+
+import bench_pipeline
+import state_machine_builder
+
+CONFIG_PATH = os.path.join(REPO_ROOT, 'state-machine-config.example.json')
+DEFINITIONS = ['StepFunction_v4', 'StepFunction_callback_v1']
+
+
+def load(name: str) -> dict:
+    with open(os.path.join(REPO_ROOT, name)) as f:
+        return json.load(f)
+
+
+def check(label: str, definition: dict, express: bool = False) -> None:
+    problems = state_machine_builder.validate(definition, express)
+    if problems:
+        raise SystemExit(f"{label}: " + '; '.join(problems))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generated state machine benchmark')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with open(CONFIG_PATH) as f:
+        config = state_machine_builder.BakeConfig.from_dict(json.load(f))
+    for name in DEFINITIONS:
+        for express in (False, True):
+            definition, children = state_machine_builder.build(load(name), config, express=express)
+            check(name, definition)
+            for check_name, child in children.items():
+                check(f"{name}.{check_name}", child, express=True)
+        print(f"{name}: valid (compact, compact+express)")
+
+    template = load('StepFunction_v4')
+    variants = {
+        'template': (state_machine_builder.render(template, config), {}),
+        'compact': state_machine_builder.build(template, config),
+        'compact+express': state_machine_builder.build(template, config, express=True),
+    }
+    results = {}
+    for label, (definition, children) in variants.items():
+        by_arn = {config.poll_state_machine_arns[check_name]: child for check_name, child in children.items()}
+        results[label] = bench_pipeline.run_pipeline(definition, args.runs, args.seed, label=label,
+                                                     children=by_arn)
+
+    print(f"\nStepFunction_v4, {args.runs} runs")
+    print(f"{'variant':<16} {'max payload':>12} {'standard transitions':>21} "
+          f"{'express transitions':>20} {'lambdas':>8} {'simulated s':>12}")
+    for label, summaries in results.items():
+        mean = lambda key: statistics.mean(s[key] for s in summaries)
+        print(f"{label:<16} {max(s['MaxPayloadBytes'] for s in summaries):>12} "
+              f"{mean('StateTransitions'):21.1f} {mean('ChildTransitions'):20.1f} "
+              f"{mean('LambdaInvocations'):8.1f} {mean('SimulatedSeconds'):12.1f}")
+
+    print('\nLargest payload per state, template -> compact')
+    before, after = results['template'][-1], results['compact'][-1]
+    for state, size in before['PayloadBytesByState'].items():
+        compacted = after['PayloadBytesByState'].get(state)
+        marker = '' if compacted == size else '  *'
+        print(f"  {state:<32} {size:>7} -> {compacted:>7} bytes{marker}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Launch template lookup cost: fetching every version vs asking for $Latest/$Default.
+
+Usage: python benchmarks/bench_template_versions.py [version_count] [iterations]
+"""
+import json
+import sys
+
+import fixtures
+from _support import StubbedClients, load_handler, measure, summarize
+
+update_asg = load_handler('updateASG_v1.py')
+
+# DescribeLaunchTemplateVersions returns at most 200 versions per page
+PAGE_SIZE = 200
+
+
+def all_versions_pages(version_count: int) -> list:
+    versions = [fixtures.launch_template_version(1, n, fixtures.ami_id(n),
+                                                 default=n == version_count)
+                for n in range(version_count, 0, -1)]
+    pages = []
+    for start in range(0, version_count, PAGE_SIZE):
+        page = {'LaunchTemplateVersions': versions[start:start + PAGE_SIZE]}
+        if start + PAGE_SIZE < version_count:
+            page['NextToken'] = f"token-{start + PAGE_SIZE}"
+        pages.append(page)
+    return pages
+
+
+def full_listing_lookup(ec2_client, launch_template_name: str) -> tuple:
+    """The previous approach, made pagination-correct: download every version."""
+    versions = []
+    paginator = ec2_client.get_paginator('describe_launch_template_versions')
+    for page in paginator.paginate(LaunchTemplateName=launch_template_name):
+        versions.extend(page['LaunchTemplateVersions'])
+    latest = max(versions, key=lambda version: version['VersionNumber'])
+    return latest['VersionNumber'], latest['LaunchTemplateData']['ImageId']
+
+
+def run(label: str, version_count: int, iterations: int, lookup, pages_per_call: list) -> None:
+    stubs = StubbedClients('ec2')
+    for _ in range(iterations):
+        for page in pages_per_call:
+            stubs.add('ec2', 'describe_launch_template_versions', page)
+    ec2 = stubs.stubbers['ec2'].client
+    results = set()
+    latencies = measure(
+        lambda: results.add(lookup(ec2, fixtures.launch_template_name(1))), iterations
+    )
+    stubs.assert_done()
+    assert results == {(version_count, fixtures.ami_id(version_count))}, results
+    response_bytes = sum(len(json.dumps(page, default=str)) for page in pages_per_call)
+    print(summarize(label, latencies))
+    print(f"{'':<40} calls/lookup={len(pages_per_call)} bytes/lookup={response_bytes}")
+
+
+def main(version_count: int, iterations: int) -> None:
+    latest = fixtures.launch_template_version(1, version_count, fixtures.ami_id(version_count),
+                                              default=True)
+    run(f"all {version_count} versions (paginated)", version_count, iterations,
+        full_listing_lookup, all_versions_pages(version_count))
+    run('$Latest/$Default only', version_count, iterations,
+        update_asg.get_latest_template_version, [{'LaunchTemplateVersions': [latest]}])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
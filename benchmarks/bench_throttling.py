@@ -0,0 +1,264 @@
+"""Fault injection: replay throttling responses through the real botocore retry path.
+
+A before-send hook answers each HTTP request itself. Like the EC2 and Auto
+Scaling APIs, it throttles by request rate: each service has a token bucket of
+SERVICE_LIMITS, of which other callers in the account use a share (`load`), and
+an attempt that finds the bucket empty gets RequestLimitExceeded/Throttling.
+Retries, backoff and the adaptive rate limiter behave as they would against
+AWS. The status-check handlers and an update_auto_scaling_group call run once
+with botocore's default retry settings and once with the shared client policy
+from aws_clients. The report shows completed rounds and their latency.
+
+Each attempt takes ATTEMPT_SECONDS. Backoff sleeps, botocore's adaptive rate
+limiter, the client token buckets and the throttling model all run on a
+virtual clock, so the report shows simulated latency and the run takes seconds.
+The shared policy must complete every round. Each round must finish within
+ROUND_LATENCY_BOUND_SECONDS plus ROUND_LATENCY_BOUND_FACTOR times the time the
+rate left by the other callers needs for its calls: 3.6s at the default load.
+Usage: python benchmarks/bench_throttling.py [calls] [load]
+"""
+import os
+import sys
+import types
+import random
+import threading
+from unittest import mock
+
+os.environ['AWS_CLIENT_RATE_LIMITS'] = '{"ec2": 20, "autoscaling": 10}'
+
+from _support import load_handler, summarize
+
+import boto3
+import botocore.endpoint
+import botocore.retries.bucket
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+check_instance = load_handler('check-instance-state_v1.py')
+check_ami = load_handler('check-ami-status-function_v1.py')
+
+INSTANCE_ID = 'i-0123456789abcdef0'
+IMAGE_ID = 'ami-0123456789abcdef0'
+EC2_NS = 'http://ec2.amazonaws.com/doc/2016-11-15/'
+ASG_NS = 'http://autoscaling.amazonaws.com/doc/2011-01-01/'
+SUCCESS_BODIES = {
+    'DescribeInstanceStatus': (
+        f'<DescribeInstanceStatusResponse xmlns="{EC2_NS}"><requestId>1</requestId>'
+        f'<instanceStatusSet><item><instanceId>{INSTANCE_ID}</instanceId>'
+        '<instanceState><code>16</code><name>running</name></instanceState>'
+        '<systemStatus><status>ok</status></systemStatus>'
+        '<instanceStatus><status>ok</status></instanceStatus></item></instanceStatusSet>'
+        '</DescribeInstanceStatusResponse>'
+    ),
+    'DescribeImages': (
+        f'<DescribeImagesResponse xmlns="{EC2_NS}"><requestId>1</requestId><imagesSet><item>'
+        f'<imageId>{IMAGE_ID}</imageId><imageState>available</imageState></item></imagesSet>'
+        '</DescribeImagesResponse>'
+    ),
+    'UpdateAutoScalingGroup': (
+        f'<UpdateAutoScalingGroupResponse xmlns="{ASG_NS}"><ResponseMetadata>'
+        '<RequestId>1</RequestId></ResponseMetadata></UpdateAutoScalingGroupResponse>'
+    ),
+}
+# Requests per second and burst each service accepts from the whole account
+SERVICE_LIMITS = {'ec2': (10.0, 10.0), 'auto-scaling': (5.0, 5.0)}
+# Simulated round trip of one HTTP attempt
+ATTEMPT_SECONDS = 0.05
+# Calls per round; a round cannot finish faster than the remaining rate allows
+ROUND_CALLS = {'ec2': 2, 'auto-scaling': 1}
+# With the shared policy a round may take this many simulated seconds plus
+# ROUND_LATENCY_BOUND_FACTOR times that minimum
+ROUND_LATENCY_BOUND_SECONDS = 2
+ROUND_LATENCY_BOUND_FACTOR = 4
+THROTTLE_BODIES = {
+    'ec2': ('<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+            '<Message>Request limit exceeded.</Message></Error></Errors>'
+            '<RequestID>1</RequestID></Response>'),
+    'auto-scaling': ('<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code>'
+                     '<Message>Rate exceeded</Message></Error><RequestId>1</RequestId></ErrorResponse>'),
+}
+
+
+def round_latency_bound(load: float) -> float:
+    """Simulated seconds a round may take with the shared policy when others use load."""
+    minimum = max(calls / (SERVICE_LIMITS[service_id][0] * (1 - load))
+                  for service_id, calls in ROUND_CALLS.items())
+    return ROUND_LATENCY_BOUND_SECONDS + ROUND_LATENCY_BOUND_FACTOR * minimum
+
+
+class RawBody:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class ThrottleInjector:
+    """Answer requests locally, throttling attempts beyond the service's request rate."""
+
+    def __init__(self, clock, load: float):
+        self.clock = clock
+        # Other callers in the account take this share of every service's rate
+        self.limits = {service_id: (rate * (1 - load), max(1.0, burst * (1 - load)))
+                       for service_id, (rate, burst) in SERVICE_LIMITS.items()}
+        self.tokens = {service_id: burst for service_id, (_, burst) in self.limits.items()}
+        self.updated_at = {service_id: clock.time() for service_id in self.limits}
+        self.attempts = 0
+        self.throttled = 0
+
+    def _admit(self, service_id: str) -> bool:
+        rate, burst = self.limits[service_id]
+        now = self.clock.time()
+        self.tokens[service_id] = min(burst, self.tokens[service_id]
+                                      + (now - self.updated_at[service_id]) * rate)
+        self.updated_at[service_id] = now
+        if self.tokens[service_id] >= 1:
+            self.tokens[service_id] -= 1
+            return True
+        return False
+
+    def __call__(self, request, **kwargs):
+        self.attempts += 1
+        _, service_id, operation = kwargs['event_name'].split('.')
+        self.clock.sleep(ATTEMPT_SECONDS)
+        if not self._admit(service_id):
+            self.throttled += 1
+            return AWSResponse(request.url, 503 if service_id == 'ec2' else 400, {},
+                               RawBody(THROTTLE_BODIES[service_id].encode()))
+        return AWSResponse(request.url, 200, {}, RawBody(SUCCESS_BODIES[operation].encode()))
+
+    def attach(self, client):
+        service_id = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f"before-send.{service_id}", self)
+
+
+class VirtualClock:
+    """Simulated time; sleeping advances it instead of blocking."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += max(0.0, seconds)
+
+
+class VirtualCondition(threading.Condition):
+    """The condition the adaptive token bucket waits on for refills."""
+
+    def __init__(self, clock: VirtualClock, lock=None):
+        super().__init__(lock)
+        self.clock = clock
+
+    def wait(self, timeout=None):
+        # A real wait always takes a moment; a sub-ulp timeout would never advance the clock
+        self.clock.sleep(max(timeout or 0, 1e-6))
+        return False
+
+
+def virtual_time(clock: VirtualClock):
+    """Patch botocore's retry sleep and adaptive rate limiter onto the clock.
+
+    Clients must be created inside, since the adaptive limiter reads its clock
+    and creates its condition when the client is built.
+    """
+    virtual = types.SimpleNamespace(time=clock.time, sleep=clock.sleep)
+    patches = [
+        mock.patch.object(botocore.endpoint, 'time', virtual),
+        mock.patch.object(botocore.retries.bucket, 'time', virtual),
+        mock.patch.object(botocore.retries.bucket, 'threading', types.SimpleNamespace(
+            Lock=threading.Lock, Condition=lambda lock=None: VirtualCondition(clock, lock))),
+    ]
+    for patch in patches:
+        patch.start()
+    return patches
+
+
+def failure_reason(error: Exception) -> str:
+    """Describe why botocore gave up on a call."""
+    if not isinstance(error, ClientError):
+        return type(error).__name__
+    metadata = error.response.get('ResponseMetadata', {})
+    quota = ', retry quota reached' if metadata.get('RetryQuotaReached') else ''
+    return f"{error.response['Error']['Code']} after {metadata.get('RetryAttempts', 0)} retries{quota}"
+
+
+def default_clients():
+    """Clients as the handlers used to build them: botocore's default retry settings."""
+    clients = {name: boto3.client(name, region_name='us-east-1') for name in ('ec2', 'autoscaling')}
+    return lambda service_name, region_name=None: clients[service_name]
+
+
+def policy_clients(clock: VirtualClock):
+    aws_clients.reset_clients()
+    for service_name in ('ec2', 'autoscaling'):
+        aws_clients.get_client(service_name)
+    # The container-wide token buckets wait on the same simulated time
+    for bucket in aws_clients._rate_limiters.values():
+        bucket.clock, bucket.sleep = clock.time, clock.sleep
+        bucket.updated_at = clock.time()
+    return aws_clients.get_client
+
+
+def one_round(get_client):
+    check_instance.lambda_handler({'InstanceId': INSTANCE_ID}, None)
+    check_ami.lambda_handler({'BackupAMIId': IMAGE_ID}, None)
+    get_client('autoscaling').update_auto_scaling_group(
+        AutoScalingGroupName='bake-asg', MaxSize=4
+    )
+
+
+def run(label: str, make_clients, calls: int, load: float) -> dict:
+    clock = VirtualClock()
+    patches = virtual_time(clock)
+    # botocore draws its backoff jitter from the random module
+    random.seed(7)
+    try:
+        get_client = make_clients(clock)
+        injector = ThrottleInjector(clock, load)
+        for service_name in ('ec2', 'autoscaling'):
+            injector.attach(get_client(service_name))
+        check_instance.get_client = check_ami.get_client = get_client
+        completed, failures, latencies = 0, {}, []
+        for _ in range(calls):
+            started = clock.time()
+            try:
+                one_round(get_client)
+                completed += 1
+                latencies.append((clock.time() - started) * 1000)
+            except Exception as e:
+                reason = failure_reason(e)
+                failures[reason] = failures.get(reason, 0) + 1
+        elapsed = clock.time()
+    finally:
+        for patch in patches:
+            patch.stop()
+    print(summarize(f"{label}: simulated latency of completed rounds", latencies))
+    print(f"  rounds completed {completed}/{calls} in {elapsed:.1f}s, slowest "
+          f"{max(latencies, default=0) / 1000:.1f}s, HTTP attempts "
+          f"{injector.attempts}, throttled {injector.throttled}, failures {failures or 'none'}")
+    return {'completed': completed, 'failures': failures,
+            'max_latency_ms': max(latencies, default=0)}
+
+
+def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    load = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    print(f"{calls} rounds of 3 calls, other callers use {load:.0%} of "
+          + ', '.join(f"{service_id} {rate:g}/s" for service_id, (rate, _) in SERVICE_LIMITS.items()))
+    run('botocore defaults', lambda clock: default_clients(), calls, load)
+    policy = run(f"shared policy ({aws_clients.RETRY_MODE}, {aws_clients.SERVICE_MAX_ATTEMPTS})",
+                 policy_clients, calls, load)
+    bound = round_latency_bound(load)
+    assert policy['completed'] == calls, f"Shared policy failed rounds: {policy['failures']}"
+    assert policy['max_latency_ms'] <= bound * 1000, (
+        f"Slowest round took {policy['max_latency_ms'] / 1000:.1f}s, bound {bound:.1f}s")
+    print(f"shared policy: every round completed within {bound:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import datetime
+
+REGION = 'us-east-1'
+ACCOUNT_ID = '123456789012'
+CREATED = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def instance_id(index: int) -> str:
+    return f"i-{index:017x}"
+
+
+def ami_id(index: int) -> str:
+    return f"ami-{index:017x}"
+
+
+def asg_name(index: int) -> str:
+    return f"app-asg-{index}"
+
+
+def launch_template_id(index: int) -> str:
+    return f"lt-{index:017x}"
+
+
+def launch_template_name(index: int) -> str:
+    return f"app-lt-{index}"
+
+
+def backup_job(index: int) -> dict:
+    """describe_backup_job response for the backup of instance index."""
+    return {
+        'BackupJobId': f"job-{index}",
+        'RecoveryPointArn': f"arn:aws:ec2:{REGION}::image/{ami_id(index)}",
+        'ResourceArn': f"arn:aws:ec2:{REGION}:{ACCOUNT_ID}:instance/{instance_id(index)}",
+        'State': 'COMPLETED'
+    }
+
+
+def instance(index: int, asg_index: int = None, instance_type: str = 'm5.large') -> dict:
+    """An Instance shape as returned by describe_instances."""
+    tags = [{'Key': 'Name', 'Value': f"app-{index}"}]
+    if asg_index is not None:
+        tags.append({'Key': 'aws:autoscaling:groupName', 'Value': asg_name(asg_index)})
+    return {
+        'InstanceId': instance_id(index),
+        'InstanceType': instance_type,
+        'ImageId': ami_id(0),
+        'State': {'Code': 16, 'Name': 'running'},
+        'Tags': tags
+    }
+
+
+def describe_instances(instances: list) -> dict:
+    return {'Reservations': [{'ReservationId': f"r-{i:017x}", 'Instances': [inst]}
+                             for i, inst in enumerate(instances)]}
+
+
+def auto_scaling_instance(index: int, asg_index: int, instance_type: str = 'm5.large') -> dict:
+    """An AutoScalingInstanceDetails shape as returned by describe_auto_scaling_instances."""
+    return {
+        'InstanceId': instance_id(index),
+        'InstanceType': instance_type,
+        'AutoScalingGroupName': asg_name(asg_index),
+        'AvailabilityZone': f"{REGION}a",
+        'LifecycleState': 'InService',
+        'HealthStatus': 'HEALTHY',
+        'LaunchTemplate': {
+            'LaunchTemplateId': launch_template_id(asg_index),
+            'LaunchTemplateName': launch_template_name(asg_index),
+            'Version': '1'
+        },
+        'ProtectedFromScaleIn': False
+    }
+
+
+def describe_auto_scaling_instances(members: list) -> dict:
+    return {'AutoScalingInstances': members}
+
+
+def auto_scaling_group(index: int, desired: int = 2, max_size: int = 4,
+                       template_version: str = '$Default') -> dict:
+    """An AutoScalingGroup shape as returned by describe_auto_scaling_groups."""
+    return {
+        'AutoScalingGroupName': asg_name(index),
+        'LaunchTemplate': {
+            'LaunchTemplateId': launch_template_id(index),
+            'LaunchTemplateName': launch_template_name(index),
+            'Version': template_version
+        },
+        'MinSize': 1,
+        'MaxSize': max_size,
+        'DesiredCapacity': desired,
+        'DefaultCooldown': 300,
+        'AvailabilityZones': [f"{REGION}a", f"{REGION}b"],
+        'HealthCheckType': 'EC2',
+        'CreatedTime': CREATED,
+        'Instances': [],
+        'Tags': []
+    }
+
+
+def describe_auto_scaling_groups(groups: list) -> dict:
+    return {'AutoScalingGroups': groups}
+
+
+def launch_template_version(index: int, version: int, image_id: str,
+                            default: bool = False) -> dict:
+    """A LaunchTemplateVersion shape."""
+    return {
+        'LaunchTemplateId': launch_template_id(index),
+        'LaunchTemplateName': launch_template_name(index),
+        'VersionNumber': version,
+        'DefaultVersion': default,
+        'CreateTime': CREATED,
+        'LaunchTemplateData': {'ImageId': image_id, 'InstanceType': 'm5.large'}
+    }
+
+
+def launch_template(index: int, default_version: int, latest_version: int) -> dict:
+    """A LaunchTemplate shape."""
+    return {
+        'LaunchTemplateId': launch_template_id(index),
+        'LaunchTemplateName': launch_template_name(index),
+        'DefaultVersionNumber': default_version,
+        'LatestVersionNumber': latest_version,
+        'CreateTime': CREATED
+    }
@@ -0,0 +1,56 @@
+"""Replay recorded EventBridge events through task-token-callback_v1 locally.
+
+A task token is registered for every event, the Step Functions client is
+stubbed, and each event is delivered twice to show that duplicates are ignored.
+Events that are not completion events are skipped.
+Usage: python benchmarks/replay_callback_events.py [event.json ...]
+"""
+import glob
+import json
+import os
+import sys
+
+from _support import REPO_ROOT, StubbedClients, load_handler
+
+from botocore.stub import ANY
+
+import completion_events
+import task_token_store
+
+callback = load_handler('task-token-callback_v1.py')
+
+
+def main(paths: list) -> None:
+    store = task_token_store.InMemoryTaskTokenStore()
+    task_token_store.set_task_token_store(store)
+    stubs = StubbedClients('stepfunctions')
+
+    events = []
+    for path in paths:
+        with open(path) as f:
+            event = json.load(f)
+        wait_for, resource_id, outcome, _ = completion_events.parse_event(event)
+        if wait_for is None:
+            # e.g. the Backup events consumed by coalesce-backup-events_v1
+            print(f"skipped    {os.path.basename(path):<32} not a completion event")
+            continue
+        token = f"token-{len(events)}"
+        store.put(wait_for, resource_id, token)
+        if outcome == completion_events.FAILURE:
+            stubs.add('stepfunctions', 'send_task_failure', {},
+                      {'taskToken': token, 'error': f"{wait_for}.Failed", 'cause': ANY})
+        else:
+            stubs.add('stepfunctions', 'send_task_success', {},
+                      {'taskToken': token, 'output': ANY})
+        events.append((os.path.basename(path), event))
+
+    for delivery in ('first', 'duplicate'):
+        for name, event in events:
+            result = callback.lambda_handler(event, None)
+            print(f"{delivery:<10} {name:<32} {result}")
+    stubs.assert_done()
+    print(f"Step Functions calls: {stubs.calls}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join(REPO_ROOT, 'events', '*.json'))))
@@ -0,0 +1,117 @@
+"""Simulate fixed-interval polling vs the adaptive backoff policies.
+
+Readiness times are drawn from log-normal distributions; for each strategy the
+simulation reports how long after readiness the pipeline noticed it, and how
+many Lambda invocations and state transitions the polling loop cost.
+It fails if the adaptive schedule of any resource costs more invocations than
+today's fixed wait, or if a state machine's Init*Poll wait differs from the
+policy's first_wait_seconds.
+Needs no AWS SDK. Usage: python benchmarks/simulate_polling.py [runs] [seed]
+"""
+import os
+import json
+import math
+import random
+import statistics
+import sys
+
+from _support import REPO_ROOT
+from polling import POLICIES, PollingDeadlineExceeded
+
+# resource type -> (median seconds until ready, log-normal sigma, fixed wait today)
+RESOURCES = {
+    'instance-status': (200, 0.35, 240),
+    'ami': (600, 0.6, 5),
+    # Today's pipeline waits 60s once without checking; modelled as a 60s poll loop
+    'sysprep': (240, 0.4, 60),
+}
+# Init*Poll states that wait before the first check, per state machine
+INIT_POLL_STATES = {
+    'StepFunction_v4': {'InitInstancePoll': 'instance-status', 'InitSysprepPoll': 'sysprep'},
+    'StepFunction_callback_v1': {'InitInstancePoll': 'instance-status'},
+}
+
+
+def check_initial_waits() -> None:
+    """The definitions hard-code the first wait; it must match the policies."""
+    for filename, states in INIT_POLL_STATES.items():
+        with open(os.path.join(REPO_ROOT, filename)) as f:
+            definition = json.load(f)
+        for state_name, resource_type in states.items():
+            waits = definition['States'][state_name]['Result']
+            expected = POLICIES[resource_type].first_wait_seconds
+            assert waits['nextWaitSeconds'] == waits['pollState']['initialWaitSeconds'] == expected, (
+                f"{filename} {state_name} waits {waits['nextWaitSeconds']}s, "
+                f"{resource_type} first_wait_seconds is {expected}")
+
+
+def simulate_fixed(ready_at: float, interval: float) -> tuple:
+    """Today's loop: Wait(interval) -> Check -> Choice, repeated until ready."""
+    now, checks = 0.0, 0
+    while True:
+        now += interval
+        checks += 1
+        if now >= ready_at:
+            # Wait + Task + Choice per check
+            return now, checks, checks * 3
+
+
+def simulate_adaptive(ready_at: float, policy, rng: random.Random) -> tuple:
+    """Init Pass -> [Wait(first_wait_seconds)] -> Check -> Choice -> Wait(SecondsPath) -> Check ..."""
+    now, checks = float(policy.first_wait_seconds), 0
+    while True:
+        checks += 1
+        if now >= ready_at:
+            # Pass and the first Wait, then Task + Choice per check and a Wait between checks
+            return now, checks, 1 + (1 if policy.first_wait_seconds else 0) + checks * 3 - 1
+        now += policy.next_wait(now, rng)
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * fraction) - 1)]
+
+
+def report(label: str, delays: list, checks: list, transitions: list) -> None:
+    print(f"  {label:<10} detection delay mean={statistics.mean(delays):7.1f}s "
+          f"p95={percentile(delays, 0.95):7.1f}s | invocations mean={statistics.mean(checks):6.1f} "
+          f"| transitions mean={statistics.mean(transitions):6.1f}")
+
+
+def main(runs: int, seed: int) -> None:
+    check_initial_waits()
+    rng = random.Random(seed)
+    regressions = []
+    for resource_type, (median, sigma, fixed_interval) in RESOURCES.items():
+        policy = POLICIES[resource_type]
+        fixed = ([], [], [])
+        adaptive = ([], [], [])
+        timeouts = 0
+        for _ in range(runs):
+            ready_at = median * math.exp(rng.gauss(0, sigma))
+            done, checks, transitions = simulate_fixed(ready_at, fixed_interval)
+            for series, value in zip(fixed, (done - ready_at, checks, transitions)):
+                series.append(value)
+            try:
+                done, checks, transitions = simulate_adaptive(ready_at, policy, rng)
+            except PollingDeadlineExceeded:
+                timeouts += 1
+                continue
+            for series, value in zip(adaptive, (done - ready_at, checks, transitions)):
+                series.append(value)
+        print(f"{resource_type}: {runs} runs, ready time median {median}s, "
+              f"fixed wait {fixed_interval}s")
+        report('fixed', *fixed)
+        report('adaptive', *adaptive)
+        if timeouts:
+            print(f"  adaptive runs past the {policy.deadline_seconds}s deadline: {timeouts}")
+        if statistics.mean(adaptive[1]) > statistics.mean(fixed[1]):
+            regressions.append(f"{resource_type}: {statistics.mean(adaptive[1]):.2f} invocations "
+                               f"vs {statistics.mean(fixed[1]):.2f} with the fixed wait")
+    assert not regressions, f"Adaptive polling costs more invocations: {'; '.join(regressions)}"
+    print("adaptive polling costs no more invocations than the fixed waits")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 42)
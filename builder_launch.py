@@ -0,0 +1,209 @@
+import copy
+import time
+import hashlib
+import logging
+from typing import Dict, List
+from botocore.exceptions import ClientError
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Auto Scaling group tags that widen the choice of builder instance:
+#   ami-bake:builder-types = ranked instance types tried before the group's own
+#       type, e.g. "m6i.2xlarge,m5.2xlarge" to run Sysprep on a larger instance
+#       or fall back to another family when the group's type has no capacity
+#   ami-bake:builder-subnets = subnets in other Availability Zones tried after
+#       the configured builder subnet, in the same VPC as the builder security group
+BUILDER_TYPES_TAG = 'ami-bake:builder-types'
+BUILDER_SUBNETS_TAG = 'ami-bake:builder-subnets'
+# Put on the builder with the token seed (the execution ID and the backup AMI,
+# since every item of a Map shares the execution ID), so a retry finds the
+# builder it already launched whatever candidate that was
+LAUNCH_TOKEN_TAG = 'ami-bake:launch-token'
+BUILDER_STATES = ['pending', 'running', 'stopping', 'stopped']
+# RunInstances errors that only mean this type or AZ cannot be used right now
+FALLBACK_ERROR_CODES = (
+    'InsufficientInstanceCapacity',
+    'InsufficientCapacity',
+    'Unsupported',
+    'VcpuLimitExceeded',
+)
+
+
+class BuilderLaunchError(Exception):
+    """No instance type and subnet combination could be launched."""
+
+
+def _tag_list(tags: Dict[str, str], key: str) -> List[str]:
+    values = []
+    for value in tags.get(key, '').split(','):
+        if value.strip() and value.strip() not in values:
+            values.append(value.strip())
+    return values
+
+
+def builder_launch_config(asg_group: Dict, instance_type: str) -> Dict:
+    """Read the ranked builder instance types and extra subnets from the group tags.
+
+    The group's own instance type always comes last, so a group without the
+    tags launches exactly as before.
+    """
+    tags = {tag['Key']: tag['Value'] for tag in asg_group.get('Tags', [])}
+    instance_types = [value for value in _tag_list(tags, BUILDER_TYPES_TAG) if value != instance_type]
+    return {
+        'InstanceTypes': instance_types + [instance_type],
+        'SubnetIds': _tag_list(tags, BUILDER_SUBNETS_TAG)
+    }
+
+
+def _describe_architectures(ec2_client, instance_types: List[str]) -> Dict[str, set]:
+    try:
+        return {
+            item['InstanceType']: set(item['ProcessorInfo']['SupportedArchitectures'])
+            for item in ec2_client.describe_instance_types(InstanceTypes=instance_types)['InstanceTypes']
+        }
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidInstanceType' or len(instance_types) < 2:
+            raise
+    described = {}
+    for instance_type in instance_types:
+        try:
+            described.update(_describe_architectures(ec2_client, [instance_type]))
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'InvalidInstanceType':
+                raise
+            logger.warning(f"Skipping builder instance type {instance_type}: unknown to EC2")
+    return described
+
+
+def compatible_instance_types(ec2_client, instance_types: List[str]) -> List[str]:
+    """Keep the types that share an architecture with the last one, the group's own type.
+
+    One DescribeInstanceTypes call covers the whole list. EC2 rejects the call
+    if any type is unknown (e.g. a typo in the tag); the types are then
+    described one by one and the unknown ones dropped.
+    """
+    if len(instance_types) < 2:
+        return list(instance_types)
+    described = _describe_architectures(ec2_client, instance_types)
+    architectures = described.get(instance_types[-1], set())
+    compatible = [instance_type for instance_type in instance_types
+                  if described.get(instance_type, set()) & architectures or instance_type == instance_types[-1]]
+    for instance_type in set(described) - set(compatible):
+        logger.warning(f"Skipping builder instance type {instance_type}: not compatible with "
+                       f"{instance_types[-1]} ({', '.join(sorted(architectures))})")
+    return compatible
+
+
+def launch_candidates(instance_types: List[str], subnet_ids: List[str]) -> List[Dict]:
+    """Every type in every subnet, by type first so a preferred type is tried in each AZ."""
+    return [{'InstanceType': instance_type, 'SubnetId': subnet_id}
+            for instance_type in instance_types for subnet_id in subnet_ids]
+
+
+def _client_token(token_seed: str, candidate: Dict) -> str:
+    # RunInstances tokens are at most 64 characters; one per candidate, since a
+    # token reused with other parameters is rejected. The candidate itself goes
+    # into the hash, so the token does not depend on its place in the list
+    key = f"{token_seed}/{candidate['InstanceType']}/{candidate['SubnetId']}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _with_launch_token_tag(launch_parameters: Dict, token_seed: str) -> Dict:
+    params = copy.deepcopy(launch_parameters)
+    tag = {'Key': LAUNCH_TOKEN_TAG, 'Value': token_seed}
+    specifications = params.setdefault('TagSpecifications', [])
+    for specification in specifications:
+        if specification['ResourceType'] == 'instance':
+            specification.setdefault('Tags', []).append(tag)
+            break
+    else:
+        specifications.append({'ResourceType': 'instance', 'Tags': [tag]})
+    return params
+
+
+def find_launched_builder(ec2_client, token_seed: str) -> Dict:
+    """Return the builder an earlier attempt with this token seed launched, if any."""
+    response = ec2_client.describe_instances(Filters=[
+        {'Name': f"tag:{LAUNCH_TOKEN_TAG}", 'Values': [token_seed]},
+        {'Name': 'instance-state-name', 'Values': BUILDER_STATES}
+    ])
+    for reservation in response['Reservations']:
+        for instance in reservation['Instances']:
+            return instance
+    return None
+
+
+def _availability_zone(ec2_client, instance: Dict, subnet_id: str) -> str:
+    # The ledger stores the zone as a string, so fall back to the subnet's
+    # zone when the RunInstances response has no placement
+    zone = instance.get('Placement', {}).get('AvailabilityZone')
+    if zone:
+        return zone
+    try:
+        return ec2_client.describe_subnets(SubnetIds=[subnet_id])['Subnets'][0]['AvailabilityZone']
+    except (ClientError, IndexError, KeyError) as e:
+        logger.warning(f"Could not find the Availability Zone of {subnet_id}: {str(e)}")
+        return 'unknown'
+
+
+def launch_builder(ec2_client, launch_parameters: Dict, candidates: List[Dict],
+                   token_seed: str = None) -> Dict:
+    """Launch the builder with the first candidate that has capacity.
+
+    launch_parameters are RunInstances parameters; each attempt sets its
+    InstanceType and the SubnetId of the first network interface. With a
+    token_seed, the builder is tagged with it and a retried invocation gets back
+    the instance it already launched instead of a second one, even if the
+    candidates changed in between.
+
+    Returns the RunInstances Instances (InstanceId only) plus the chosen
+    InstanceType, SubnetId and AvailabilityZone, every Attempt and LaunchSeconds.
+    """
+    started = time.monotonic()
+    attempts = []
+    if token_seed:
+        instance = find_launched_builder(ec2_client, token_seed)
+        if instance is not None:
+            logger.info(f"Builder {instance['InstanceId']} was already launched for {token_seed}")
+            return {
+                'Instances': [{'InstanceId': instance['InstanceId']}],
+                'InstanceType': instance['InstanceType'],
+                'SubnetId': instance['SubnetId'],
+                'AvailabilityZone': _availability_zone(ec2_client, instance, instance['SubnetId']),
+                'Attempts': attempts,
+                'LaunchSeconds': round(time.monotonic() - started, 3)
+            }
+        launch_parameters = _with_launch_token_tag(launch_parameters, token_seed)
+    for candidate in candidates:
+        params = copy.deepcopy(launch_parameters)
+        params['InstanceType'] = candidate['InstanceType']
+        params['NetworkInterfaces'][0]['SubnetId'] = candidate['SubnetId']
+        if token_seed:
+            params['ClientToken'] = _client_token(token_seed, candidate)
+        try:
+            instance = ec2_client.run_instances(**params)['Instances'][0]
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code not in FALLBACK_ERROR_CODES:
+                raise
+            logger.warning(f"Could not launch {candidate['InstanceType']} in {candidate['SubnetId']}: {code}")
+            attempts.append(dict(candidate, Error=code))
+            continue
+        attempts.append(dict(candidate, Error=None))
+        result = {
+            'Instances': [{'InstanceId': instance['InstanceId']}],
+            'InstanceType': candidate['InstanceType'],
+            'SubnetId': candidate['SubnetId'],
+            'AvailabilityZone': _availability_zone(ec2_client, instance, candidate['SubnetId']),
+            'Attempts': attempts,
+            'LaunchSeconds': round(time.monotonic() - started, 3)
+        }
+        logger.info(f"Launched builder {instance['InstanceId']} as {result['InstanceType']} in "
+                    f"{result['AvailabilityZone']} after {len(attempts)} attempts")
+        return result
+    raise BuilderLaunchError(
+        f"No capacity for any of {len(candidates)} builder candidates: "
+        + '; '.join(f"{a['InstanceType']}/{a['SubnetId']}: {a['Error']}" for a in attempts)
+    )
@@ -0,0 +1,125 @@
+import os
+import json
+import logging
+from typing import Dict, List
+import metadata_cache
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# How a bake protects the Auto Scaling group while the builder runs:
+#   pin-max            MaxSize = DesiredCapacity until the ASG is switched (the original behaviour)
+#   suspend-processes  suspend only the processes in SUSPEND_PROCESSES; scaling keeps working
+#   none               leave the group alone
+PIN_MAX = 'pin-max'
+SUSPEND_PROCESSES = 'suspend-processes'
+NONE = 'none'
+CAPACITY_MODES = (PIN_MAX, SUSPEND_PROCESSES, NONE)
+DEFAULT_CAPACITY_MODE = os.environ.get('BAKE_CAPACITY_MODE')
+# AZ rebalancing and scheduled actions churn instances onto the old image while
+# the bake runs; Launch, Terminate and alarm-driven scaling stay active
+DEFAULT_SUSPEND_PROCESSES = json.loads(
+    os.environ.get('BAKE_SUSPEND_PROCESSES', '["AZRebalance", "ScheduledActions"]')
+)
+# Holds the group's state from before the bake, so it can be restored by any
+# later step (or by hand) even if the execution that changed it failed
+ORIGINAL_STATE_TAG = 'ami-bake:original-capacity'
+
+
+def capacity_mode(requested: str = None, set_max_capacity_equal_to_desired: bool = True) -> str:
+    """Resolve the mode from the event, BAKE_CAPACITY_MODE or the legacy flag."""
+    mode = requested or DEFAULT_CAPACITY_MODE or (PIN_MAX if set_max_capacity_equal_to_desired else NONE)
+    if mode not in CAPACITY_MODES:
+        raise ValueError(f"Unknown capacity mode {mode}, expected one of {', '.join(CAPACITY_MODES)}")
+    return mode
+
+
+def _get_tag(asg_group: Dict, key: str) -> str:
+    for tag in asg_group.get('Tags', []):
+        if tag['Key'] == key:
+            return tag['Value']
+    return None
+
+
+def _tag(asg_name: str, value: str = None) -> Dict:
+    tag = {'ResourceId': asg_name, 'ResourceType': 'auto-scaling-group', 'Key': ORIGINAL_STATE_TAG}
+    if value is not None:
+        tag.update(Value=value, PropagateAtLaunch=False)
+    return tag
+
+
+def apply_capacity_mode(asg_client, asg_group: Dict, mode: str,
+                        processes: List[str] = None) -> Dict:
+    """Apply the mode to the group and return the state to restore afterwards.
+
+    The original state is written to the group's tag before anything changes.
+    If a failed bake left a state behind, its values are kept, so the pinned or
+    suspended values are never recorded as the originals. When that bake used
+    the other mode, the original values of this mode are added to the recorded
+    state, so restoring undoes both.
+    """
+    asg_name = asg_group['AutoScalingGroupName']
+    if mode == NONE:
+        return {'Mode': NONE}
+
+    if mode == PIN_MAX:
+        original = {'MaxSize': asg_group['MaxSize']}
+    else:
+        already = {process['ProcessName'] for process in asg_group.get('SuspendedProcesses', [])}
+        original = {'SuspendedProcesses': [
+            process for process in (processes or DEFAULT_SUSPEND_PROCESSES) if process not in already
+        ]}
+    recorded = _get_tag(asg_group, ORIGINAL_STATE_TAG)
+    if recorded:
+        state = json.loads(recorded)
+        logger.warning(f"{asg_name} still carries the state from an earlier bake: {recorded}")
+        # The other mode left this mode's values untouched, so the current ones are the originals
+        missing = {key: value for key, value in original.items() if key not in state}
+        if missing:
+            state.update(missing, Mode=mode)
+            logger.info(f"Adding {missing} to the recorded state of {asg_name}")
+    else:
+        state = dict(original, Mode=mode)
+    if not recorded or json.loads(recorded) != state:
+        asg_client.create_or_update_tags(Tags=[_tag(asg_name, json.dumps(state, separators=(',', ':')))])
+
+    if mode == PIN_MAX:
+        logger.info(f"Updating ASG max capacity from {asg_group['MaxSize']} to {asg_group['DesiredCapacity']}")
+        asg_client.update_auto_scaling_group(AutoScalingGroupName=asg_name, MaxSize=asg_group['DesiredCapacity'])
+    elif state.get('SuspendedProcesses'):
+        logger.info(f"Suspending {state['SuspendedProcesses']} on {asg_name}")
+        asg_client.suspend_processes(AutoScalingGroupName=asg_name,
+                                     ScalingProcesses=state['SuspendedProcesses'])
+    metadata_cache.invalidate_auto_scaling_group(asg_name)
+    return state
+
+
+def restore_capacity(asg_client, asg_name: str, original_max_capacity: int = None) -> Dict:
+    """Undo whatever the bake changed, using the state recorded on the group.
+
+    Safe to call more than once and for groups the bake never touched. Groups
+    pinned before the state was recorded fall back to original_max_capacity.
+    """
+    groups = asg_client.describe_auto_scaling_groups(AutoScalingGroupNames=[asg_name])['AutoScalingGroups']
+    recorded = _get_tag(groups[0], ORIGINAL_STATE_TAG) if groups else None
+    if recorded:
+        state = json.loads(recorded)
+    elif original_max_capacity is not None:
+        state = {'Mode': PIN_MAX, 'MaxSize': original_max_capacity}
+    else:
+        logger.info(f"Nothing to restore on {asg_name}")
+        return {'AutoScalingGroupName': asg_name, 'Restored': False}
+
+    # A state merged from both modes carries both MaxSize and SuspendedProcesses
+    if 'MaxSize' in state:
+        asg_client.update_auto_scaling_group(AutoScalingGroupName=asg_name, MaxSize=state['MaxSize'])
+        logger.info(f"Reverted maximum capacity of ASG {asg_name} to {state['MaxSize']}")
+    if state.get('SuspendedProcesses'):
+        asg_client.resume_processes(AutoScalingGroupName=asg_name,
+                                    ScalingProcesses=state['SuspendedProcesses'])
+        logger.info(f"Resumed {state['SuspendedProcesses']} on {asg_name}")
+    if recorded:
+        asg_client.delete_tags(Tags=[_tag(asg_name)])
+    metadata_cache.invalidate_auto_scaling_group(asg_name)
+    return dict(state, AutoScalingGroupName=asg_name, Restored=True)
@@ -0,0 +1,76 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from ami_distribution import AVAILABLE, FAILED, PENDING, copy_status, expire_copies
+from cleanup_engine import run_cleanup
+from polling import PollingDeadlineExceeded, finish_poll, next_poll
+from instrumentation import instrumented
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def deregister_expired(copies, expired_ids):
+    """Deregister the copies given up on, so an unfinished copy does not linger."""
+    by_region = {}
+    for copy in copies:
+        if copy['ImageId'] in expired_ids:
+            by_region.setdefault(copy['Region'], []).append(copy['ImageId'])
+    deregistered = set()
+    for region, image_ids in by_region.items():
+        try:
+            report = run_cleanup(get_client('ec2', region), [], image_ids)
+            deregistered.update(image['ImageId'] for image in report['Images'] if image['Deregistered'])
+        except ClientError as e:
+            logger.error(f"Could not deregister expired copies in {region}: {str(e)}")
+    return [dict(copy, Deregistered=copy['ImageId'] in deregistered) if copy['ImageId'] in expired_ids
+            else copy for copy in copies]
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Check the cross-region copies of a baked AMI, one call per region.
+
+    Args:
+        event (dict): Must contain Copies, the records returned by the copy step
+                     or the previous check; PollState is the pollState returned
+                     by the previous check, if any
+        context (Any): Lambda context object
+
+    Returns:
+        dict: copyState ('complete' once no copy is pending, 'pending'
+              otherwise), the updated Copies, AvailableCount, FailedCount,
+              pollState and nextWaitSeconds; copies still pending at the
+              deadline are deregistered
+    """
+    try:
+        poll_state = event.get('PollState')
+        copies = copy_status(get_client, event['Copies'])
+
+        if any(copy['State'] == PENDING for copy in copies):
+            try:
+                result = {'copyState': 'pending', **next_poll('ami-copy', poll_state)}
+            except PollingDeadlineExceeded as e:
+                # The home region is done; report the regions that did not finish
+                logger.error(f"AMI copies not available before the deadline: {str(e)}")
+                expired_ids = {copy['ImageId'] for copy in copies if copy['State'] == PENDING}
+                copies = deregister_expired(expire_copies(copies, str(e)), expired_ids)
+                result = {'copyState': 'complete', **finish_poll(poll_state)}
+        else:
+            result = {'copyState': 'complete', **finish_poll(poll_state)}
+
+        available = sum(copy['State'] == AVAILABLE for copy in copies)
+        failed = sum(copy['State'] == FAILED for copy in copies)
+        logger.info(f"{available} of {len(copies)} AMI copies available, {failed} failed")
+        return {**result, 'Copies': copies, 'AvailableCount': available, 'FailedCount': failed}
+
+    except KeyError as e:
+        logger.error(f"Missing required parameter: {str(e)}")
+        raise
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
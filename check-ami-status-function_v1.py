@@ -1,23 +1,69 @@
-import boto3
-import time
 import logging
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from backup_job_resolver import chunked
+from polling import finish_poll, next_poll
+from instrumentation import instrumented
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+IMAGE_BATCH_SIZE = 100
+FAILED_AMI_STATES = ('invalid', 'deregistered', 'failed', 'error')
+
+def describe_image_states(ec2, ami_ids):
+    """Return a map of AMI ID to state, 100 images per call.
+
+    The IDs are passed as an image-id filter rather than ImageIds, so one
+    missing AMI does not fail the whole call; missing AMIs map to 'not-found'.
+    """
+    states = {}
+    for chunk in chunked(sorted(set(ami_ids)), IMAGE_BATCH_SIZE):
+        response = ec2.describe_images(Filters=[{'Name': 'image-id', 'Values': chunk}])
+        for image in response['Images']:
+            states[image['ImageId']] = image['State']
+    for ami_id in set(ami_ids) - set(states):
+        states[ami_id] = 'not-found'
+    return states
+
+def check_amis_batch(ec2, ami_ids, poll_state=None):
+    """Check many AMIs at once and return per-AMI states plus a verdict."""
+    states = describe_image_states(ec2, ami_ids)
+    all_ready = all(state == 'available' for state in states.values())
+    any_failed = any(state in FAILED_AMI_STATES for state in states.values())
+    logger.info(f"{sum(s == 'available' for s in states.values())} of {len(states)} AMIs available, "
+                f"any failed: {any_failed}")
+
+    result = {'States': states, 'allReady': all_ready, 'anyFailed': any_failed}
+    if any_failed:
+        result['amiState'] = 'failed'
+    elif all_ready:
+        result.update({'amiState': 'available', **finish_poll(poll_state)})
+    else:
+        result.update({'amiState': 'pending', **next_poll('ami', poll_state)})
+    return result
+
+@instrumented
 def lambda_handler(event, context):
     """
     Check AMI status and return its state.
     
     Args:
-        event: Must contain 'BackupAMIId' key
+        event: Must contain 'BackupAMIId' key, or 'BackupAMIIds' for batch mode;
+               'PollState' is the pollState returned by the previous check, if any
         context: Lambda context object
     
     Returns:
-        dict: Contains AMI state and ID
+        dict: Contains AMI state and ID, pollState and nextWaitSeconds; batch
+              mode returns 'States', 'allReady' and 'anyFailed' instead of the ID
     """
     try:
+        # Batch mode: one call covers up to 100 AMIs
+        if 'BackupAMIIds' in event:
+            logger.info(f"Checking status for {len(event['BackupAMIIds'])} AMIs")
+            return check_amis_batch(get_client('ec2'), event['BackupAMIIds'], event.get('PollState'))
+
         # Validate input
         if 'BackupAMIId' not in event:
             error_msg = "BackupAMIId not found in event"
@@ -25,9 +71,10 @@ def lambda_handler(event, context):
             raise ValueError(error_msg)
 
         ami_id = event['BackupAMIId']
+        poll_state = event.get('PollState')
         logger.info(f"Checking status for AMI: {ami_id}")
         
-        ec2 = boto3.client('ec2')
+        ec2 = get_client('ec2')
 
         response = ec2.describe_images(ImageIds=[ami_id])
         
@@ -38,15 +85,19 @@ def lambda_handler(event, context):
             logger.info(f"AMI {ami_id} is in state: {ami_state}")
             
             if ami_state == 'available':
-                return {'amiState': ami_state, 'amiId': ami_id}
+                return {'amiState': ami_state, 'amiId': ami_id, **finish_poll(poll_state)}
             elif ami_state == 'pending':
-                return {'amiState': ami_state, 'amiId': ami_id}
+                return {'amiState': ami_state, 'amiId': ami_id, **next_poll('ami', poll_state)}
+            else:
+                error_msg = f'AMI {ami_id} is in state {ami_state}'
+                logger.error(error_msg)
+                raise ValueError(error_msg)
         else:
             error_msg = f'AMI {ami_id} not found or in the process of being created'
             logger.error(error_msg)
             raise ValueError(error_msg)
             
-    except boto3.exceptions.ClientError as e:
+    except ClientError as e:
         error_msg = f"AWS API error: {str(e)}"
         logger.error(error_msg)
         raise
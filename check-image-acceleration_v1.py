@@ -0,0 +1,57 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from image_acceleration import acceleration_features, acceleration_status, disable_acceleration
+from polling import PollingDeadlineExceeded, finish_poll, next_poll
+from instrumentation import instrumented
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Check whether Fast Launch and Fast Snapshot Restore are ready for a baked AMI.
+
+    Args:
+        event (dict): Must contain ImageId, SnapshotIds and Acceleration;
+                     PollState is the pollState returned by the previous check, if any
+        context (Any): Lambda context object
+
+    Returns:
+        dict: accelerationState ('ready', 'pending' or 'failed'), the feature
+              states, pollState and nextWaitSeconds. A feature that failed or
+              is not ready by the polling deadline is 'failed', after every
+              feature was disabled (DisableErrors lists what could not be)
+    """
+    try:
+        image_id = event['ImageId']
+        poll_state = event.get('PollState')
+        ec2 = get_client('ec2')
+        status = acceleration_status(ec2, image_id, event['SnapshotIds'], event['Acceleration'])
+
+        if status['Ready'] and not status['Failed']:
+            logger.info(f"Acceleration ready for AMI {image_id}")
+            return {'accelerationState': 'ready', **status, **finish_poll(poll_state)}
+        if not status['Failed']:
+            try:
+                return {'accelerationState': 'pending', **status, **next_poll('acceleration', poll_state)}
+            except PollingDeadlineExceeded as e:
+                status.update(Failed=True, Reason=str(e))
+
+        # The AMI itself is fine; stop paying for the features and let the state
+        # machine switch the ASG without acceleration
+        logger.error(f"Acceleration failed for AMI {image_id}: {status['Reason']}")
+        status['DisableErrors'] = disable_acceleration(
+            ec2, image_id, event['SnapshotIds'], acceleration_features(event['Acceleration'])
+        )
+        return {'accelerationState': 'failed', **status, **finish_poll(poll_state)}
+
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
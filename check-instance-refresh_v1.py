@@ -0,0 +1,70 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+import polling
+from polling import PollingDeadlineExceeded, finish_poll, next_poll
+from instance_refresh import (
+    IN_PROGRESS_STATUSES, SUCCEEDED_STATUSES, cancel_refresh, describe_refresh, refresh_progress
+)
+from instrumentation import instrumented
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Check the progress of an instance refresh started by updateASG.
+
+    Args:
+        event (dict): Must contain AutoScalingGroupName and InstanceRefreshId;
+                     PollState is the pollState returned by the previous check, if any
+        context (Any): Lambda context object
+
+    Returns:
+        dict: refreshStatus, PercentageComplete, InstancesReplaced,
+              EstimatedSecondsRemaining, pollState and nextWaitSeconds. A refresh
+              still running at the polling deadline is cancelled and the check fails.
+    """
+    try:
+        asg_name = event['AutoScalingGroupName']
+        refresh_id = event['InstanceRefreshId']
+        poll_state = event.get('PollState') or {}
+        autoscaling_client = get_client('autoscaling')
+
+        refresh = describe_refresh(autoscaling_client, asg_name, refresh_id)
+        elapsed = polling.clock() - poll_state.get('startedAt', polling.clock())
+        result = refresh_progress(refresh, poll_state, elapsed)
+        logger.info(f"Instance refresh {refresh_id} for {asg_name}: {result['refreshStatus']}, "
+                    f"{result['PercentageComplete']}% complete, {result['InstancesReplaced']} of "
+                    f"{result['InstancesTotal']} replaced, ~{result['EstimatedSecondsRemaining']}s remaining")
+
+        if result['refreshStatus'] in IN_PROGRESS_STATUSES:
+            # Let the observed rate of progress set the expected duration
+            overrides = None
+            if result['EstimatedSecondsRemaining'] is not None:
+                overrides = {'expected_seconds': elapsed + result['EstimatedSecondsRemaining']}
+            try:
+                result.update(next_poll('instance-refresh', poll_state, overrides))
+            except PollingDeadlineExceeded:
+                cancel_refresh(autoscaling_client, asg_name)
+                raise
+        else:
+            if result['refreshStatus'] not in SUCCEEDED_STATUSES:
+                logger.error(f"Instance refresh {refresh_id} ended as {result['refreshStatus']}: "
+                             f"{result['StatusReason']}")
+            result.update(finish_poll(poll_state))
+        result['pollState']['instancesTotal'] = result['InstancesTotal']
+        return result
+
+    except KeyError as e:
+        logger.error(f"Missing required parameter: {str(e)}")
+        raise
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
@@ -1,17 +1,107 @@
-import boto3
 import logging
+from aws_clients import get_client
+from backup_job_resolver import chunked
+from polling import finish_poll, next_poll
+from instrumentation import instrumented
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# DescribeInstanceStatus accepts at most 100 explicit instance IDs per call,
+# and returns up to 1000 statuses per page when filters are used instead
+INSTANCE_ID_BATCH_SIZE = 100
+FILTER_PAGE_SIZE = 1000
+FAILED_INSTANCE_STATES = ('shutting-down', 'terminated', 'stopping', 'stopped')
+FAILED_CHECK_STATUSES = ('impaired', 'failed')
+
+def classify_instance_status(instance_status):
+    """Reduce an InstanceStatus entry to 'ok', 'pending' or 'failed'."""
+    instance_state = instance_status['InstanceState']['Name']
+    system_status = instance_status.get('SystemStatus', {}).get('Status')
+    instance_status_check = instance_status.get('InstanceStatus', {}).get('Status')
+    if instance_state in FAILED_INSTANCE_STATES:
+        return 'failed'
+    if system_status in FAILED_CHECK_STATUSES or instance_status_check in FAILED_CHECK_STATUSES:
+        return 'failed'
+    if instance_status_check == 'ok' and system_status == 'ok':
+        return 'ok'
+    return 'pending'
+
+def describe_instance_statuses(ec2, instance_ids, filters=None):
+    """Return a map of instance ID to status for many instances.
+
+    Without filters the IDs are queried 100 per call. With filters (for example
+    availability-zone) the matching statuses are listed 1000 per page and
+    narrowed to the requested IDs, which is cheaper for large fleets.
+    """
+    wanted = set(instance_ids)
+    statuses = {}
+    paginator = ec2.get_paginator('describe_instance_status')
+    if filters:
+        page_iterators = [paginator.paginate(
+            Filters=filters, IncludeAllInstances=True,
+            PaginationConfig={'PageSize': FILTER_PAGE_SIZE}
+        )]
+    else:
+        page_iterators = [paginator.paginate(InstanceIds=chunk, IncludeAllInstances=True)
+                          for chunk in chunked(sorted(wanted), INSTANCE_ID_BATCH_SIZE)]
+    for page_iterator in page_iterators:
+        for page in page_iterator:
+            for instance_status in page['InstanceStatuses']:
+                if instance_status['InstanceId'] in wanted:
+                    statuses[instance_status['InstanceId']] = classify_instance_status(instance_status)
+    # Instances that are not visible yet are still starting
+    for instance_id in wanted - set(statuses):
+        statuses[instance_id] = 'pending'
+    return statuses
+
+def check_instances_batch(ec2, instance_ids, filters=None, poll_state=None):
+    """Check many instances at once and return per-instance states plus a verdict."""
+    statuses = describe_instance_statuses(ec2, instance_ids, filters)
+    all_ready = all(status == 'ok' for status in statuses.values())
+    any_failed = any(status == 'failed' for status in statuses.values())
+    logger.info(f"{sum(s == 'ok' for s in statuses.values())} of {len(statuses)} instances ready, "
+                f"any failed: {any_failed}")
+
+    result = {'Statuses': statuses, 'allReady': all_ready, 'anyFailed': any_failed}
+    if any_failed:
+        result['system_status'] = 'failed'
+    elif all_ready:
+        result.update({'system_status': 'ok', **finish_poll(poll_state)})
+    else:
+        result.update({'system_status': 'pending', **next_poll('instance-status', poll_state)})
+    return result
+
+@instrumented
 def lambda_handler(event, context):
+    """
+    Check instance status checks and recommend when to check again.
+
+    Args:
+        event: Must contain 'InstanceId', or 'InstanceIds' (and optionally
+               'Filters') for batch mode; 'PollState' is the pollState returned
+               by the previous check, if any
+        context: Lambda context object
+
+    Returns:
+        dict: 'system_status' ('ok' or 'pending'), 'pollState' and 'nextWaitSeconds';
+              batch mode adds 'Statuses', 'allReady' and 'anyFailed'
+    """
     try:
-        # Create an EC2 client
-        ec2 = boto3.client('ec2')
+        # Get the shared EC2 client
+        ec2 = get_client('ec2')
+
+        # Batch mode: one call covers up to 100 instances (1000 with filters)
+        if 'InstanceIds' in event:
+            logger.info(f"Checking status for {len(event['InstanceIds'])} instances")
+            return check_instances_batch(
+                ec2, event['InstanceIds'], event.get('Filters'), event.get('PollState')
+            )
 
         # Get the instance ID from the event input
         instance_id = event.get('InstanceId')
+        poll_state = event.get('PollState')
         logger.info(f"Checking status for instance: {instance_id}")
 
         # Describe the instance status
@@ -30,12 +120,12 @@ def lambda_handler(event, context):
             
                 # Return True if both instance and system status checks are "ok"
                 if instance_status_check == 'ok' and system_status == 'ok':
-                    return {'system_status': system_status}
+                    return {'system_status': system_status, **finish_poll(poll_state)}
                 else:
-                    return {'system_status': 'pending'}
+                    return {'system_status': 'pending', **next_poll('instance-status', poll_state)}
             else:
                 logger.warning(f"No status information found for instance {instance_id}")
-                return {'system_status': 'pending'}
+                return {'system_status': 'pending', **next_poll('instance-status', poll_state)}
 
         except Exception as e:
             logger.error(f"Error checking instance status: {str(e)}")
@@ -0,0 +1,92 @@
+import logging
+from typing import Dict, Any, List
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from completion_events import COMMAND_FAILED_STATUSES
+from polling import elapsed_seconds, finish_poll, next_poll
+from instrumentation import instrumented
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_invocation_status(ssm_client, command_id: str, instance_id: str) -> str:
+    """Get the status of one command invocation."""
+    try:
+        response = ssm_client.get_command_invocation(CommandId=command_id, InstanceId=instance_id)
+        return response['Status']
+    except ClientError as e:
+        # The invocation is not visible for a few seconds after send_command
+        if e.response['Error']['Code'] == 'InvocationDoesNotExist':
+            return 'Pending'
+        raise
+
+def list_invocation_statuses(ssm_client, command_ids: List[str]) -> Dict[str, str]:
+    """Get the status of every invocation of the given commands, keyed by instance ID."""
+    statuses = {}
+    paginator = ssm_client.get_paginator('list_command_invocations')
+    for command_id in command_ids:
+        for page in paginator.paginate(CommandId=command_id):
+            for invocation in page['CommandInvocations']:
+                statuses[invocation['InstanceId']] = invocation['Status']
+    return statuses
+
+def aggregate_status(statuses: Dict[str, str]) -> str:
+    """Reduce per-instance statuses to Success, Failed, InProgress or Pending."""
+    values = list(statuses.values())
+    if any(value in COMMAND_FAILED_STATUSES for value in values):
+        return 'Failed'
+    if all(value == 'Success' for value in values):
+        return 'Success'
+    if all(value == 'Pending' for value in values):
+        return 'Pending'
+    return 'InProgress'
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Check whether Sysprep has finished on one or many instances.
+
+    Args:
+        event (dict): Must contain CommandId (or CommandIds) and InstanceId (or
+                     InstanceIds); PollState is the pollState returned by the
+                     previous check, if any
+        context (Any): Lambda context object
+
+    Returns:
+        dict: sysprepStatus, per-instance Statuses, ElapsedSeconds, pollState and
+              nextWaitSeconds
+    """
+    try:
+        command_ids = event.get('CommandIds') or [event['CommandId']]
+        instance_ids = event.get('InstanceIds') or [event['InstanceId']]
+        poll_state = event.get('PollState')
+        ssm_client = get_client('ssm')
+
+        if len(command_ids) == 1 and len(instance_ids) == 1:
+            statuses = {instance_ids[0]: get_invocation_status(ssm_client, command_ids[0], instance_ids[0])}
+        else:
+            statuses = list_invocation_statuses(ssm_client, command_ids)
+
+        # Instances without a visible invocation yet are still pending
+        statuses = {instance_id: statuses.get(instance_id, 'Pending') for instance_id in instance_ids}
+        sysprep_status = aggregate_status(statuses)
+        result = {'sysprepStatus': sysprep_status, 'Statuses': statuses}
+        if sysprep_status in ('Success', 'Failed'):
+            result.update(finish_poll(poll_state))
+        else:
+            result.update(next_poll('sysprep', poll_state))
+        result['ElapsedSeconds'] = elapsed_seconds(result['pollState'])
+
+        logger.info(f"Sysprep {sysprep_status} after {result['ElapsedSeconds']}s: {result['Statuses']}")
+        return result
+
+    except KeyError as e:
+        logger.error(f"Missing required parameter: {str(e)}")
+        raise
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
@@ -0,0 +1,244 @@
+import os
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from botocore.exceptions import ClientError
+from backup_job_resolver import chunked, describe_auto_scaling_groups_bulk
+from image_acceleration import ACCELERATION_TAG, disable_acceleration, image_snapshot_ids
+from ami_distribution import SOURCE_IMAGE_TAG
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Tags the state machine puts on builder instances, baked AMIs and their snapshots
+ROLE_TAG = 'ami-bake:role'
+BUILDER_ROLE = 'builder'
+IMAGE_ROLE = 'baked-image'
+ASG_TAG = 'ami-bake:asg'
+# TerminateInstances is documented for up to 1000 IDs per call
+TERMINATE_BATCH_SIZE = 1000
+IMAGE_BATCH_SIZE = 100
+CLEANUP_WORKERS = int(os.environ.get('CLEANUP_WORKERS', '10'))
+BUILDER_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _as_datetime(value) -> datetime.datetime:
+    """EC2 returns LaunchTime as a datetime but CreationDate as an ISO string."""
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _tag(resource: Dict, key: str) -> str:
+    for tag in resource.get('Tags', []):
+        if tag['Key'] == key:
+            return tag['Value']
+    return None
+
+
+def discover_stale_builders(ec2_client, max_age_hours: float, now: datetime.datetime = None) -> List[str]:
+    """Return builder instances launched more than max_age_hours ago.
+
+    A bake never keeps its builder that long, so these are leftovers of failed
+    or aborted executions.
+    """
+    cutoff = (now or _now()) - datetime.timedelta(hours=max_age_hours)
+    stale = []
+    paginator = ec2_client.get_paginator('describe_instances')
+    for page in paginator.paginate(Filters=[
+        {'Name': f"tag:{ROLE_TAG}", 'Values': [BUILDER_ROLE]},
+        {'Name': 'instance-state-name', 'Values': BUILDER_STATES}
+    ]):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                if _as_datetime(instance['LaunchTime']) < cutoff:
+                    stale.append(instance['InstanceId'])
+    logger.info(f"Found {len(stale)} builder instances older than {max_age_hours}h")
+    return stale
+
+
+def get_images_in_use(ec2_client, asg_client, asg_names: List[str]) -> set:
+    """Return the AMIs referenced by the launch template version each ASG runs."""
+    in_use = set()
+    for group in describe_auto_scaling_groups_bulk(asg_client, asg_names).values():
+        template = group.get('LaunchTemplate') or group.get('MixedInstancesPolicy', {}).get(
+            'LaunchTemplate', {}).get('LaunchTemplateSpecification')
+        if not template:
+            continue
+        try:
+            versions = ec2_client.describe_launch_template_versions(
+                LaunchTemplateId=template['LaunchTemplateId'],
+                Versions=[template.get('Version', '$Default'), '$Default', '$Latest']
+            )['LaunchTemplateVersions']
+        except ClientError as e:
+            # Without the template we cannot tell which images are safe; keep them all
+            raise RuntimeError(f"Cannot resolve images in use by {group['AutoScalingGroupName']}: {str(e)}")
+        in_use.update(version['LaunchTemplateData'].get('ImageId') for version in versions)
+    in_use.discard(None)
+    return in_use
+
+
+def discover_superseded_images(ec2_client, asg_client, keep_last: int, min_age_days: float,
+                               now: datetime.datetime = None, copies: bool = False) -> List[str]:
+    """Return baked AMIs that newer bakes of the same ASG have replaced.
+
+    The newest keep_last images of every ASG, images younger than min_age_days
+    and any image an ASG launch template still references are kept. With
+    copies, only the cross-region copies in the clients' region are considered,
+    found by their ami-bake:source-image tag.
+    """
+    cutoff = (now or _now()) - datetime.timedelta(days=min_age_days)
+    by_asg: Dict[str, List[Dict]] = {}
+    image_filter = ({'Name': 'tag-key', 'Values': [SOURCE_IMAGE_TAG]} if copies
+                    else {'Name': f"tag:{ROLE_TAG}", 'Values': [IMAGE_ROLE]})
+    paginator = ec2_client.get_paginator('describe_images')
+    for page in paginator.paginate(Owners=['self'], Filters=[image_filter]):
+        for image in page['Images']:
+            by_asg.setdefault(_tag(image, ASG_TAG) or '', []).append(image)
+
+    in_use = get_images_in_use(ec2_client, asg_client, [name for name in by_asg if name])
+    superseded = []
+    for images in by_asg.values():
+        images.sort(key=lambda image: _as_datetime(image['CreationDate']), reverse=True)
+        for image in images[keep_last:]:
+            if image['ImageId'] not in in_use and _as_datetime(image['CreationDate']) < cutoff:
+                superseded.append(image['ImageId'])
+    logger.info(f"Found {len(superseded)} superseded baked {'copies' if copies else 'images'}")
+    return superseded
+
+
+def describe_images_bulk(ec2_client, image_ids: List[str]) -> Dict[str, Dict]:
+    """Return the descriptions of many AMIs, 100 per call, keyed by image ID.
+
+    Images that no longer exist are absent from the result.
+    """
+    images = {}
+    for chunk in chunked(sorted(set(image_ids)), IMAGE_BATCH_SIZE):
+        try:
+            response = ec2_client.describe_images(ImageIds=chunk)
+        except ClientError as e:
+            if len(chunk) == 1:
+                logger.warning(f"Could not describe image {chunk[0]}: {str(e)}")
+                continue
+            logger.warning(f"Bulk describe_images failed, retrying individually: {str(e)}")
+            for image_id in chunk:
+                images.update(describe_images_bulk(ec2_client, [image_id]))
+            continue
+        for image in response['Images']:
+            images[image['ImageId']] = image
+    return images
+
+
+def describe_image_snapshots(ec2_client, image_ids: List[str]) -> Dict[str, List[str]]:
+    """Return the EBS snapshot IDs backing each AMI, keyed by image ID.
+
+    This must run before the images are deregistered. Images that no longer
+    exist are absent from the result.
+    """
+    return {image_id: image_snapshot_ids(image)
+            for image_id, image in describe_images_bulk(ec2_client, image_ids).items()}
+
+
+def terminate_instances_bulk(ec2_client, instance_ids: List[str]) -> Dict:
+    """Terminate instances up to 1000 per call.
+
+    A chunk that fails is retried one ID at a time so one bad instance does not
+    keep the others running.
+    """
+    terminated, states, failed = [], {}, []
+    for chunk in chunked(sorted(set(instance_ids)), TERMINATE_BATCH_SIZE):
+        try:
+            response = ec2_client.terminate_instances(InstanceIds=chunk)
+            for item in response['TerminatingInstances']:
+                terminated.append(item['InstanceId'])
+                states[item['InstanceId']] = item['CurrentState']['Name']
+        except ClientError as e:
+            if len(chunk) == 1:
+                failed.append({'Id': chunk[0], 'Error': str(e)})
+                continue
+            logger.warning(f"Bulk terminate_instances failed, retrying individually: {str(e)}")
+            for instance_id in chunk:
+                result = terminate_instances_bulk(ec2_client, [instance_id])
+                terminated.extend(result['Terminated'])
+                states.update(result['States'])
+                failed.extend(result['Failed'])
+    return {'Terminated': terminated, 'States': states, 'Failed': failed}
+
+
+def delete_image(ec2_client, image_id: str, snapshot_ids: List[str], acceleration: List[str] = ()) -> Dict:
+    """Deregister an AMI and then delete its snapshots, recording every failure.
+
+    Fast Launch and Fast Snapshot Restore listed in acceleration are disabled
+    first, so their pre-provisioned snapshots and hourly charges go too.
+    """
+    result = {'ImageId': image_id, 'Deregistered': False, 'DeletedSnapshots': [], 'Errors': []}
+    if acceleration:
+        result['Errors'].extend(disable_acceleration(ec2_client, image_id, snapshot_ids, acceleration))
+    try:
+        ec2_client.deregister_image(ImageId=image_id)
+        result['Deregistered'] = True
+    except ClientError as e:
+        # A snapshot of a registered image cannot be deleted, so stop here
+        result['Errors'].append({'Id': image_id, 'Error': str(e)})
+        return result
+    for snapshot_id in snapshot_ids:
+        try:
+            ec2_client.delete_snapshot(SnapshotId=snapshot_id)
+            result['DeletedSnapshots'].append(snapshot_id)
+        except ClientError as e:
+            result['Errors'].append({'Id': snapshot_id, 'Error': str(e)})
+    return result
+
+
+def run_cleanup(ec2_client, instance_ids: List[str] = (), image_ids: List[str] = (),
+                dry_run: bool = False, max_workers: int = CLEANUP_WORKERS) -> Dict:
+    """Terminate instances and delete AMIs with their snapshots.
+
+    Instances are terminated in bulk; images are deregistered and their
+    snapshots deleted on a bounded worker pool. Failures are collected in the
+    report instead of stopping the run. With dry_run nothing is changed and the
+    report lists what would be deleted.
+    """
+    instance_ids = sorted(set(instance_ids))
+    images = describe_images_bulk(ec2_client, list(image_ids)) if image_ids else {}
+    snapshots = {image_id: image_snapshot_ids(image) for image_id, image in images.items()}
+    acceleration = {image_id: [feature for feature in (_tag(image, ACCELERATION_TAG) or '').split(',') if feature]
+                    for image_id, image in images.items()}
+    missing_images = sorted(set(image_ids) - set(snapshots))
+    report = {
+        'DryRun': dry_run,
+        'Instances': {'Terminated': [], 'States': {}, 'Failed': []},
+        'Images': [],
+        'MissingImages': missing_images,
+        'SnapshotCount': sum(len(ids) for ids in snapshots.values()),
+        'FailureCount': 0
+    }
+    if dry_run:
+        report['Instances']['Terminated'] = instance_ids
+        report['Images'] = [{'ImageId': image_id, 'SnapshotIds': snapshot_ids,
+                             'Acceleration': acceleration[image_id]}
+                            for image_id, snapshot_ids in sorted(snapshots.items())]
+        logger.info(f"Dry run: would terminate {len(instance_ids)} instances and delete "
+                    f"{len(snapshots)} images with {report['SnapshotCount']} snapshots")
+        return report
+
+    if instance_ids:
+        report['Instances'] = terminate_instances_bulk(ec2_client, instance_ids)
+    if snapshots:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(snapshots)))) as executor:
+            report['Images'] = list(executor.map(
+                lambda item: delete_image(ec2_client, *item, acceleration[item[0]]), sorted(snapshots.items())
+            ))
+    failures = len(report['Instances']['Failed']) + sum(len(image['Errors']) for image in report['Images'])
+    report['FailureCount'] = failures
+    logger.info(f"Terminated {len(report['Instances']['Terminated'])} instances, deregistered "
+                f"{sum(image['Deregistered'] for image in report['Images'])} images, deleted "
+                f"{sum(len(image['DeletedSnapshots']) for image in report['Images'])} snapshots, "
+                f"{failures} failures")
+    return report
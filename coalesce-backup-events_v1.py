@@ -0,0 +1,107 @@
+import os
+import json
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from backup_job_resolver import describe_auto_scaling_instances_bulk, get_asg_name_from_tags
+from backup_event_buffer import (
+    DEFAULT_WINDOW_SECONDS, buffer_job, execution_name, flush_due, get_event_buffer,
+    parse_backup_event
+)
+from instrumentation import instrumented
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+INSTANCE_NOT_FOUND_CODES = ('InvalidInstanceID.NotFound', 'InvalidInstanceID.Malformed')
+
+def start_bake(asg_name: str, backup_job_id: str) -> str:
+    """Start the bake state machine for one backup job and return the execution ARN."""
+    sfn = get_client('stepfunctions')
+    state_machine_arn = os.environ['STATE_MACHINE_ARN']
+    name = execution_name(asg_name, backup_job_id)
+    try:
+        # A repeated start returns the existing execution while it is running;
+        # once it has finished the name is taken and the start is refused
+        return sfn.start_execution(
+            stateMachineArn=state_machine_arn,
+            name=name,
+            input=json.dumps({'backupJobId': backup_job_id})
+        )['executionArn']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ExecutionAlreadyExists':
+            logger.info(f"Bake {name} for {asg_name} was already started")
+            return f"{state_machine_arn.replace(':stateMachine:', ':execution:')}:{name}"
+        logger.error(f"Error starting bake for {asg_name}: {str(e)}")
+        raise
+
+def find_asg_name(instance_id: str) -> str:
+    """Return the ASG of the backed-up instance, or None if it is not in one.
+
+    Only an instance that no longer exists counts as outside any group. Other
+    errors (throttling included) are raised, so the event is delivered again
+    instead of being dropped.
+    """
+    members = describe_auto_scaling_instances_bulk(get_client('autoscaling'), [instance_id])
+    if instance_id in members:
+        return members[instance_id]['AutoScalingGroupName']
+    try:
+        response = get_client('ec2').describe_instances(InstanceIds=[instance_id])
+    except ClientError as e:
+        if e.response['Error']['Code'] not in INSTANCE_NOT_FOUND_CODES:
+            logger.error(f"Could not describe instance {instance_id}: {str(e)}")
+            raise
+        logger.warning(f"Instance {instance_id} no longer exists: {str(e)}")
+        return None
+    for reservation in response['Reservations']:
+        for instance in reservation['Instances']:
+            return get_asg_name_from_tags(instance)
+    return None
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Debounce backup completions into one bake per Auto Scaling group.
+
+    'Backup Job State Change' events are buffered, keeping only the newest
+    recovery point per ASG. A scheduled event (or {"Flush": true}) starts one
+    execution per ASG whose window of COALESCE_WINDOW_SECONDS has closed.
+
+    Args:
+        event (dict): EventBridge backup or scheduled event
+        context (Any): Lambda context object
+
+    Returns:
+        dict: What was buffered or which bakes were started
+    """
+    try:
+        buffer = get_event_buffer()
+
+        if event.get('detail-type') == 'Scheduled Event' or event.get('Flush'):
+            window = event.get('WindowSeconds', DEFAULT_WINDOW_SECONDS)
+            flushed = flush_due(buffer, start_bake, window)
+            started = [entry for entry in flushed if 'Error' not in entry]
+            failed = [entry for entry in flushed if 'Error' in entry]
+            return {'Started': started, 'StartedCount': len(started),
+                    'Failed': failed, 'FailedCount': len(failed)}
+
+        job = parse_backup_event(event)
+        if job is None:
+            logger.info(f"Ignoring event: {event.get('detail-type')}")
+            return {'Buffered': False}
+
+        asg_name = find_asg_name(job['InstanceId'])
+        if asg_name is None:
+            logger.info(f"Instance {job['InstanceId']} is not in an Auto Scaling group")
+            return {'Buffered': False, 'BackupJobId': job['BackupJobId']}
+
+        buffered = buffer_job(buffer, asg_name, job)
+        logger.info(f"Backup job {job['BackupJobId']} for {asg_name} "
+                    f"{'buffered' if buffered else 'superseded by a newer one'}")
+        return {'Buffered': buffered, 'AutoScalingGroupName': asg_name, 'BackupJobId': job['BackupJobId']}
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
@@ -0,0 +1,95 @@
+import logging
+from typing import Dict, Optional, Tuple
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Wait types a state machine can register a task token for
+INSTANCE_RUNNING = 'instance-running'
+AMI_AVAILABLE = 'ami-available'
+SSM_COMMAND = 'ssm-command'
+
+INSTANCE_FAILED_STATES = ('shutting-down', 'terminated', 'stopping', 'stopped')
+AMI_FAILED_STATES = ('failed', 'invalid', 'deregistered', 'error')
+COMMAND_FAILED_STATUSES = ('Failed', 'Cancelled', 'TimedOut', 'Undeliverable', 'Terminated',
+                           'DeliveryTimedOut', 'ExecutionTimedOut')
+
+SUCCESS = 'success'
+FAILURE = 'failure'
+
+
+def command_resource_id(command_id: str, instance_id: str) -> str:
+    """Resource ID of one SSM command invocation."""
+    return f"{command_id}:{instance_id}"
+
+
+def instance_outcome(state: str) -> Optional[str]:
+    if state == 'running':
+        return SUCCESS
+    return FAILURE if state in INSTANCE_FAILED_STATES else None
+
+
+def ami_outcome(state: str) -> Optional[str]:
+    if state == 'available':
+        return SUCCESS
+    return FAILURE if state in AMI_FAILED_STATES else None
+
+
+def command_outcome(status: str) -> Optional[str]:
+    if status == 'Success':
+        return SUCCESS
+    return FAILURE if status in COMMAND_FAILED_STATUSES else None
+
+
+def parse_event(event: Dict) -> Tuple[Optional[str], Optional[str], Optional[str], Dict]:
+    """Map an EventBridge event to (wait type, resource ID, outcome, output).
+
+    The outcome is None for events that do not end a wait (e.g. 'pending');
+    everything is None for events of an unsupported type.
+    """
+    detail_type = event.get('detail-type')
+    detail = event.get('detail', {})
+    if detail_type == 'EC2 Instance State-change Notification':
+        instance_id, state = detail.get('instance-id'), detail.get('state')
+        return INSTANCE_RUNNING, instance_id, instance_outcome(state), {
+            'InstanceId': instance_id, 'State': state}
+    if detail_type == 'EC2 AMI State Change':
+        ami_id, state = detail.get('ImageId'), detail.get('State')
+        return AMI_AVAILABLE, ami_id, ami_outcome(state), {
+            'ImageId': ami_id, 'State': state, 'ErrorMessage': detail.get('ErrorMessage', '')}
+    if detail_type == 'EC2 Command Invocation Status-change Notification':
+        command_id, instance_id = detail.get('command-id'), detail.get('instance-id')
+        status = detail.get('status')
+        return SSM_COMMAND, command_resource_id(command_id, instance_id), command_outcome(status), {
+            'CommandId': command_id, 'InstanceId': instance_id, 'Status': status}
+    return None, None, None, {}
+
+
+def current_outcome(wait_for: str, resource_id: str) -> Tuple[Optional[str], Dict]:
+    """Look the resource up directly, to catch completions that happened before the
+    task token was registered."""
+    ec2 = get_client('ec2')
+    try:
+        if wait_for == INSTANCE_RUNNING:
+            response = ec2.describe_instances(InstanceIds=[resource_id])
+            state = response['Reservations'][0]['Instances'][0]['State']['Name']
+            return instance_outcome(state), {'InstanceId': resource_id, 'State': state}
+        if wait_for == AMI_AVAILABLE:
+            images = ec2.describe_images(Filters=[{'Name': 'image-id', 'Values': [resource_id]}])['Images']
+            state = images[0]['State'] if images else 'pending'
+            return ami_outcome(state), {'ImageId': resource_id, 'State': state}
+        if wait_for == SSM_COMMAND:
+            command_id, instance_id = resource_id.split(':', 1)
+            response = get_client('ssm').get_command_invocation(
+                CommandId=command_id, InstanceId=instance_id
+            )
+            return command_outcome(response['Status']), {
+                'CommandId': command_id, 'InstanceId': instance_id, 'Status': response['Status']}
+    except ClientError as e:
+        # The invocation may not be visible yet; the event will complete the wait
+        logger.warning(f"Could not look up {wait_for} {resource_id}: {str(e)}")
+        return None, {}
+    raise ValueError(f"Unsupported wait type: {wait_for}")
@@ -0,0 +1,43 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from ami_distribution import start_copies
+from instrumentation import instrumented
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Start copying a baked AMI to every region of the distribution, in parallel.
+
+    Args:
+        event (dict): Must contain ImageId and Distribution, the settings
+                     resolved from the Auto Scaling group tags
+        context (Any): Lambda context object
+
+    Returns:
+        dict: ImageId, SourceRegion and Copies, one record per region
+    """
+    try:
+        if 'ImageId' not in event or 'Distribution' not in event:
+            error_msg = "Missing required parameters: ImageId or Distribution"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
+        image_id = event['ImageId']
+        source_region = get_client('ec2').meta.region_name
+        regions = event['Distribution']['Regions']
+        logger.info(f"Copying AMI {image_id} from {source_region} to {', '.join(regions)}")
+        copies = start_copies(get_client, image_id, source_region, regions)
+        return {'ImageId': image_id, 'SourceRegion': source_region, 'Copies': copies}
+
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
@@ -0,0 +1,106 @@
+import os
+import sys
+import logging
+import importlib.util
+from typing import Any, Dict
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PACKAGE_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Action name -> handler file. Handler files are only imported when their action
+# is first dispatched, so boto3 and the shared modules load once per container
+ACTIONS = {
+    'get-asg-and-launch-template': 'get-asg-and-launch-template_v3.py',
+    'launch-builder': 'launch-builder_v1.py',
+    'check-instance-state': 'check-instance-state_v1.py',
+    'sysprep': 'sysprep_v1.py',
+    'check-sysprep-status': 'check-sysprep-status_v1.py',
+    'check-ami-status': 'check-ami-status-function_v1.py',
+    'enable-image-acceleration': 'enable-image-acceleration_v1.py',
+    'check-image-acceleration': 'check-image-acceleration_v1.py',
+    'copy-ami-to-regions': 'copy-ami-to-regions_v1.py',
+    'check-ami-copies': 'check-ami-copies_v1.py',
+    'update-asg': 'updateASG_v1.py',
+    'check-instance-refresh': 'check-instance-refresh_v1.py',
+    'update-regional-asgs': 'update-regional-asgs_v1.py',
+    'restore-asg-capacity': 'restore-asg-capacity_v1.py',
+    'cleanup': 'Cleanup_v1.py',
+    'register-task-token': 'register-task-token_v1.py',
+    'task-token-callback': 'task-token-callback_v1.py',
+    'prune-launch-template-versions': 'prune-launch-template-versions_v1.py',
+    'coalesce-backup-events': 'coalesce-backup-events_v1.py',
+}
+ACTION_KEY = 'action'
+# For functions fed by EventBridge, whose events cannot carry an action
+DEFAULT_ACTION = os.environ.get('DISPATCH_DEFAULT_ACTION')
+
+
+class UnknownActionError(Exception):
+    """The event names an action the dispatcher does not know."""
+
+
+class ActionContext:
+    """The Lambda context, reporting the action as the function name.
+
+    API metrics are emitted per function name, so this keeps them per handler
+    even though every action runs in the same function.
+    """
+
+    def __init__(self, context: Any, action: str):
+        self._context = context
+        self.function_name = action
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._context, name)
+
+
+def module_name(filename: str) -> str:
+    return os.path.splitext(filename)[0].replace('-', '_')
+
+
+def load_action(action: str):
+    """Import the handler module of an action, once per container."""
+    if action not in ACTIONS:
+        raise UnknownActionError(f"Unknown action {action!r}, expected one of {', '.join(sorted(ACTIONS))}")
+    name = module_name(ACTIONS[action])
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(PACKAGE_ROOT, ACTIONS[action]))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            del sys.modules[name]
+            raise
+        logger.info(f"Loaded handler for action {action}")
+    return module
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Any:
+    """
+    Single entry point for every handler in the package.
+
+    Args:
+        event (dict): Handler event plus 'action' naming the handler (see ACTIONS);
+                     events without one go to DISPATCH_DEFAULT_ACTION
+        context (Any): Lambda context object
+
+    Returns:
+        The result of the action's lambda_handler
+    """
+    try:
+        action = event.get(ACTION_KEY, DEFAULT_ACTION) if isinstance(event, dict) else DEFAULT_ACTION
+        if action is None:
+            raise UnknownActionError(f"Event has no {ACTION_KEY!r} and DISPATCH_DEFAULT_ACTION is not set")
+        handler = load_action(action).lambda_handler
+        if isinstance(event, dict) and ACTION_KEY in event:
+            event = {key: value for key, value in event.items() if key != ACTION_KEY}
+        return handler(event, ActionContext(context, action))
+
+    except Exception as e:
+        logger.error(f"Error dispatching event: {str(e)}")
+        raise
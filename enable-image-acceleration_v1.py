@@ -0,0 +1,39 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from image_acceleration import enable_acceleration
+from instrumentation import instrumented
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Enable Fast Launch and/or Fast Snapshot Restore for a baked AMI.
+
+    Args:
+        event (dict): Must contain ImageId and Acceleration, the settings
+                     resolved from the Auto Scaling group tags
+        context (Any): Lambda context object
+
+    Returns:
+        dict: ImageId, SnapshotIds and the enabled Features
+    """
+    try:
+        if 'ImageId' not in event or 'Acceleration' not in event:
+            error_msg = "Missing required parameters: ImageId or Acceleration"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
+        logger.info(f"Enabling acceleration for AMI {event['ImageId']}: {event['Acceleration']}")
+        return enable_acceleration(get_client('ec2'), event['ImageId'], event['Acceleration'])
+
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
@@ -1,89 +1,157 @@
 import json
-import boto3
 import logging
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from backup_job_resolver import (
+    describe_backup_job, get_launch_template, index_instances, resolve_backup_jobs
+)
+import metadata_cache
+from image_acceleration import acceleration_config
+from ami_distribution import distribution_config
+from builder_launch import builder_launch_config
+from instance_refresh import instance_refresh_config
+from capacity_guard import NONE, PIN_MAX, apply_capacity_mode, capacity_mode
+from bake_ledger import RESOLVED, bake_output, begin_bake, get_bake_ledger
+from instrumentation import instrumented
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+def resolve_backup_job_batch(backup, ec2, asg, backup_job_ids, mode):
+    """Resolve a list of backup jobs, returning one record per job."""
+    logger.info(f"Resolving {len(backup_job_ids)} backup jobs in batch mode")
+    results = resolve_backup_jobs(
+        backup, ec2, asg, backup_job_ids, mode
+    )
+    failed = sum(1 for result in results if 'Error' in result)
+    logger.info(f"Resolved {len(results) - failed} backup jobs, {failed} failed")
+    return {
+        'Results': results,
+        'SucceededCount': len(results) - failed,
+        'FailedCount': failed
+    }
+
+def resolve_backup_job(ec2, asg, ami_id, instance_id, mode):
+    """Resolve one backup job's instance to its ASG and launch template.
+
+    Only looks things up; guard_capacity applies the capacity mode.
+    """
+    # Get the ASG membership of the instance, from its tags only if the ASG no longer lists it
+    instance = index_instances(ec2, asg, [instance_id]).get(instance_id)
+    if instance is None:
+        raise ValueError(f"Instance {instance_id} not found")
+    asg_name = instance['AutoScalingGroupName']
+    if asg_name is None:
+        raise ValueError(f"Instance {instance_id} is not part of an Auto Scaling group")
+
+    logger.info(f"Auto Scaling Group name: {asg_name}")
+
+    # The group tags say whether to enable Fast Launch / Fast Snapshot Restore,
+    # whether to refresh the running instances, which regions get a copy and
+    # which instance types and subnets the builder may use
+    asg_group = metadata_cache.describe_auto_scaling_group(asg, asg_name)
+    acceleration = acceleration_config(asg_group)
+    instance_refresh = instance_refresh_config(asg_group)
+    distribution = distribution_config(asg_group)
+    builder_launch = builder_launch_config(asg_group, instance['InstanceType'])
+    logger.info(f"Acceleration: {acceleration}, instance refresh: {instance_refresh}, "
+                f"distribution: {distribution}")
+
+    # Get launch template details
+    launch_template_name, launch_template_id = get_launch_template(instance, asg_group)
+
+    logger.info(f"Launch Template Name: {launch_template_name}")
+    logger.info(f"Launch Template ID: {launch_template_id}")
+
+    return {
+        'AutoScalingGroupName': asg_name,
+        'LaunchTemplateName': launch_template_name,
+        'LaunchTemplateId': launch_template_id,
+        'BackupAMIId': ami_id,
+        'InstanceId': instance_id,
+        'CapacityMode': mode,
+        'OriginalMaxCapacity': None,
+        'InstanceType': instance['InstanceType'],
+        'Acceleration': acceleration,
+        'InstanceRefresh': instance_refresh,
+        'Distribution': distribution,
+        'BuilderLaunch': builder_launch
+    }
+
+def execution_running(execution_arn):
+    """True if the Step Functions execution that owns a bake is still running."""
+    try:
+        return get_client('stepfunctions').describe_execution(
+            executionArn=execution_arn
+        )['status'] == 'RUNNING'
+    except ClientError as e:
+        logger.warning(f"Could not describe execution {execution_arn}: {str(e)}")
+        return False
+
+def guard_capacity(asg, resolved):
+    """Pin the capacity or suspend processes of the bake's group.
+
+    The original state is kept on the group, so applying it again (e.g. when
+    an execution takes a bake over) restores to the same values.
+    """
+    mode = resolved['CapacityMode']
+    if mode == NONE:
+        return resolved
+    asg_group = metadata_cache.describe_auto_scaling_group(asg, resolved['AutoScalingGroupName'])
+    capacity_state = apply_capacity_mode(asg, asg_group, mode)
+    return dict(resolved, OriginalMaxCapacity=capacity_state.get('MaxSize') if mode == PIN_MAX else None)
+
+@instrumented
 def lambda_handler(event, context):
     try:
-        logger.info(f"Received event: {json.dumps(event, indent=2)}")
+        # Batch events can carry hundreds of IDs; only serialize the full event when debugging
+        logger.info(f"Received event with keys: {sorted(event)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Received event: {json.dumps(event)}")
+        metadata_cache.start_invocation()
+        
+        mode = capacity_mode(event.get('CapacityMode'), event.get('setMaxCapacityEqualToDesiredCapacity', True))
         
+        # Get the shared AWS clients
+        backup = get_client('backup')
+        ec2 = get_client('ec2')
+        asg = get_client('autoscaling')
+
+        # Batch mode: resolve a whole backup window in one invocation
+        if 'backupJobIds' in event:
+            return resolve_backup_job_batch(
+                backup, ec2, asg, event['backupJobIds'], mode
+            )
+
         # Extract relevant information from the event
         backup_job_id = event['backupJobId']
-        set_max_capacity_equal_to_desired = event.get('setMaxCapacityEqualToDesiredCapacity', True)
-        
-        # Initialize AWS clients
-        backup = boto3.client('backup')
-        ec2 = boto3.client('ec2')
-        asg = boto3.client('autoscaling')
         
         try:
-            # Get details of the backup job
-            response = backup.describe_backup_job(BackupJobId=backup_job_id)
-            
-            # Extract the AMI ID and instance ID
-            recovery_point_arn = response['RecoveryPointArn']
-            ami_id = recovery_point_arn.split('/')[-1]
-            resource_arn = response['ResourceArn']
-            instance_id = resource_arn.split('/')[-1]
+            # Get the AMI ID and instance ID of the backup job
+            ami_id, instance_id = describe_backup_job(backup, backup_job_id)
             
             logger.info(f"AMI ID: {ami_id}")
             logger.info(f"Instance ID: {instance_id}")
             
-            # Get instance details
-            instance_response = ec2.describe_instances(InstanceIds=[instance_id])
-            instance = instance_response['Reservations'][0]['Instances'][0]
-            
-            # Get ASG name from instance tags
-            asg_name = None
-            for tag in instance['Tags']:
-                if tag['Key'] == 'aws:autoscaling:groupName':
-                    asg_name = tag['Value']
-                    break
-            
-            logger.info(f"Auto Scaling Group name: {asg_name}")
-
-            # Get launch template details
-            launch_template_name = None
-            launch_template_id = None
-            if 'LaunchTemplate' in instance:
-                launch_template_name = instance['LaunchTemplate']['LaunchTemplateName']
-                launch_template_id = instance['LaunchTemplate']['LaunchTemplateId']
-            else:
-                asg_response = asg.describe_auto_scaling_groups(AutoScalingGroupNames=[asg_name])
-                asg_group = asg_response['AutoScalingGroups'][0]
-                if 'LaunchTemplate' in asg_group:
-                    launch_template_name = asg_group['LaunchTemplate']['LaunchTemplateName']
-                    launch_template_id = asg_group['LaunchTemplate']['LaunchTemplateId']
-            
-            logger.info(f"Launch Template Name: {launch_template_name}")
-            logger.info(f"Launch Template ID: {launch_template_id}")
-
-            # Update ASG max capacity if needed
-            original_max_capacity = None
-            if set_max_capacity_equal_to_desired:
-                asg_response = asg.describe_auto_scaling_groups(AutoScalingGroupNames=[asg_name])
-                asg_group = asg_response['AutoScalingGroups'][0]
-                desired_capacity = asg_group['DesiredCapacity']
-                original_max_capacity = asg_group['MaxSize']
-
-                logger.info(f"Updating ASG max capacity from {original_max_capacity} to {desired_capacity}")
-                asg.update_auto_scaling_group(
-                    AutoScalingGroupName=asg_name,
-                    MaxSize=desired_capacity
-                )
-
-            return {
-                'AutoScalingGroupName': asg_name,
-                'LaunchTemplateName': launch_template_name,
-                'LaunchTemplateId': launch_template_id,
-                'BackupAMIId': ami_id,
-                'InstanceId': instance_id,
-                'OriginalMaxCapacity': original_max_capacity,
-                'InstanceType': instance['InstanceType']
-            }
+            # Bakes are keyed by recovery point, so a retried execution or a
+            # duplicate event picks up where the previous attempt stopped
+            ledger = get_bake_ledger()
+            if ledger is None:
+                return bake_output({
+                    'BakeKey': ami_id,
+                    'Stage': RESOLVED,
+                    'Resolved': guard_capacity(asg, resolve_backup_job(ec2, asg, ami_id, instance_id, mode))
+                }, ledger_enabled=False)
+            # The ledger record is written before the group is touched, so an
+            # execution that loses the race for the bake changes nothing
+            record = begin_bake(
+                ledger, ami_id, event.get('ExecutionId'),
+                lambda: resolve_backup_job(ec2, asg, ami_id, instance_id, mode),
+                execution_running,
+                lambda resolved: guard_capacity(asg, resolved)
+            )
+            return bake_output(record)
 
         except Exception as e:
             logger.error(f"Error processing backup job: {str(e)}")
@@ -0,0 +1,173 @@
+import logging
+from typing import Dict, List
+from botocore.exceptions import ClientError
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Auto Scaling group tags that opt a group's baked AMIs in:
+#   ami-bake:fast-launch = "true" or the number of pre-provisioned snapshots
+#   ami-bake:fast-launch-template = launch template ID used to pre-provision
+#   ami-bake:fsr-azs = comma-separated Availability Zones for Fast Snapshot Restore
+FAST_LAUNCH_TAG = 'ami-bake:fast-launch'
+FAST_LAUNCH_TEMPLATE_TAG = 'ami-bake:fast-launch-template'
+FSR_AZS_TAG = 'ami-bake:fsr-azs'
+# Put on the baked AMI when acceleration is enabled, so cleanup knows to disable it
+ACCELERATION_TAG = 'ami-bake:acceleration'
+FAST_LAUNCH = 'fast-launch'
+FAST_SNAPSHOT_RESTORE = 'fast-snapshot-restore'
+
+DEFAULT_FAST_LAUNCH_SNAPSHOTS = 5
+# EnableFastLaunch rejects fewer than 6 parallel launches
+MIN_PARALLEL_LAUNCHES = 6
+FAST_LAUNCH_FAILED_STATES = ('enabling-failed', 'enabled-failed', 'disabling', 'disabling-failed', 'not-enabled')
+FSR_FAILED_STATES = ('disabling', 'disabled')
+
+
+def _tags(resource: Dict) -> Dict[str, str]:
+    return {tag['Key']: tag['Value'] for tag in resource.get('Tags', [])}
+
+
+def acceleration_config(asg_group: Dict) -> Dict:
+    """Read the acceleration settings of an Auto Scaling group from its tags."""
+    tags = _tags(asg_group)
+    fast_launch = tags.get(FAST_LAUNCH_TAG, '').strip().lower()
+    if fast_launch in ('', 'false', '0'):
+        snapshots = 0
+    elif fast_launch.isdigit():
+        snapshots = int(fast_launch)
+    else:
+        if fast_launch != 'true':
+            logger.warning(f"Invalid {FAST_LAUNCH_TAG} tag {fast_launch!r} on "
+                           f"{asg_group.get('AutoScalingGroupName')}, using "
+                           f"{DEFAULT_FAST_LAUNCH_SNAPSHOTS} snapshots")
+        snapshots = DEFAULT_FAST_LAUNCH_SNAPSHOTS
+    azs = [az.strip() for az in tags.get(FSR_AZS_TAG, '').split(',') if az.strip()]
+    return {
+        'Enabled': bool(snapshots or azs),
+        'FastLaunchSnapshots': snapshots,
+        'FastLaunchTemplateId': tags.get(FAST_LAUNCH_TEMPLATE_TAG),
+        'FastSnapshotRestoreAZs': azs
+    }
+
+
+def acceleration_features(config: Dict) -> List[str]:
+    """Return the features an acceleration config enables."""
+    features = []
+    if config.get('FastLaunchSnapshots'):
+        features.append(FAST_LAUNCH)
+    if config.get('FastSnapshotRestoreAZs'):
+        features.append(FAST_SNAPSHOT_RESTORE)
+    return features
+
+
+def image_snapshot_ids(image: Dict) -> List[str]:
+    """Return the EBS snapshot IDs behind an image description."""
+    return [mapping['Ebs']['SnapshotId'] for mapping in image.get('BlockDeviceMappings', [])
+            if mapping.get('Ebs', {}).get('SnapshotId')]
+
+
+def enable_acceleration(ec2_client, image_id: str, config: Dict) -> Dict:
+    """Enable Fast Launch and/or Fast Snapshot Restore for a baked AMI.
+
+    The image is tagged first, so cleanup disables whatever was enabled even if
+    one of the calls below fails.
+    """
+    image = ec2_client.describe_images(ImageIds=[image_id])['Images'][0]
+    snapshot_ids = image_snapshot_ids(image)
+    features = acceleration_features(config)
+    ec2_client.create_tags(Resources=[image_id], Tags=[{'Key': ACCELERATION_TAG, 'Value': ','.join(features)}])
+
+    if FAST_LAUNCH in features:
+        params = {
+            'ImageId': image_id,
+            'ResourceType': 'snapshot',
+            'SnapshotConfiguration': {'TargetResourceCount': config['FastLaunchSnapshots']},
+            'MaxParallelLaunches': max(MIN_PARALLEL_LAUNCHES, config['FastLaunchSnapshots'])
+        }
+        if config.get('FastLaunchTemplateId'):
+            params['LaunchTemplate'] = {'LaunchTemplateId': config['FastLaunchTemplateId'], 'Version': '$Default'}
+        state = ec2_client.enable_fast_launch(**params)['State']
+        logger.info(f"Fast Launch for {image_id}: {state}, "
+                    f"{config['FastLaunchSnapshots']} pre-provisioned snapshots")
+
+    if FAST_SNAPSHOT_RESTORE in features:
+        response = ec2_client.enable_fast_snapshot_restores(
+            AvailabilityZones=config['FastSnapshotRestoreAZs'], SourceSnapshotIds=snapshot_ids
+        )
+        if response.get('Unsuccessful'):
+            errors = [f"{item['SnapshotId']}: {error['FastSnapshotRestoreStateError']['Message']}"
+                      for item in response['Unsuccessful']
+                      for error in item['FastSnapshotRestoreStateErrors']]
+            raise RuntimeError(f"Could not enable Fast Snapshot Restore for {image_id}: {'; '.join(errors)}")
+        logger.info(f"Fast Snapshot Restore for {len(snapshot_ids)} snapshots of {image_id} "
+                    f"in {', '.join(config['FastSnapshotRestoreAZs'])}")
+
+    return {'ImageId': image_id, 'SnapshotIds': snapshot_ids, 'Features': features}
+
+
+def fast_snapshot_restore_states(ec2_client, snapshot_ids: List[str]) -> Dict[str, str]:
+    """Return the Fast Snapshot Restore state per '<snapshot>/<AZ>'."""
+    states = {}
+    paginator = ec2_client.get_paginator('describe_fast_snapshot_restores')
+    for page in paginator.paginate(Filters=[{'Name': 'snapshot-id', 'Values': snapshot_ids}]):
+        for restore in page['FastSnapshotRestores']:
+            states[f"{restore['SnapshotId']}/{restore['AvailabilityZone']}"] = restore['State']
+    return states
+
+
+def acceleration_status(ec2_client, image_id: str, snapshot_ids: List[str], config: Dict) -> Dict:
+    """Report whether every enabled feature of an AMI is ready, or has failed."""
+    status = {'ImageId': image_id, 'Ready': True, 'Failed': False}
+
+    if config.get('FastLaunchSnapshots'):
+        images = ec2_client.describe_fast_launch_images(ImageIds=[image_id])['FastLaunchImages']
+        state = images[0]['State'] if images else 'not-enabled'
+        status['FastLaunchState'] = state
+        if state in FAST_LAUNCH_FAILED_STATES:
+            status['Failed'] = True
+            status['Reason'] = images[0].get('StateTransitionReason', state) if images else state
+        status['Ready'] = state == 'enabled'
+
+    if config.get('FastSnapshotRestoreAZs'):
+        states = fast_snapshot_restore_states(ec2_client, snapshot_ids)
+        expected = [f"{snapshot_id}/{az}" for snapshot_id in snapshot_ids
+                    for az in config['FastSnapshotRestoreAZs']]
+        # A request that is not listed yet is still being processed
+        status['FastSnapshotRestoreStates'] = {key: states.get(key, 'enabling') for key in expected}
+        failed = [key for key in expected if states.get(key) in FSR_FAILED_STATES]
+        if failed:
+            status['Failed'] = True
+            status['Reason'] = f"Fast Snapshot Restore disabled for {', '.join(failed)}"
+        status['Ready'] = status['Ready'] and all(states.get(key) == 'enabled' for key in expected)
+
+    return status
+
+
+def disable_acceleration(ec2_client, image_id: str, snapshot_ids: List[str], features: List[str]) -> List[Dict]:
+    """Disable Fast Launch and Fast Snapshot Restore before an AMI is deleted.
+
+    Returns the errors as {'Id', 'Error'} records instead of raising.
+    """
+    errors = []
+    if FAST_LAUNCH in features:
+        try:
+            # Force also deletes the pre-provisioned snapshots
+            ec2_client.disable_fast_launch(ImageId=image_id, Force=True)
+        except ClientError as e:
+            errors.append({'Id': image_id, 'Error': str(e)})
+    if FAST_SNAPSHOT_RESTORE in features and snapshot_ids:
+        try:
+            by_az: Dict[str, List[str]] = {}
+            for key, state in fast_snapshot_restore_states(ec2_client, snapshot_ids).items():
+                if state != 'disabled':
+                    snapshot_id, az = key.split('/')
+                    by_az.setdefault(az, []).append(snapshot_id)
+            for az, ids in sorted(by_az.items()):
+                ec2_client.disable_fast_snapshot_restores(AvailabilityZones=[az], SourceSnapshotIds=ids)
+        except ClientError as e:
+            errors.append({'Id': image_id, 'Error': str(e)})
+    if not errors:
+        logger.info(f"Disabled {', '.join(features)} for {image_id}")
+    return errors
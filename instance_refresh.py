@@ -0,0 +1,124 @@
+import json
+import logging
+from typing import Dict, Optional
+from botocore.exceptions import ClientError
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Auto Scaling group tag that opts a group into an instance refresh after each
+# bake: "true" for the defaults below, or a JSON object of refresh Preferences
+INSTANCE_REFRESH_TAG = 'ami-bake:instance-refresh'
+
+# Launch before terminate: the group never drops below its desired capacity and
+# grows by at most 10% while instances are replaced
+DEFAULT_PREFERENCES = {
+    'MinHealthyPercentage': 100,
+    'MaxHealthyPercentage': 110,
+    'InstanceWarmup': 300,
+    'SkipMatching': True
+}
+IN_PROGRESS_STATUSES = ('Pending', 'InProgress', 'Baking', 'Cancelling', 'RollbackInProgress')
+SUCCEEDED_STATUSES = ('Successful',)
+# StartInstanceRefresh calls made when a running refresh ends before it is adopted
+START_ATTEMPTS = 3
+
+
+def instance_refresh_config(asg_group: Dict) -> Optional[Dict]:
+    """Read the refresh preferences of an Auto Scaling group from its tag, or None."""
+    for tag in asg_group.get('Tags', []):
+        if tag['Key'] == INSTANCE_REFRESH_TAG:
+            value = tag['Value'].strip()
+            if value.lower() in ('', 'false', '0'):
+                return None
+            return {} if value.lower() == 'true' else json.loads(value)
+    return None
+
+
+def refresh_preferences(config) -> Dict:
+    """Merge requested preferences over the defaults.
+
+    Checkpoints must end at 100%, so a final checkpoint is added when missing.
+    """
+    preferences = dict(DEFAULT_PREFERENCES, **(config if isinstance(config, dict) else {}))
+    checkpoints = preferences.get('CheckpointPercentages')
+    if checkpoints and checkpoints[-1] != 100:
+        preferences['CheckpointPercentages'] = list(checkpoints) + [100]
+    return preferences
+
+
+def find_active_refresh(asg_client, asg_name: str) -> Optional[Dict]:
+    """Return the group's refresh that is still running, if any."""
+    refreshes = asg_client.describe_instance_refreshes(
+        AutoScalingGroupName=asg_name, MaxRecords=10
+    )['InstanceRefreshes']
+    return next((refresh for refresh in refreshes if refresh['Status'] in IN_PROGRESS_STATUSES), None)
+
+
+def start_refresh(asg_client, asg_name: str, config) -> Dict:
+    """Start an instance refresh of the group and return its ID and preferences.
+
+    A refresh that is already running (e.g. started by a previous attempt of the
+    same bake) is adopted instead of failing the update. If that refresh ends
+    before it can be found, starting is tried again.
+    """
+    preferences = refresh_preferences(config)
+    for attempt in range(1, START_ATTEMPTS + 1):
+        try:
+            refresh_id = asg_client.start_instance_refresh(
+                AutoScalingGroupName=asg_name, Strategy='Rolling', Preferences=preferences
+            )['InstanceRefreshId']
+            logger.info(f"Started instance refresh {refresh_id} for {asg_name} with {preferences}")
+            return {'InstanceRefreshId': refresh_id, 'Preferences': preferences}
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'InstanceRefreshInProgress':
+                raise
+        active = find_active_refresh(asg_client, asg_name)
+        if active:
+            refresh_id = active['InstanceRefreshId']
+            logger.info(f"Instance refresh {refresh_id} is already running for {asg_name}")
+            return {'InstanceRefreshId': refresh_id, 'Preferences': preferences}
+        logger.warning(f"Instance refresh for {asg_name} finished before it could be adopted "
+                       f"(attempt {attempt}/{START_ATTEMPTS})")
+    raise RuntimeError(f"Could not start or adopt an instance refresh for {asg_name} "
+                       f"after {START_ATTEMPTS} attempts")
+
+
+def describe_refresh(asg_client, asg_name: str, refresh_id: str) -> Dict:
+    return asg_client.describe_instance_refreshes(
+        AutoScalingGroupName=asg_name, InstanceRefreshIds=[refresh_id]
+    )['InstanceRefreshes'][0]
+
+
+def refresh_progress(refresh: Dict, poll_state: Dict, elapsed: float) -> Dict:
+    """Summarize a refresh: replaced instances, percentage and time remaining.
+
+    InstancesToUpdate only counts down, so the number replaced is taken against
+    the largest value seen, which the caller keeps in the poll state.
+    """
+    to_update = refresh.get('InstancesToUpdate', 0)
+    total = max(poll_state.get('instancesTotal', 0), to_update)
+    percentage = refresh.get('PercentageComplete', 0)
+    remaining = None
+    if 0 < percentage < 100:
+        remaining = int(elapsed * (100 - percentage) / percentage)
+    return {
+        'refreshStatus': refresh['Status'],
+        'StatusReason': refresh.get('StatusReason'),
+        'PercentageComplete': percentage,
+        'InstancesToUpdate': to_update,
+        'InstancesReplaced': total - to_update,
+        'InstancesTotal': total,
+        'EstimatedSecondsRemaining': remaining
+    }
+
+
+def cancel_refresh(asg_client, asg_name: str) -> None:
+    """Cancel the group's running refresh; replaced instances stay replaced."""
+    try:
+        asg_client.cancel_instance_refresh(AutoScalingGroupName=asg_name)
+        logger.warning(f"Cancelled instance refresh for {asg_name}")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ActiveInstanceRefreshNotFound':
+            raise
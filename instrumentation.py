@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+import logging
+from typing import Any, Callable, Dict
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+METRICS_ENABLED = os.environ.get('API_METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('API_METRICS_NAMESPACE', 'AsgAmiBake')
+THROTTLING_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'ProvisionedThroughputExceededException',
+    'TransactionInProgressException', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete',
+    'EC2ThrottledException'
+}
+_START_KEY = 'api_metrics_started_at'
+_THROTTLES_KEY = 'api_metrics_throttles'
+
+
+class ApiCallMetrics:
+    """Per-invocation API call statistics, keyed by 'service.Operation'."""
+
+    def __init__(self):
+        self.operations: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.operations = {}
+
+    def _entry(self, operation: str) -> Dict[str, float]:
+        entry = self.operations.get(operation)
+        if entry is None:
+            entry = self.operations[operation] = {
+                'Calls': 0, 'LatencyMs': 0.0, 'MaxLatencyMs': 0.0, 'Retries': 0,
+                'Throttles': 0, 'Errors': 0, 'ResponseBytes': 0
+            }
+        return entry
+
+    def record_call(self, operation: str, latency_ms: float, retries: int, throttles: int,
+                    response_bytes: int, error_code: str = None) -> None:
+        with self._lock:
+            entry = self._entry(operation)
+            entry['Calls'] += 1
+            entry['LatencyMs'] += latency_ms
+            entry['MaxLatencyMs'] = max(entry['MaxLatencyMs'], latency_ms)
+            entry['Retries'] += retries
+            entry['Throttles'] += throttles
+            entry['ResponseBytes'] += response_bytes
+            if error_code:
+                entry['Errors'] += 1
+
+    def totals(self) -> Dict[str, float]:
+        with self._lock:
+            totals = {'Calls': 0, 'LatencyMs': 0.0, 'Retries': 0, 'Throttles': 0,
+                      'Errors': 0, 'ResponseBytes': 0}
+            for entry in self.operations.values():
+                for key in totals:
+                    totals[key] += entry[key]
+            return totals
+
+
+# One recorder per container; Lambda runs one invocation at a time per container,
+# but a handler may call another instrumented handler (from worker threads too),
+# so only the outermost call resets and flushes it
+metrics = ApiCallMetrics()
+_active = {'depth': 0}
+_active_lock = threading.Lock()
+
+
+def _operation(model) -> str:
+    return f"{model.service_model.service_name}.{model.name}"
+
+
+def _start_timer(model, context, **kwargs):
+    context[_START_KEY] = time.perf_counter()
+
+
+def _record_response(http_response, parsed, model, context, **kwargs):
+    started = context.pop(_START_KEY, None)
+    latency_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+    response_metadata = parsed.get('ResponseMetadata', {}) if isinstance(parsed, dict) else {}
+    headers = getattr(http_response, 'headers', None) or {}
+    try:
+        response_bytes = int(headers.get('content-length', 0))
+    except (TypeError, ValueError):
+        response_bytes = 0
+    error_code = parsed.get('Error', {}).get('Code') if isinstance(parsed, dict) else None
+    # needs-retry sees every attempt including the last; stubbed calls skip it entirely
+    throttles = max(context.pop(_THROTTLES_KEY, 0), 1 if error_code in THROTTLING_ERROR_CODES else 0)
+    metrics.record_call(_operation(model), latency_ms, response_metadata.get('RetryAttempts', 0),
+                        throttles, response_bytes, error_code)
+
+
+def _record_exception(exception, model, context, **kwargs):
+    """Connection errors and the like never reach after-call."""
+    started = context.pop(_START_KEY, None)
+    latency_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+    metrics.record_call(_operation(model), latency_ms, 0, context.pop(_THROTTLES_KEY, 0), 0,
+                        type(exception).__name__)
+
+
+def _count_throttled_attempt(response, request_dict, **kwargs):
+    """Count throttled attempts on the request context; the retry handler runs after this."""
+    if response is not None and response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+        context = request_dict['context']
+        context[_THROTTLES_KEY] = context.get(_THROTTLES_KEY, 0) + 1
+
+
+def instrument_client(client) -> None:
+    """Attach the metric hooks to a client; safe to call more than once."""
+    if not METRICS_ENABLED:
+        return
+    service_id = client.meta.service_model.service_id.hyphenize()
+    events = client.meta.events
+    # before-call fires after the first token and serialization, so latency is the wire
+    # time of every attempt plus backoff and the tokens the retries wait for
+    events.register_first(f"before-call.{service_id}", _start_timer, unique_id='api-metrics-start')
+    events.register(f"after-call.{service_id}", _record_response, unique_id='api-metrics-end')
+    events.register(f"after-call-error.{service_id}", _record_exception,
+                    unique_id='api-metrics-error')
+    events.register_first(f"needs-retry.{service_id}", _count_throttled_attempt,
+                          unique_id='api-metrics-retry')
+
+
+def emf_document(function_name: str, dimensions: Dict[str, str], values: Dict[str, Any],
+                 units: Dict[str, str]) -> Dict:
+    """Build one CloudWatch Embedded Metric Format document."""
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': units[name]} for name in values]
+            }]
+        },
+        'FunctionName': function_name
+    }
+    document.update(dimensions)
+    document.update(values)
+    return document
+
+
+API_UNITS = {'Calls': 'Count', 'LatencyMs': 'Milliseconds', 'MaxLatencyMs': 'Milliseconds',
+             'Retries': 'Count', 'Throttles': 'Count', 'Errors': 'Count', 'ResponseBytes': 'Bytes'}
+
+
+def flush_metrics(function_name: str, duration_ms: float, stream=None) -> None:
+    """Write one EMF line per operation and a per-invocation summary line."""
+    stream = stream or sys.stdout
+    for operation, values in sorted(metrics.operations.items()):
+        stream.write(json.dumps(emf_document(
+            function_name, {'FunctionName': function_name, 'Operation': operation},
+            {name: round(value, 3) for name, value in values.items()}, API_UNITS
+        )) + '\n')
+    totals = metrics.totals()
+    summary_values = {'InvocationDurationMs': round(duration_ms, 3),
+                      'ApiCalls': totals['Calls'], 'ApiLatencyMs': round(totals['LatencyMs'], 3),
+                      'ApiRetries': totals['Retries'], 'ApiThrottles': totals['Throttles'],
+                      'ApiErrors': totals['Errors'], 'ApiResponseBytes': totals['ResponseBytes']}
+    summary_units = {'InvocationDurationMs': 'Milliseconds', 'ApiCalls': 'Count',
+                     'ApiLatencyMs': 'Milliseconds', 'ApiRetries': 'Count', 'ApiThrottles': 'Count',
+                     'ApiErrors': 'Count', 'ApiResponseBytes': 'Bytes'}
+    stream.write(json.dumps(emf_document(
+        function_name, {'FunctionName': function_name}, summary_values, summary_units
+    )) + '\n')
+    stream.flush()
+
+
+def instrumented(handler: Callable) -> Callable:
+    """Decorate a lambda_handler to emit API metrics for every invocation."""
+    default_name = handler.__module__
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not METRICS_ENABLED:
+            return handler(event, context)
+        with _active_lock:
+            nested = _active['depth'] > 0
+            _active['depth'] += 1
+        if nested:
+            # The calls count toward the invocation that is already being recorded
+            try:
+                return handler(event, context)
+            finally:
+                with _active_lock:
+                    _active['depth'] -= 1
+        metrics.reset()
+        started = time.perf_counter()
+        try:
+            return handler(event, context)
+        finally:
+            with _active_lock:
+                _active['depth'] -= 1
+            function_name = getattr(context, 'function_name', None) or default_name
+            try:
+                flush_metrics(function_name, (time.perf_counter() - started) * 1000)
+            except Exception as e:
+                logger.warning(f"Could not emit API metrics: {str(e)}")
+    return wrapper
@@ -0,0 +1,67 @@
+import sys
+import json
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from builder_launch import compatible_instance_types, launch_builder, launch_candidates
+from instrumentation import METRICS_ENABLED, emf_document, instrumented
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+LAUNCH_UNITS = {'LaunchAttempts': 'Count', 'LaunchSeconds': 'Seconds'}
+
+def emit_launch_metrics(function_name: str, result: Dict) -> None:
+    """One EMF line per launch, by the instance type and AZ that had capacity."""
+    if not METRICS_ENABLED:
+        return
+    dimensions = {'InstanceType': result['InstanceType'],
+                  'AvailabilityZone': result['AvailabilityZone']}
+    values = {'LaunchAttempts': len(result['Attempts']), 'LaunchSeconds': result['LaunchSeconds']}
+    sys.stdout.write(json.dumps(emf_document(function_name, dimensions, values, LAUNCH_UNITS)) + '\n')
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Launch the builder instance, falling back to other instance types and AZs.
+
+    Args:
+        event (dict): Must contain ImageId, SubnetId, LaunchParameters (the
+                     RunInstances parameters without ImageId and InstanceType)
+                     and BuilderLaunch, the ranked InstanceTypes and extra
+                     SubnetIds resolved from the Auto Scaling group tags;
+                     optionally ClientToken, any string unique to the bake
+                     (the state machines use the execution ID and backup AMI)
+        context (Any): Lambda context object
+
+    Returns:
+        dict: Instances (the InstanceId), the InstanceType, SubnetId and
+              AvailabilityZone that were launched, Attempts and LaunchSeconds
+    """
+    try:
+        builder_launch = event['BuilderLaunch']
+        subnet_ids = [event['SubnetId']] + [subnet_id for subnet_id in builder_launch.get('SubnetIds', [])
+                                            if subnet_id != event['SubnetId']]
+        launch_parameters = dict(event['LaunchParameters'], ImageId=event['ImageId'])
+
+        ec2 = get_client('ec2')
+        instance_types = compatible_instance_types(ec2, builder_launch['InstanceTypes'])
+        candidates = launch_candidates(instance_types, subnet_ids)
+        logger.info(f"Launching builder from {event['ImageId']}: {len(instance_types)} instance types "
+                    f"in {len(subnet_ids)} subnets")
+
+        result = launch_builder(ec2, launch_parameters, candidates, event.get('ClientToken'))
+        emit_launch_metrics(getattr(context, 'function_name', None) or 'launch-builder', result)
+        return result
+
+    except KeyError as e:
+        logger.error(f"Missing required parameter: {str(e)}")
+        raise
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
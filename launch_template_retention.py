@@ -0,0 +1,154 @@
+import os
+import logging
+from typing import Dict, Iterable, List, Set
+from botocore.exceptions import ClientError
+from backup_job_resolver import chunked
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# DeleteLaunchTemplateVersions accepts at most 200 versions per call
+DELETE_BATCH_SIZE = 200
+DEFAULT_KEEP_LAST = int(os.environ.get('LAUNCH_TEMPLATE_KEEP_LAST', '10'))
+# Put on other Auto Scaling groups that use a launch template, with its ID as
+# the value, so pruning after a bake protects their pinned versions without
+# describing every group in the region
+SHARED_TEMPLATE_TAG = 'ami-bake:launch-template'
+
+
+def get_pinned_versions(asg_client, asg_names: List[str] = None,
+                        filters: List[Dict] = None) -> Dict[str, Set[int]]:
+    """Return the numeric launch template versions referenced by Auto Scaling groups.
+
+    Only the named groups and the groups matching filters are described; all
+    groups in the region when neither is given. Groups that use $Latest or
+    $Default pin nothing extra, because the latest and default versions are
+    always retained.
+    """
+    pinned: Dict[str, Set[int]] = {}
+
+    def pin(specification):
+        version = specification.get('Version', '')
+        template_id = specification.get('LaunchTemplateId')
+        if template_id and version.isdigit():
+            pinned.setdefault(template_id, set()).add(int(version))
+
+    paginator = asg_client.get_paginator('describe_auto_scaling_groups')
+    pages = [paginator.paginate(AutoScalingGroupNames=chunk) for chunk in chunked(asg_names or [], 50)]
+    if filters:
+        pages.append(paginator.paginate(Filters=filters))
+    if not asg_names and not filters:
+        pages.append(paginator.paginate())
+    for page_iterator in pages:
+        for page in page_iterator:
+            for group in page['AutoScalingGroups']:
+                if 'LaunchTemplate' in group:
+                    pin(group['LaunchTemplate'])
+                policy = group.get('MixedInstancesPolicy', {}).get('LaunchTemplate', {})
+                if 'LaunchTemplateSpecification' in policy:
+                    pin(policy['LaunchTemplateSpecification'])
+                for override in policy.get('Overrides', []):
+                    if 'LaunchTemplateSpecification' in override:
+                        pin(override['LaunchTemplateSpecification'])
+    return pinned
+
+
+def get_template_pinned_versions(asg_client, launch_template_id: str, asg_names: List[str]) -> Set[int]:
+    """Pinned versions of one template, from the given groups and those tagged as sharing it."""
+    filters = [{'Name': f"tag:{SHARED_TEMPLATE_TAG}", 'Values': [launch_template_id]}]
+    return get_pinned_versions(asg_client, asg_names, filters).get(launch_template_id, set())
+
+
+def check_keep_last(keep_last: int):
+    """Reject a retention window that would leave the template without its latest version."""
+    if keep_last < 1:
+        raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+
+
+def find_versions_to_delete(ec2_client, launch_template_id: str, keep_last: int,
+                            pinned_versions: Iterable[int] = ()) -> List[int]:
+    """Return the versions outside the retention window that are safe to delete.
+
+    Only versions older than the last keep_last are listed, so the cost of a
+    sweep stays proportional to what is actually left to prune. keep_last must
+    be at least 1.
+    """
+    check_keep_last(keep_last)
+    template = ec2_client.describe_launch_templates(
+        LaunchTemplateIds=[launch_template_id]
+    )['LaunchTemplates'][0]
+    cutoff = template['LatestVersionNumber'] - keep_last
+    if cutoff < 1:
+        return []
+
+    protected = set(pinned_versions) | {template['DefaultVersionNumber']}
+    candidates = []
+    paginator = ec2_client.get_paginator('describe_launch_template_versions')
+    for page in paginator.paginate(LaunchTemplateId=launch_template_id,
+                                   MaxVersion=str(cutoff)):
+        for version in page['LaunchTemplateVersions']:
+            if version['VersionNumber'] not in protected:
+                candidates.append(version['VersionNumber'])
+    return sorted(candidates)
+
+
+def delete_versions(ec2_client, launch_template_id: str, versions: List[int]) -> Dict:
+    """Delete versions in batches of 200 and report what was and was not deleted."""
+    deleted, failed = [], []
+    for chunk in chunked(versions, DELETE_BATCH_SIZE):
+        response = ec2_client.delete_launch_template_versions(
+            LaunchTemplateId=launch_template_id,
+            Versions=[str(version) for version in chunk]
+        )
+        deleted.extend(item['VersionNumber']
+                       for item in response.get('SuccessfullyDeletedLaunchTemplateVersions', []))
+        for item in response.get('UnsuccessfullyDeletedLaunchTemplateVersions', []):
+            error = item.get('ResponseError', {})
+            logger.warning(f"Could not delete version {item['VersionNumber']} of "
+                           f"{launch_template_id}: {error.get('Code')} {error.get('Message')}")
+            failed.append(item['VersionNumber'])
+    return {'Deleted': deleted, 'Failed': failed}
+
+
+def prune_launch_template(ec2_client, launch_template_id: str, keep_last: int = DEFAULT_KEEP_LAST,
+                          pinned_versions: Iterable[int] = (), dry_run: bool = False) -> Dict:
+    """Keep the last keep_last versions, the default and pinned versions; delete the rest."""
+    versions = find_versions_to_delete(ec2_client, launch_template_id, keep_last, pinned_versions)
+    logger.info(f"{len(versions)} versions of {launch_template_id} are outside the retention window")
+    result = {'LaunchTemplateId': launch_template_id, 'Candidates': len(versions)}
+    if dry_run or not versions:
+        result.update({'Deleted': [], 'Failed': [], 'DryRun': dry_run})
+        if dry_run:
+            result['WouldDelete'] = versions
+        return result
+    result.update(delete_versions(ec2_client, launch_template_id, versions))
+    result['DryRun'] = False
+    return result
+
+
+def prune_launch_templates(ec2_client, asg_client, launch_template_ids: List[str] = None,
+                           keep_last: int = DEFAULT_KEEP_LAST, dry_run: bool = False) -> List[Dict]:
+    """Sweep many launch templates, all templates in the region when none are given.
+
+    A failure on one template is recorded in its result and does not stop the sweep.
+    """
+    check_keep_last(keep_last)
+    if not launch_template_ids:
+        launch_template_ids = []
+        paginator = ec2_client.get_paginator('describe_launch_templates')
+        for page in paginator.paginate():
+            launch_template_ids.extend(t['LaunchTemplateId'] for t in page['LaunchTemplates'])
+
+    pinned = get_pinned_versions(asg_client)
+    results = []
+    for launch_template_id in launch_template_ids:
+        try:
+            results.append(prune_launch_template(
+                ec2_client, launch_template_id, keep_last,
+                pinned.get(launch_template_id, ()), dry_run
+            ))
+        except ClientError as e:
+            logger.error(f"Error pruning launch template {launch_template_id}: {str(e)}")
+            results.append({'LaunchTemplateId': launch_template_id, 'Error': str(e)})
+    return results
@@ -0,0 +1,389 @@
+import re
+import json
+import datetime
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_TRANSITIONS = 10000
+LOCAL_EXECUTION_ARN_PREFIX = 'arn:aws:states:us-east-1:123456789012:execution:local:'
+_PATH_TOKEN = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]")
+
+
+class StatesError(Exception):
+    """A Step Functions runtime error such as States.Runtime or a task failure."""
+
+    def __init__(self, error: str, cause: str = ''):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+class VirtualClock:
+    """Simulated epoch clock; Wait states advance it instead of sleeping."""
+
+    def __init__(self, start: float = 1700000000.0):
+        self.start = start
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+    @property
+    def elapsed(self) -> float:
+        return self.now - self.start
+
+
+def get_path(data: Any, path: str, context: Dict = None) -> Any:
+    """Evaluate a reference path such as '$.a.b[0].c' or '$$.Task.Token'."""
+    if path.startswith('$$'):
+        value, rest = context or {}, path[2:]
+    elif path.startswith('$'):
+        value, rest = data, path[1:]
+    else:
+        raise StatesError('States.Runtime', f"Invalid path {path}")
+    position = 0
+    for match in _PATH_TOKEN.finditer(rest):
+        if match.start() != position:
+            break
+        position = match.end()
+        key, index = match.group(1), match.group(2)
+        try:
+            value = value[int(index)] if index is not None else value[key]
+        except (KeyError, IndexError, TypeError):
+            raise StatesError('States.Runtime', f"Path {path} does not exist in the input")
+    if position != len(rest):
+        raise StatesError('States.Runtime', f"Unsupported path {path}")
+    return value
+
+
+def set_path(data: Any, path: str, value: Any) -> Any:
+    """Return data with value stored at path ('$' replaces the whole document)."""
+    if path is None:
+        return data
+    if path == '$':
+        return value
+    keys = [match.group(1) for match in _PATH_TOKEN.finditer(path[1:])]
+    result = dict(data) if isinstance(data, dict) else {}
+    node = result
+    for key in keys[:-1]:
+        node[key] = dict(node[key]) if isinstance(node.get(key), dict) else {}
+        node = node[key]
+    node[keys[-1]] = value
+    return result
+
+
+def _split_arguments(text: str) -> List[str]:
+    arguments, current, quoted = [], '', False
+    for char in text:
+        if char == "'" and not current.endswith('\\'):
+            quoted = not quoted
+        if char == ',' and not quoted:
+            arguments.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        arguments.append(current.strip())
+    return arguments
+
+
+def evaluate_intrinsic(expression: str, data: Any, context: Dict) -> Any:
+    """Evaluate the intrinsic functions the pipeline definitions use."""
+    match = re.fullmatch(r"(States\.\w+)\((.*)\)", expression.strip(), re.DOTALL)
+    if not match:
+        raise StatesError('States.Runtime', f"Unsupported expression {expression}")
+    name, arguments = match.group(1), []
+    for argument in _split_arguments(match.group(2)):
+        if argument.startswith("'"):
+            arguments.append(argument[1:-1].replace("\\'", "'"))
+        elif argument.startswith('$'):
+            arguments.append(get_path(data, argument, context))
+        elif argument.startswith('States.'):
+            arguments.append(evaluate_intrinsic(argument, data, context))
+        else:
+            arguments.append(json.loads(argument))
+    if name == 'States.Format':
+        template, values = arguments[0], iter(arguments[1:])
+        return re.sub(r"\{\}", lambda _: str(next(values)), template)
+    if name == 'States.JsonToString':
+        return json.dumps(arguments[0], separators=(',', ':'))
+    if name == 'States.StringToJson':
+        return json.loads(arguments[0])
+    if name == 'States.Array':
+        return list(arguments)
+    if name == 'States.MathAdd':
+        return arguments[0] + arguments[1]
+    raise StatesError('States.Runtime', f"Unsupported intrinsic function {name}")
+
+
+def resolve_parameters(template: Any, data: Any, context: Dict) -> Any:
+    """Apply a Parameters/ResultSelector template, resolving '.$' keys."""
+    if isinstance(template, dict):
+        resolved = {}
+        for key, value in template.items():
+            if key.endswith('.$'):
+                if value.startswith('States.'):
+                    resolved[key[:-2]] = evaluate_intrinsic(value, data, context)
+                else:
+                    resolved[key[:-2]] = get_path(data, value, context)
+            else:
+                resolved[key] = resolve_parameters(value, data, context)
+        return resolved
+    if isinstance(template, list):
+        return [resolve_parameters(item, data, context) for item in template]
+    return template
+
+
+def _compare(rule: Dict, data: Any) -> bool:
+    if 'And' in rule:
+        return all(_compare(sub_rule, data) for sub_rule in rule['And'])
+    if 'Or' in rule:
+        return any(_compare(sub_rule, data) for sub_rule in rule['Or'])
+    if 'Not' in rule:
+        return not _compare(rule['Not'], data)
+    try:
+        value = get_path(data, rule['Variable'])
+        present = True
+    except StatesError:
+        value, present = None, False
+    if 'IsPresent' in rule:
+        return present == rule['IsPresent']
+    if not present:
+        raise StatesError('States.Runtime', f"Invalid path {rule['Variable']}: not present")
+    if 'IsNull' in rule:
+        return (value is None) == rule['IsNull']
+    for operator, expected in rule.items():
+        if operator in ('Variable', 'Next'):
+            continue
+        if operator.endswith('Path'):
+            operator, expected = operator[:-4], get_path(data, expected)
+        if operator in ('StringEquals', 'NumericEquals', 'BooleanEquals', 'TimestampEquals'):
+            return value == expected
+        if operator in ('NumericLessThan', 'StringLessThan'):
+            return value < expected
+        if operator in ('NumericGreaterThan', 'StringGreaterThan'):
+            return value > expected
+        if operator in ('NumericLessThanEquals', 'StringLessThanEquals'):
+            return value <= expected
+        if operator in ('NumericGreaterThanEquals', 'StringGreaterThanEquals'):
+            return value >= expected
+        if operator == 'StringMatches':
+            return re.fullmatch(re.escape(expected).replace(r'\*', '.*'), value) is not None
+        if operator in ('IsString', 'IsNumeric', 'IsBoolean'):
+            kind = {'IsString': str, 'IsNumeric': (int, float), 'IsBoolean': bool}[operator]
+            return isinstance(value, kind) == expected
+    raise StatesError('States.Runtime', f"Unsupported choice rule {rule}")
+
+
+def is_lambda_resource(resource: str) -> bool:
+    """Whether a Task resource invokes Lambda (including unfilled <...Arn> placeholders)."""
+    return ':lambda:' in resource or ':states:::lambda:invoke' in resource or (
+        resource.startswith('<') and resource.endswith('>'))
+
+
+def _matching_rule(rules: List[Dict], error: str) -> Optional[Dict]:
+    """Return the first Retry or Catch rule whose ErrorEquals covers error."""
+    for rule in rules:
+        if error in rule['ErrorEquals'] or 'States.ALL' in rule['ErrorEquals']:
+            return rule
+    return None
+
+
+def payload_size(value: Any) -> int:
+    return len(json.dumps(value, separators=(',', ':'), default=str))
+
+
+class LocalStateMachine:
+    """Run an Amazon States Language definition in-process with a virtual clock.
+
+    Supports Task, Pass, Wait, Choice, Succeed and Fail states with InputPath,
+    Parameters, ResultSelector, ResultPath and OutputPath, reference paths and
+    the States.Format family of intrinsics and States.MathAdd. Task failures honour Retry (waits
+    advance the virtual clock) and Catch; Fail states accept ErrorPath/CausePath.
+
+    Task implementations are looked up by state name first and by Resource
+    second, so the '<LambdaArn>' placeholders shared by several states can be
+    mapped to different Python handlers. Each implementation is called with the
+    effective task input and returns the task result. task_seconds maps a state
+    name to its simulated duration.
+    """
+
+    def __init__(self, definition: Dict, tasks: Dict[str, Callable[[Any], Any]],
+                 clock: VirtualClock = None, task_seconds: Dict[str, float] = None,
+                 default_task_seconds: float = 0.5):
+        self.definition = definition
+        self.tasks = tasks
+        self.clock = clock or VirtualClock()
+        self.task_seconds = task_seconds or {}
+        self.default_task_seconds = default_task_seconds
+
+    def _task_function(self, name: str, state: Dict) -> Callable[[Any], Any]:
+        function = self.tasks.get(name) or self.tasks.get(state['Resource'])
+        if function is None:
+            raise StatesError('States.Runtime', f"No local implementation for task {name}")
+        return function
+
+    def _call_task(self, name: str, state: Dict, function: Callable[[Any], Any], effective: Any,
+                   report: 'ExecutionReport') -> Any:
+        """Call a task implementation, applying the state's Retry rules."""
+        attempts: Dict[int, int] = {}
+        while True:
+            try:
+                try:
+                    result = function(effective)
+                except StatesError:
+                    raise
+                except Exception as e:
+                    raise StatesError(type(e).__name__, str(e))
+                self.clock.advance(self.task_seconds.get(name, self.default_task_seconds))
+                return result
+            except StatesError as e:
+                self.clock.advance(self.task_seconds.get(name, self.default_task_seconds))
+                retrier = _matching_rule(state.get('Retry', []), e.error)
+                if retrier is None:
+                    raise
+                index = state['Retry'].index(retrier)
+                attempts[index] = attempts.get(index, 0) + 1
+                if attempts[index] > retrier.get('MaxAttempts', 3):
+                    raise
+                self.clock.advance(retrier.get('IntervalSeconds', 1)
+                                   * retrier.get('BackoffRate', 2.0) ** (attempts[index] - 1))
+                report.retries += 1
+                if is_lambda_resource(state['Resource']):
+                    report.lambda_invocations += 1
+
+    def run(self, execution_input: Dict, execution_name: str = 'local') -> 'ExecutionReport':
+        report = ExecutionReport(self.clock)
+        data = execution_input
+        name = self.definition['StartAt']
+        states = self.definition['States']
+        context = {'Execution': {'Id': LOCAL_EXECUTION_ARN_PREFIX + execution_name,
+                                 'Input': execution_input, 'Name': execution_name}}
+
+        while True:
+            if report.transitions >= MAX_TRANSITIONS:
+                raise StatesError('States.Runtime', f"More than {MAX_TRANSITIONS} transitions")
+            state = states[name]
+            context['State'] = {'Name': name, 'EnteredTime': datetime.datetime.fromtimestamp(
+                self.clock.time(), datetime.timezone.utc).isoformat()}
+            report.enter(name, data)
+            effective = get_path(data, state.get('InputPath', '$'))
+            state_type = state['Type']
+            try:
+                if state_type == 'Pass':
+                    result = state.get('Result', effective)
+                    if 'Parameters' in state:
+                        result = resolve_parameters(state['Parameters'], effective, context)
+                    data = set_path(data, state.get('ResultPath', '$'), result)
+                elif state_type == 'Task':
+                    context['Task'] = {'Token': f"local-token-{report.transitions}"}
+                    if 'Parameters' in state:
+                        effective = resolve_parameters(state['Parameters'], effective, context)
+                    function = self._task_function(name, state)
+                    if is_lambda_resource(state['Resource']):
+                        report.lambda_invocations += 1
+                    report.task_calls[name] = report.task_calls.get(name, 0) + 1
+                    try:
+                        result = self._call_task(name, state, function, effective, report)
+                    except StatesError as e:
+                        catcher = _matching_rule(state.get('Catch', []), e.error)
+                        if catcher is None:
+                            raise
+                        report.caught += 1
+                        data = set_path(data, catcher.get('ResultPath', '$'), {'Error': e.error, 'Cause': e.cause})
+                        report.leave(name, data)
+                        name = catcher['Next']
+                        continue
+                    if 'ResultSelector' in state:
+                        result = resolve_parameters(state['ResultSelector'], result, context)
+                    data = set_path(data, state.get('ResultPath', '$'), result)
+                elif state_type == 'Wait':
+                    if 'SecondsPath' in state:
+                        seconds = get_path(data, state['SecondsPath'])
+                    else:
+                        seconds = state['Seconds']
+                    self.clock.advance(seconds)
+                    report.waited_seconds += seconds
+                elif state_type == 'Choice':
+                    name = next((rule['Next'] for rule in state['Choices'] if _compare(rule, data)),
+                                state.get('Default'))
+                    if name is None:
+                        raise StatesError('States.NoChoiceMatched', 'No choice rule matched')
+                    continue
+                elif state_type == 'Succeed':
+                    return report.finish('SUCCEEDED', get_path(data, state.get('OutputPath', '$')))
+                elif state_type == 'Fail':
+                    error = get_path(data, state['ErrorPath']) if 'ErrorPath' in state else state.get('Error')
+                    cause = get_path(data, state['CausePath']) if 'CausePath' in state else state.get('Cause')
+                    return report.finish('FAILED', None, error, cause)
+                else:
+                    raise StatesError('States.Runtime', f"Unsupported state type {state_type}")
+            except StatesError as e:
+                return report.finish('FAILED', None, e.error, e.cause)
+
+            data = get_path(data, state.get('OutputPath', '$'))
+            report.leave(name, data)
+            if state.get('End'):
+                return report.finish('SUCCEEDED', data)
+            name = state['Next']
+
+
+class ExecutionReport:
+    """Simulated duration, Lambda invocations, transitions and payload sizes of a run."""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.started_at = clock.time()
+        self.status = 'RUNNING'
+        self.output = None
+        self.error = None
+        self.cause = None
+        self.transitions = 0
+        self.lambda_invocations = 0
+        self.retries = 0
+        self.caught = 0
+        self.waited_seconds = 0.0
+        self.task_calls: Dict[str, int] = {}
+        self.max_payload_bytes: Dict[str, int] = {}
+        self.history: List[Dict] = []
+
+    def enter(self, name: str, data: Any) -> None:
+        self.transitions += 1
+        self.history.append({'State': name, 'EnteredAt': round(self.clock.time() - self.started_at, 3),
+                             'InputBytes': payload_size(data)})
+
+    def leave(self, name: str, data: Any) -> None:
+        size = payload_size(data)
+        self.history[-1]['OutputBytes'] = size
+        self.max_payload_bytes[name] = max(size, self.max_payload_bytes.get(name, 0))
+
+    def finish(self, status: str, output: Any, error: str = None, cause: str = None) -> 'ExecutionReport':
+        self.status, self.output, self.error, self.cause = status, output, error, cause
+        return self
+
+    @property
+    def simulated_seconds(self) -> float:
+        return self.clock.time() - self.started_at
+
+    def summary(self) -> Dict:
+        return {
+            'Status': self.status,
+            'Error': self.error,
+            'Cause': self.cause,
+            'SimulatedSeconds': round(self.simulated_seconds, 1),
+            'WaitedSeconds': round(self.waited_seconds, 1),
+            'StateTransitions': self.transitions,
+            'LambdaInvocations': self.lambda_invocations,
+            'Retries': self.retries,
+            'CaughtErrors': self.caught,
+            'TaskCalls': self.task_calls,
+            'MaxPayloadBytes': max(self.max_payload_bytes.values(), default=0),
+            'PayloadBytesByState': self.max_payload_bytes
+        }
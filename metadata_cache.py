@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict, Hashable
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_TTL_SECONDS = float(os.environ.get('METADATA_CACHE_TTL_SECONDS', '30'))
+
+
+class MetadataCache:
+    """Memoize AWS describe results for one invocation and briefly across warm invocations.
+
+    Entries loaded during the current invocation are always reused. Entries left
+    over from an earlier invocation are reused only while younger than ttl_seconds.
+    Callers must invalidate an entry after changing the resource it describes.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.invocation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Hashable, tuple] = {}
+        self._lock = threading.Lock()
+
+    def start_invocation(self) -> None:
+        """Mark the start of a handler invocation."""
+        self.invocation += 1
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, calling loader on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at, invocation = entry
+            if invocation == self.invocation or self.clock() - loaded_at < self.ttl_seconds:
+                self.hits += 1
+                return value
+        self.misses += 1
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value fetched elsewhere, e.g. from a bulk describe call."""
+        with self._lock:
+            self._entries[key] = (value, self.clock(), self.invocation)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Forget a single entry."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+# One cache per container, shared by every handler
+cache = MetadataCache()
+
+
+def start_invocation() -> None:
+    """Mark the start of a handler invocation on the shared cache."""
+    cache.start_invocation()
+
+
+def describe_auto_scaling_group(asg_client, asg_name: str) -> Dict:
+    """Return the Auto Scaling group description, cached.
+
+    Raises ValueError if the group does not exist (e.g. it was deleted after
+    the backup); a missing group is not cached.
+    """
+    def load():
+        response = asg_client.describe_auto_scaling_groups(AutoScalingGroupNames=[asg_name])
+        if not response['AutoScalingGroups']:
+            raise ValueError(f"Auto Scaling group {asg_name} not found")
+        return response['AutoScalingGroups'][0]
+    return cache.get(('autoscaling-group', asg_name), load)
+
+
+def put_auto_scaling_group(asg_group: Dict) -> None:
+    """Seed the cache with a group description returned by a bulk call."""
+    cache.put(('autoscaling-group', asg_group['AutoScalingGroupName']), asg_group)
+
+
+def invalidate_auto_scaling_group(asg_name: str, region_name: str = None) -> None:
+    """Drop the cached description after update_auto_scaling_group."""
+    cache.invalidate(('autoscaling-group', asg_name) if region_name is None
+                     else ('autoscaling-group', asg_name, region_name))
+
+
+def get_launch_template_metadata(launch_template_name: str, loader: Callable[[], Any],
+                                 region_name: str = None) -> Any:
+    """Return cached launch template metadata, calling loader on a miss.
+
+    Templates in other regions than the container's own (region_name) are
+    cached separately, since the same name can exist in every region.
+    """
+    key = ('launch-template', launch_template_name)
+    return cache.get(key if region_name is None else key + (region_name,), loader)
+
+
+def invalidate_launch_template(launch_template_name: str, region_name: str = None) -> None:
+    """Drop cached launch template metadata after a new version or default change."""
+    key = ('launch-template', launch_template_name)
+    cache.invalidate(key if region_name is None else key + (region_name,))
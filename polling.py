@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import random
+import logging
+from typing import Dict
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Source of the current time; the local executor swaps in its virtual clock
+clock = time.time
+
+
+class PollingDeadlineExceeded(Exception):
+    """Raised when a resource is still not ready after its polling deadline."""
+
+
+class BackoffPolicy:
+    """Decide how long to wait before the next status check of a resource.
+
+    Before the expected duration has elapsed the wait is a fraction of the
+    remaining expected time, so checks get denser as readiness becomes likely.
+    Once the resource is overdue the wait grows in proportion to how late it is
+    (exponential backoff without having to count attempts). Every wait is
+    jittered, clamped to [min_wait, max_wait] and never runs past the deadline.
+    first_wait_seconds is the wait before the first check, which the state
+    machine's Init*Poll state passes as initialWaitSeconds.
+    """
+
+    def __init__(self, expected_seconds: float, min_wait: float, max_wait: float,
+                 deadline_seconds: float, approach_fraction: float = 0.5,
+                 backoff_factor: float = 2.0, jitter: float = 0.1,
+                 first_wait_seconds: float = 0):
+        self.expected_seconds = expected_seconds
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.deadline_seconds = deadline_seconds
+        self.approach_fraction = approach_fraction
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.first_wait_seconds = first_wait_seconds
+
+    def next_wait(self, elapsed: float, rng: random.Random = random) -> int:
+        """Return the number of seconds to wait after a check made at elapsed seconds."""
+        if elapsed >= self.deadline_seconds:
+            raise PollingDeadlineExceeded(
+                f"Resource not ready after {int(elapsed)}s (deadline {int(self.deadline_seconds)}s)"
+            )
+        remaining = self.expected_seconds - elapsed
+        if remaining > 0:
+            wait = remaining * self.approach_fraction
+        else:
+            wait = -remaining * (self.backoff_factor - 1)
+        if self.jitter:
+            wait *= rng.uniform(1 - self.jitter, 1 + self.jitter)
+        wait = min(max(wait, self.min_wait), self.max_wait)
+        wait = min(wait, self.deadline_seconds - elapsed)
+        return max(1, int(round(wait)))
+
+
+# Expected-duration model per polled resource, in seconds
+POLICIES = {
+    # Status checks of a freshly launched Windows instance usually pass in 3-5 minutes;
+    # checking earlier costs invocations without finding it ready
+    'instance-status': BackoffPolicy(expected_seconds=240, min_wait=90, max_wait=120,
+                                     deadline_seconds=1800, first_wait_seconds=260),
+    # AMI creation time is dominated by the first snapshot of each volume
+    'ami': BackoffPolicy(expected_seconds=600, min_wait=15, max_wait=120,
+                         deadline_seconds=7200, backoff_factor=1.5),
+    # AWSEC2-RunSysprep usually finishes within a few minutes; the command times out at 1h
+    'sysprep': BackoffPolicy(expected_seconds=300, min_wait=30, max_wait=60,
+                             deadline_seconds=3600, backoff_factor=1.5, first_wait_seconds=180),
+    # Fast Snapshot Restore optimizes at about 60 minutes per TiB; Fast Launch
+    # pre-provisions its snapshots in parallel with that
+    'acceleration': BackoffPolicy(expected_seconds=1200, min_wait=30, max_wait=300,
+                                  deadline_seconds=14400, backoff_factor=1.5),
+    # A cross-region copy transfers every snapshot in full the first time, so it
+    # takes longer than the local AMI; the regions are copied in parallel
+    'ami-copy': BackoffPolicy(expected_seconds=1200, min_wait=30, max_wait=300,
+                              deadline_seconds=14400, backoff_factor=1.5),
+    # Replacing a fleet takes roughly warmup x batches; checks after the first
+    # use the observed progress instead. The deadline bounds the whole rollout
+    'instance-refresh': BackoffPolicy(expected_seconds=1800, min_wait=30, max_wait=300,
+                                      deadline_seconds=21600, backoff_factor=1.5),
+}
+
+
+
+def _validate_overrides(overrides: Dict, source: str):
+    fields = sorted(vars(next(iter(POLICIES.values()))))
+    unknown = sorted(set(overrides) - set(fields))
+    if unknown:
+        raise ValueError(f"{source}: unknown policy field(s) {', '.join(unknown)}; "
+                         f"expected any of {', '.join(fields)}")
+    for name, value in overrides.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{source}: {name} must be a number, got {value!r}")
+
+
+def apply_policy_overrides(raw: str):
+    """Apply POLLING_POLICY_OVERRIDES, failing at import on a typo instead of at the first poll."""
+    try:
+        overrides = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"POLLING_POLICY_OVERRIDES is not valid JSON: {str(e)}")
+    if not isinstance(overrides, dict):
+        raise ValueError("POLLING_POLICY_OVERRIDES must be a JSON object of resource types")
+    unknown = sorted(set(overrides) - set(POLICIES))
+    if unknown:
+        raise ValueError(f"POLLING_POLICY_OVERRIDES: unknown resource type(s) {', '.join(unknown)}; "
+                         f"expected any of {', '.join(sorted(POLICIES))}")
+    for resource, fields in overrides.items():
+        if not isinstance(fields, dict):
+            raise ValueError(f"POLLING_POLICY_OVERRIDES.{resource} must be a JSON object of policy fields")
+        _validate_overrides(fields, f"POLLING_POLICY_OVERRIDES.{resource}")
+    for resource, fields in overrides.items():
+        for name, value in fields.items():
+            setattr(POLICIES[resource], name, value)
+
+
+# e.g. POLLING_POLICY_OVERRIDES='{"ami": {"expected_seconds": 1200}}'
+apply_policy_overrides(os.environ.get('POLLING_POLICY_OVERRIDES', '{}'))
+
+
+def get_policy(resource_type: str, overrides: Dict = None) -> BackoffPolicy:
+    """Return the policy for a resource type, with optional per-call overrides."""
+    if resource_type not in POLICIES:
+        raise ValueError(f"Unknown polling resource type {resource_type}; "
+                         f"expected any of {', '.join(sorted(POLICIES))}")
+    policy = POLICIES[resource_type]
+    if not overrides:
+        return policy
+    _validate_overrides(overrides, f"Overrides for {resource_type}")
+    settings = dict(vars(policy))
+    settings.update(overrides)
+    return BackoffPolicy(**settings)
+
+
+def _started(poll_state: Dict, now: float) -> Dict:
+    # The first check comes after the Init*Poll wait, so polling started that much earlier
+    state = dict(poll_state or {})
+    if 'startedAt' not in state:
+        state['startedAt'] = now - state.pop('initialWaitSeconds', 0)
+    state['attempt'] = state.get('attempt', 0) + 1
+    return state
+
+
+def next_poll(resource_type: str, poll_state: Dict = None, overrides: Dict = None,
+              now: float = None) -> Dict:
+    """Advance the poll state of a still-pending resource and recommend the next wait.
+
+    poll_state is the value returned by the previous check (empty on the first
+    one). The result holds the updated 'pollState' and 'nextWaitSeconds', which
+    the state machine feeds to its Wait state through SecondsPath.
+    """
+    now = clock() if now is None else now
+    state = _started(poll_state, now)
+    elapsed = now - state['startedAt']
+    wait = get_policy(resource_type, overrides).next_wait(elapsed)
+    logger.info(f"{resource_type} pending after {int(elapsed)}s (check {state['attempt']}), "
+                f"next check in {wait}s")
+    return {'pollState': state, 'nextWaitSeconds': wait}
+
+
+def finish_poll(poll_state: Dict = None, now: float = None) -> Dict:
+    """Record the final check of a resource that is now ready."""
+    now = clock() if now is None else now
+    state = _started(poll_state, now)
+    state['elapsedSeconds'] = int(now - state['startedAt'])
+    return {'pollState': state, 'nextWaitSeconds': 0}
+
+
+def elapsed_seconds(poll_state: Dict) -> int:
+    """Seconds since the first check recorded in poll_state."""
+    return int(clock() - poll_state['startedAt'])
@@ -0,0 +1,46 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from launch_template_retention import DEFAULT_KEEP_LAST, prune_launch_templates
+from instrumentation import instrumented
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Delete old launch template versions across many templates.
+
+    Args:
+        event (dict): Optionally contains LaunchTemplateIds (all templates in the
+                     region when omitted), KeepLast and DryRun
+        context (Any): Lambda context object
+
+    Returns:
+        dict: Per-template prune results
+    """
+    try:
+        keep_last = int(event.get('KeepLast', DEFAULT_KEEP_LAST))
+        dry_run = bool(event.get('DryRun', False))
+        logger.info(f"Pruning launch templates, keeping the last {keep_last} versions (dry run: {dry_run})")
+
+        results = prune_launch_templates(
+            get_client('ec2'), get_client('autoscaling'),
+            event.get('LaunchTemplateIds'), keep_last, dry_run
+        )
+
+        return {
+            'Results': results,
+            'DeletedCount': sum(len(result.get('Deleted', [])) for result in results),
+            'FailedTemplates': [r['LaunchTemplateId'] for r in results if 'Error' in r]
+        }
+
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
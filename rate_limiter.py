@@ -0,0 +1,87 @@
+import time
+import threading
+import logging
+from typing import Callable, Dict, Iterable
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second on average.
+
+    Up to `capacity` acquisitions can happen back to back; after that callers
+    block until enough tokens have refilled.
+    """
+
+    def __init__(self, rate: float, capacity: float = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens, blocking until they are available; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self.clock())
+                # Tolerate float rounding so a refill of exactly the missing amount succeeds
+                if self.tokens + 1e-9 >= tokens:
+                    self.tokens -= tokens
+                    self.acquired += 1
+                    self.waited_seconds += waited
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+
+def attach_rate_limiter(client, bucket: TokenBucket, operations: Iterable[str] = None) -> None:
+    """Make every attempt of a call of the client (or only the named operations) take a token first.
+
+    The first attempt takes its token before the parameters are built, so a
+    stubbed call is limited too. Each retry takes another one before its
+    request is signed, so retries after throttling cannot exceed the rate.
+    Attaching the same bucket twice is a no-op, so it is safe to call on every
+    invocation with the shared pooled clients.
+    """
+    wanted = set(operations) if operations else None
+
+    def throttle(model, **kwargs):
+        if wanted is None or model.name in wanted:
+            bucket.acquire()
+
+    def throttle_retry(request, operation_name, **kwargs):
+        attempt = (getattr(request, 'context', None) or {}).get('retries', {}).get('attempt', 1)
+        if attempt > 1 and (wanted is None or operation_name in wanted):
+            bucket.acquire()
+
+    # Event names use the hyphenized service ID, e.g. 'auto-scaling'
+    service_id = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(
+        f"before-parameter-build.{service_id}", throttle, unique_id=f"rate-limiter-{id(bucket)}"
+    )
+    # request-created fires once per attempt, before the request is signed
+    client.meta.events.register_first(
+        f"request-created.{service_id}", throttle_retry, unique_id=f"rate-limiter-retry-{id(bucket)}"
+    )
+
+
+def attach_rate_limiters(clients: Dict[str, object], buckets: Dict[str, TokenBucket]) -> None:
+    """Attach the bucket for each service name to the matching client."""
+    for service_name, bucket in buckets.items():
+        if service_name in clients:
+            attach_rate_limiter(clients[service_name], bucket)
@@ -0,0 +1,54 @@
+import logging
+from typing import Dict, Any
+from completion_events import current_outcome, FAILURE
+from task_token_store import complete_task, get_task_token_store
+from instrumentation import instrumented
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Store a Step Functions task token until the awaited resource completes.
+
+    Invoked from a '.waitForTaskToken' Lambda task. If the resource has already
+    completed, the task is completed right away instead of waiting for an event.
+
+    Args:
+        event (dict): Must contain TaskToken, WaitFor ('instance-running',
+                     'ami-available' or 'ssm-command') and ResourceId
+                     ('<CommandId>:<InstanceId>' for 'ssm-command')
+        context (Any): Lambda context object
+
+    Returns:
+        dict: Whether the task was completed immediately
+    """
+    try:
+        task_token = event['TaskToken']
+        wait_for = event['WaitFor']
+        resource_id = event['ResourceId']
+        store = get_task_token_store()
+
+        store.put(wait_for, resource_id, task_token)
+        logger.info(f"Registered task token for {wait_for} {resource_id}")
+
+        # Close the race with completions that happened before the token was stored
+        outcome, output = current_outcome(wait_for, resource_id)
+        if outcome is not None and store.pop(wait_for, resource_id):
+            logger.info(f"{wait_for} {resource_id} already completed: {outcome}")
+            if outcome == FAILURE:
+                complete_task(task_token, error=f"{wait_for}.Failed", cause=str(output))
+            else:
+                complete_task(task_token, output)
+            return {'CompletedImmediately': True, 'Outcome': outcome}
+
+        return {'CompletedImmediately': False}
+
+    except KeyError as e:
+        logger.error(f"Missing required parameter: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
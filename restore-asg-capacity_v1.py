@@ -0,0 +1,55 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from backup_job_resolver import describe_backup_job, index_instances
+from capacity_guard import restore_capacity
+from instrumentation import instrumented
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def find_group_of_backup_job(backup_job_id: str) -> str:
+    """Find the group of a backup job's instance, for a bake that failed before returning it."""
+    _, instance_id = describe_backup_job(get_client('backup'), backup_job_id)
+    instance = index_instances(get_client('ec2'), get_client('autoscaling'), [instance_id]).get(instance_id)
+    return instance and instance['AutoScalingGroupName']
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Restore an Auto Scaling group after a failed bake.
+
+    The state machine calls this from its Catch path. It can also be invoked by
+    hand for a group that still carries the ami-bake:original-capacity tag.
+
+    Args:
+        event (dict): Must contain AutoScalingGroupName, or backupJobId when the
+                     group was never returned (the lookup itself failed);
+                     OriginalMaxCapacity is used when the group carries no
+                     recorded state
+        context (Any): Lambda context object
+
+    Returns:
+        dict: The restored state and whether anything had to be restored
+    """
+    try:
+        asg_name = event.get('AutoScalingGroupName')
+        if not asg_name:
+            asg_name = find_group_of_backup_job(event['backupJobId'])
+            if not asg_name:
+                logger.info(f"Backup job {event['backupJobId']} has no Auto Scaling group to restore")
+                return {'AutoScalingGroupName': None, 'Restored': False}
+        logger.info(f"Restoring capacity of ASG {asg_name}")
+        return restore_capacity(get_client('autoscaling'), asg_name, event.get('OriginalMaxCapacity'))
+
+    except KeyError as e:
+        logger.error(f"Missing required parameter: {str(e)}")
+        raise
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
@@ -0,0 +1,222 @@
+import sys
+import json
+import time
+import uuid
+import argparse
+import logging
+import statistics
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Tuple
+from aws_clients import get_client, set_rate_limit
+from backup_job_resolver import describe_auto_scaling_groups_bulk
+from rate_limiter import TokenBucket
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_CONCURRENCY = 10
+# Shared client-side limits in requests per second, well below the account quotas
+DEFAULT_RATE_LIMITS = {'ec2': 20, 'autoscaling': 10, 'stepfunctions': 20}
+
+
+def build_rate_limiters(rate_limits: Dict[str, float]) -> Dict[str, TokenBucket]:
+    """Set the rate of the container-wide bucket of each service for this rollout."""
+    return {service_name: set_rate_limit(service_name, rate)
+            for service_name, rate in (rate_limits or {}).items()}
+
+
+def run_target(pipeline: Callable[[Dict], Any], target: Dict, name_key: str) -> Dict:
+    """Run the pipeline for one target; any exception is recorded, not raised."""
+    started = time.monotonic()
+    name = target.get(name_key)
+    try:
+        output = pipeline(target)
+        status, error = 'Succeeded', None
+    except Exception as e:
+        logger.error(f"Rollout failed for {name}: {str(e)}")
+        output, status, error = None, 'Failed', f"{type(e).__name__}: {str(e)}"
+    return {
+        'Name': name,
+        'Status': status,
+        'Error': error,
+        'Output': output,
+        'DurationSeconds': round(time.monotonic() - started, 3)
+    }
+
+
+def summarize(results: List[Dict], elapsed: float, buckets: Dict[str, TokenBucket]) -> Dict:
+    """Build the rollout report."""
+    durations = sorted(result['DurationSeconds'] for result in results) or [0.0]
+    failures = [{'Name': r['Name'], 'Error': r['Error']} for r in results if r['Status'] == 'Failed']
+    return {
+        'Total': len(results),
+        'Succeeded': len(results) - len(failures),
+        'Failed': len(failures),
+        'Failures': failures,
+        'ElapsedSeconds': round(elapsed, 3),
+        'TargetsPerMinute': round(len(results) / elapsed * 60, 2) if elapsed else None,
+        'TargetDurationSeconds': {
+            'p50': statistics.median(durations),
+            'p95': durations[max(0, int(len(durations) * 0.95) - 1)],
+            'max': durations[-1]
+        },
+        'RateLimiters': {
+            service: {'Acquired': bucket.acquired, 'WaitedSeconds': round(bucket.waited_seconds, 3)}
+            for service, bucket in buckets.items()
+        },
+        'Results': results
+    }
+
+
+def run_rollout(targets: List[Dict], pipeline: Callable[[Dict], Any],
+                max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                rate_limits: Dict[str, float] = None,
+                name_key: str = 'AutoScalingGroupName') -> Dict:
+    """Run the pipeline over many targets with bounded concurrency.
+
+    At most max_concurrency targets are in flight at once, every AWS call made
+    through the shared clients draws from a per-service token bucket, and one
+    failing target never stops the others.
+    """
+    buckets = build_rate_limiters(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits)
+    logger.info(f"Rolling out to {len(targets)} targets with concurrency {max_concurrency}")
+    started = time.monotonic()
+    results = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [executor.submit(run_target, pipeline, target, name_key) for target in targets]
+        for future in as_completed(futures):
+            results.append(future.result())
+    report = summarize(results, time.monotonic() - started, buckets)
+    logger.info(f"Rollout finished: {report['Succeeded']} succeeded, {report['Failed']} failed "
+                f"in {report['ElapsedSeconds']}s")
+    return report
+
+
+def resolve_rollout_targets(asg_names: List[str]) -> Tuple[List[Dict], List[Dict]]:
+    """Look up the launch template of each ASG (50 per call) for an AMI rollout."""
+    groups = describe_auto_scaling_groups_bulk(get_client('autoscaling'), asg_names)
+    targets, unresolved = [], []
+    for asg_name in asg_names:
+        group = groups.get(asg_name)
+        if group is None or 'LaunchTemplate' not in group:
+            unresolved.append({'Name': asg_name, 'Error': 'Group not found or has no launch template'})
+            continue
+        targets.append({
+            'AutoScalingGroupName': asg_name,
+            'LaunchTemplateName': group['LaunchTemplate']['LaunchTemplateName'],
+            'LaunchTemplateId': group['LaunchTemplate']['LaunchTemplateId']
+        })
+    return targets, unresolved
+
+
+def update_asg_pipeline(image_id: str, extra_event: Dict = None) -> Callable[[Dict], Dict]:
+    """Pipeline that points one ASG at an already baked AMI using updateASG_v1."""
+    import updateASG_v1
+
+    def run(target: Dict) -> Dict:
+        event = dict(target, ImageId=image_id, **(extra_event or {}))
+        # Unwrapped: no EMF lines per target, which would also end up in the CLI's JSON report
+        return updateASG_v1.lambda_handler.__wrapped__(event, None)
+    return run
+
+
+class StepFunctionsPipeline:
+    """Pipeline that runs one state machine execution per target and waits for it."""
+
+    def __init__(self, state_machine_arn: str, poll_seconds: float = 30,
+                 timeout_seconds: float = 7200, sleep: Callable[[float], None] = time.sleep):
+        self.state_machine_arn = state_machine_arn
+        self.poll_seconds = poll_seconds
+        self.timeout_seconds = timeout_seconds
+        self.sleep = sleep
+
+    def __call__(self, target: Dict) -> Dict:
+        sfn = get_client('stepfunctions')
+        execution_arn = sfn.start_execution(
+            stateMachineArn=self.state_machine_arn,
+            name=f"rollout-{uuid.uuid4()}",
+            input=json.dumps(target)
+        )['executionArn']
+        deadline = time.monotonic() + self.timeout_seconds
+        while True:
+            execution = sfn.describe_execution(executionArn=execution_arn)
+            if execution['status'] == 'SUCCEEDED':
+                return json.loads(execution.get('output') or '{}')
+            if execution['status'] != 'RUNNING':
+                raise RuntimeError(f"Execution {execution_arn} ended with status {execution['status']}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Execution {execution_arn} still running after {self.timeout_seconds}s")
+            self.sleep(self.poll_seconds)
+
+
+def build_map_state_machine(item_definition: Dict, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                            items_path: str = '$.targets') -> Dict:
+    """Wrap a single-target definition in a Map state that fans out over items_path.
+
+    Each item runs inside a Parallel state whose Catch turns a failure into a
+    result entry, so one failing ASG does not fail the whole Map.
+    """
+    return {
+        "Comment": f"Fan out over {items_path} with at most {max_concurrency} concurrent targets",
+        "StartAt": "RolloutTargets",
+        "States": {
+            "RolloutTargets": {
+                "Type": "Map",
+                "ItemsPath": items_path,
+                "MaxConcurrency": max_concurrency,
+                "ItemProcessor": {
+                    "ProcessorConfig": {"Mode": "INLINE"},
+                    "StartAt": "ProcessTarget",
+                    "States": {
+                        "ProcessTarget": {
+                            "Type": "Parallel",
+                            "Branches": [{
+                                "StartAt": item_definition['StartAt'],
+                                "States": item_definition['States']
+                            }],
+                            "Catch": [{
+                                "ErrorEquals": ["States.ALL"],
+                                "ResultPath": "$.Error",
+                                "Next": "TargetFailed"
+                            }],
+                            "End": True
+                        },
+                        "TargetFailed": {
+                            "Type": "Pass",
+                            "End": True
+                        }
+                    }
+                },
+                "ResultPath": "$.results",
+                "End": True
+            }
+        }
+    }
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Roll changes out over many Auto Scaling groups")
+    commands = parser.add_subparsers(dest='command', required=True)
+    map_parser = commands.add_parser('map-definition', help='Print a Map state machine definition')
+    map_parser.add_argument('definition', help='Single-target definition, e.g. StepFunction_v4')
+    map_parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY)
+    update_parser = commands.add_parser('update', help='Point many ASGs at an existing AMI')
+    update_parser.add_argument('image_id')
+    update_parser.add_argument('asg_names', nargs='+')
+    update_parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    if args.command == 'map-definition':
+        with open(args.definition) as f:
+            definition = json.load(f)
+        print(json.dumps(build_map_state_machine(definition, args.max_concurrency), indent=2))
+    else:
+        targets, unresolved = resolve_rollout_targets(args.asg_names)
+        report = run_rollout(targets, update_asg_pipeline(args.image_id), args.max_concurrency)
+        report['Unresolved'] = unresolved
+        print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,452 @@
+import os
+import re
+import sys
+import copy
+import json
+import argparse
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+import dispatcher
+from polling import POLICIES
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Placeholder in the checked-in definitions -> BakeConfig attribute
+PLACEHOLDERS = {
+    'LambdaArn': 'lambda_arn',
+    'KeyPairName': 'key_pair_name',
+    'SubnetId': 'subnet_id',
+    'SecurityGroupId': 'security_group_id',
+    'InstanceProfileArn': 'instance_profile_arn',
+    'SNSTopicArn': 'sns_topic_arn',
+    'BakeLedgerTable': 'bake_ledger_table',
+}
+_PLACEHOLDER = re.compile(r"<([A-Za-z0-9]+)>")
+_REFERENCE = re.compile(r"(?<!\$)\$(?:\.[A-Za-z0-9_]+|\[\d+\])+")
+_PATH_TOKEN = re.compile(r"\.([A-Za-z0-9_]+)|\[(\d+)\]")
+
+# Service integrations whose responses always carry the fields read later, so
+# a ResultSelector can keep just those
+COMPACTED_RESOURCES = (
+    'arn:aws:states:::aws-sdk:ec2:runInstances',
+    'arn:aws:states:::aws-sdk:ec2:createImage',
+    'arn:aws:states:::sns:publish',
+)
+
+# Polling loops whose check handler uses one of these policies can run as
+# Express child workflows, a few checks per child execution
+ACTION_POLICIES = {
+    'check-instance-state': 'instance-status',
+    'check-sysprep-status': 'sysprep',
+    'check-ami-status': 'ami',
+    'check-ami-copies': 'ami-copy',
+    'check-image-acceleration': 'acceleration',
+    'check-instance-refresh': 'instance-refresh',
+}
+# Express executions stop after 5 minutes; leave a minute for the checks themselves
+EXPRESS_WAIT_BUDGET_SECONDS = 240
+START_CHILD_RESOURCE = 'arn:aws:states:::states:startExecution.sync:2'
+EXPRESS_UNSUPPORTED_SUFFIXES = ('.sync', '.sync:2', '.waitForTaskToken')
+
+
+class BakeConfig:
+    """Deployment values for the placeholders of the bake state machines."""
+
+    def __init__(self, lambda_arn: str, key_pair_name: str, subnet_id: str, security_group_id: str,
+                 instance_profile_arn: str, sns_topic_arn: str, bake_ledger_table: str,
+                 poll_state_machine_arns: Dict[str, str] = None):
+        self.lambda_arn = lambda_arn
+        self.key_pair_name = key_pair_name
+        self.subnet_id = subnet_id
+        self.security_group_id = security_group_id
+        self.instance_profile_arn = instance_profile_arn
+        self.sns_topic_arn = sns_topic_arn
+        self.bake_ledger_table = bake_ledger_table
+        # Check state name -> ARN of its Express polling workflow
+        self.poll_state_machine_arns = dict(poll_state_machine_arns or {})
+
+        problems = []
+        for name, value, pattern in (
+            ('LambdaArn', lambda_arn, r"arn:aws[a-z-]*:lambda:[a-z0-9-]+:\d{12}:function:[\w-]+(:[\w$-]+)?"),
+            ('SubnetId', subnet_id, r"subnet-[0-9a-f]+"),
+            ('SecurityGroupId', security_group_id, r"sg-[0-9a-f]+"),
+            ('InstanceProfileArn', instance_profile_arn, r"arn:aws[a-z-]*:iam::\d{12}:instance-profile/.+"),
+            ('SNSTopicArn', sns_topic_arn, r"arn:aws[a-z-]*:sns:[a-z0-9-]+:\d{12}:[\w-]+"),
+            ('KeyPairName', key_pair_name, r".+"),
+            ('BakeLedgerTable', bake_ledger_table, r"[\w.-]{3,255}"),
+        ):
+            if not isinstance(value, str) or not re.fullmatch(pattern, value):
+                problems.append(f"{name} {value!r} does not look like {pattern}")
+        for state_name, arn in self.poll_state_machine_arns.items():
+            if not re.fullmatch(r"arn:aws[a-z-]*:states:[a-z0-9-]+:\d{12}:stateMachine:[\w-]+", arn):
+                problems.append(f"PollStateMachineArns.{state_name} {arn!r} is not a state machine ARN")
+        if problems:
+            raise ValueError('Invalid state machine config: ' + '; '.join(problems))
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> 'BakeConfig':
+        """Build a config from the placeholder names, e.g. {"LambdaArn": ...}."""
+        unknown = set(values) - set(PLACEHOLDERS) - {'PollStateMachineArns'}
+        missing = set(PLACEHOLDERS) - set(values)
+        if unknown or missing:
+            raise ValueError(f"Invalid state machine config: missing {sorted(missing)}, unknown {sorted(unknown)}")
+        return cls(poll_state_machine_arns=values.get('PollStateMachineArns'),
+                   **{attribute: values[name] for name, attribute in PLACEHOLDERS.items()})
+
+    def placeholders(self) -> Dict[str, str]:
+        values = {name: getattr(self, attribute) for name, attribute in PLACEHOLDERS.items()}
+        values.update({poll_arn_placeholder(state_name): arn
+                       for state_name, arn in self.poll_state_machine_arns.items()})
+        return values
+
+
+def poll_arn_placeholder(check_state_name: str) -> str:
+    return f"{check_state_name}PollStateMachineArn"
+
+
+def render(definition: Dict, config: BakeConfig) -> Dict:
+    """Replace every <Placeholder> the config has a value for; the rest are left for validate()."""
+    values = config.placeholders()
+
+    def substitute(node):
+        if isinstance(node, dict):
+            return {key: substitute(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [substitute(item) for item in node]
+        if isinstance(node, str):
+            return _PLACEHOLDER.sub(lambda match: values.get(match.group(1), match.group(0)), node)
+        return node
+    return substitute(definition)
+
+
+def _strings(node: Any, skip_keys: Tuple[str, ...] = ()):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key not in skip_keys:
+                yield from _strings(value, skip_keys)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _strings(item, skip_keys)
+    elif isinstance(node, str):
+        yield node
+
+
+def _tokens(path: str) -> List:
+    return [int(index) if index else key for key, index in _PATH_TOKEN.findall(path)]
+
+
+def referenced_paths(definition: Dict, result_path: str) -> Optional[List[str]]:
+    """Every reference below result_path anywhere in the definition, relative to it.
+
+    Returns None when some state reads the whole value.
+    """
+    paths = set()
+    # ResultPath writes the value rather than reading it
+    for text in _strings(definition['States'], ('ResultPath',)):
+        for reference in _REFERENCE.findall(text):
+            if reference == result_path:
+                return None
+            if reference.startswith(result_path + '.') or reference.startswith(result_path + '['):
+                paths.add(reference[len(result_path):])
+    return sorted(paths)
+
+
+def result_selector(paths: List[str]) -> Dict:
+    """A ResultSelector that keeps the given paths and the shape around them.
+
+    Lists are kept as a list of their first item when only [0] is read, and
+    whole otherwise.
+    """
+    tree: Dict = {}
+    for path in sorted(paths, key=len):
+        tokens = _tokens(path)
+        for position, token in enumerate(tokens):
+            if isinstance(token, int) and token != 0:
+                tokens = tokens[:position]
+                break
+        node = tree
+        for token in tokens[:-1]:
+            if token in node and node[token] is None:
+                break
+            node = node.setdefault(token, {})
+        else:
+            node[tokens[-1]] = None
+
+    def template(node: Dict, path: str) -> Dict:
+        selected = {}
+        for key, child in node.items():
+            child_path = f"{path}.{key}"
+            # Keep the whole value when it is read whole, or both as a list and an object
+            if child is None or child.get(0, {}) is None or (0 in child and len(child) > 1):
+                selected[f"{key}.$"] = child_path
+            elif 0 in child:
+                selected[key] = [template(child[0], f"{child_path}[0]")]
+            else:
+                selected[key] = template(child, child_path)
+        return selected
+    return template(tree, '$')
+
+
+def compact_results(definition: Dict) -> Dict:
+    """Keep only the fields later states read from the COMPACTED_RESOURCES responses.
+
+    Responses nothing reads are discarded with ResultPath null.
+    """
+    definition = copy.deepcopy(definition)
+    for name, state in definition['States'].items():
+        if state['Type'] != 'Task' or state['Resource'] not in COMPACTED_RESOURCES:
+            continue
+        result_path = state.get('ResultPath', '$')
+        if result_path in (None, '$') or 'ResultSelector' in state:
+            continue
+        paths = referenced_paths(definition, result_path)
+        if paths is None or any(isinstance(_tokens(path)[0], int) for path in paths):
+            continue
+        if not paths:
+            state['ResultPath'] = None
+            logger.info(f"{name}: result is never read, discarding it")
+        else:
+            state['ResultSelector'] = result_selector(paths)
+            logger.info(f"{name}: keeping {', '.join(paths)} of the result")
+    return definition
+
+
+def find_poll_loops(definition: Dict) -> List[Tuple[str, str, str, str]]:
+    """Return (wait, check, choice, policy) for every Wait -> check Task -> Choice -> Wait loop."""
+    states = definition['States']
+    loops = []
+    for wait_name, wait in states.items():
+        if wait['Type'] != 'Wait':
+            continue
+        check = states.get(wait.get('Next'), {})
+        action = check.get('Parameters', {}).get(dispatcher.ACTION_KEY)
+        if check.get('Type') != 'Task' or action not in ACTION_POLICIES:
+            continue
+        choice = states.get(check.get('Next'), {})
+        targets = [rule['Next'] for rule in choice.get('Choices', [])] + [choice.get('Default')]
+        if choice.get('Type') == 'Choice' and wait_name in targets:
+            loops.append((wait_name, wait['Next'], check['Next'], ACTION_POLICIES[action]))
+    return loops
+
+
+def express_rounds(policy: str) -> int:
+    """Checks per Express execution, so its waits stay within EXPRESS_WAIT_BUDGET_SECONDS."""
+    return 1 + int(EXPRESS_WAIT_BUDGET_SECONDS // POLICIES[policy].max_wait)
+
+
+def poll_child_definition(definition: Dict, wait_name: str, check_name: str, choice_name: str,
+                          rounds: int) -> Dict:
+    """An Express workflow running up to rounds checks of one polling loop.
+
+    It returns the execution state with the last check result; the parent's
+    copy of the Choice then decides, so finished, failed and still pending
+    loops leave the child the same way.
+    """
+    states = definition['States']
+    check = {key: value for key, value in copy.deepcopy(states[check_name]).items() if key != 'Catch'}
+    choice = copy.deepcopy(states[choice_name])
+    for rule in choice['Choices']:
+        rule['Next'] = 'IsRoundLimitReached' if rule['Next'] == wait_name else 'RoundDone'
+    choice['Default'] = 'IsRoundLimitReached' if choice.get('Default') == wait_name else 'RoundDone'
+    return {
+        "Comment": f"Up to {rounds} rounds of {check_name}, run as an Express workflow",
+        "StartAt": "StartRound",
+        "States": {
+            "StartRound": {"Type": "Pass", "Result": {"Count": 1}, "ResultPath": "$.PollRound",
+                           "Next": check_name},
+            check_name: check,
+            choice_name: choice,
+            "IsRoundLimitReached": {
+                "Type": "Choice",
+                "Choices": [{"Variable": "$.PollRound.Count", "NumericGreaterThanEquals": rounds,
+                             "Next": "RoundDone"}],
+                "Default": wait_name
+            },
+            wait_name: dict(copy.deepcopy(states[wait_name]), Next="NextRound"),
+            "NextRound": {"Type": "Pass",
+                          "Parameters": {"Count.$": "States.MathAdd($.PollRound.Count, 1)"},
+                          "ResultPath": "$.PollRound", "Next": check_name},
+            "RoundDone": {"Type": "Succeed"}
+        }
+    }
+
+
+def split_poll_loops(definition: Dict) -> Tuple[Dict, Dict[str, Dict]]:
+    """Move the short polling loops into Express child workflows.
+
+    Each eligible check Task is replaced by a '<check>Rounds' Task that runs
+    the child synchronously and continues with its output. Loops whose waits
+    can exceed the Express budget in a single round stay in the parent.
+    Returns the parent definition and the child definitions by check name.
+    """
+    definition = copy.deepcopy(definition)
+    states = definition['States']
+    children = {}
+    for wait_name, check_name, choice_name, policy in find_poll_loops(definition):
+        rounds = express_rounds(policy)
+        if rounds < 2:
+            logger.info(f"{check_name}: waits of up to {POLICIES[policy].max_wait}s leave no room "
+                        f"for a second check in an Express execution, keeping it in the parent")
+            continue
+        children[check_name] = poll_child_definition(definition, wait_name, check_name, choice_name, rounds)
+        rounds_name = f"{check_name}Rounds"
+        task = {
+            "Type": "Task",
+            "Resource": START_CHILD_RESOURCE,
+            "Parameters": {
+                "StateMachineArn": f"<{poll_arn_placeholder(check_name)}>",
+                "Input.$": "$"
+            },
+            "ResultPath": "$",
+            "OutputPath": "$.Output",
+            "Next": choice_name
+        }
+        if 'Catch' in states[check_name]:
+            task['Catch'] = states[check_name]['Catch']
+        # Keep the position of the check in the definition
+        definition['States'] = states = {
+            (rounds_name if name == check_name else name): (task if name == check_name else state)
+            for name, state in states.items()
+        }
+        for state in states.values():
+            _retarget(state, check_name, rounds_name)
+        logger.info(f"{check_name}: up to {rounds} checks per Express execution")
+    return definition, children
+
+
+def _retarget(state: Dict, old: str, new: str) -> None:
+    if state.get('Next') == old:
+        state['Next'] = new
+    if state.get('Default') == old:
+        state['Default'] = new
+    for rule in state.get('Choices', []) + state.get('Catch', []):
+        if rule.get('Next') == old:
+            rule['Next'] = new
+
+
+def validate(definition: Dict, express: bool = False) -> List[str]:
+    """Check a definition offline and return the problems found.
+
+    Covers transitions to missing or unreachable states, states that neither
+    continue nor end, unfilled placeholders, malformed paths, dispatcher
+    actions that do not exist and, for Express workflows, integration
+    patterns Express does not support.
+    """
+    problems = []
+    states = definition.get('States', {})
+    if definition.get('StartAt') not in states:
+        problems.append(f"StartAt {definition.get('StartAt')!r} is not a state")
+
+    transitions = {}
+    for name, state in states.items():
+        targets = [state.get('Next'), state.get('Default')]
+        targets += [rule.get('Next') for rule in state.get('Choices', []) + state.get('Catch', [])]
+        transitions[name] = [target for target in targets if target is not None]
+        for target in transitions[name]:
+            if target not in states:
+                problems.append(f"{name}: transition to missing state {target!r}")
+        terminal = state['Type'] in ('Choice', 'Succeed', 'Fail') or state.get('End')
+        if not terminal and 'Next' not in state:
+            problems.append(f"{name}: {state['Type']} state has neither Next nor End")
+        if state['Type'] == 'Choice' and not state.get('Choices'):
+            problems.append(f"{name}: Choice state without Choices")
+        if state['Type'] == 'Wait' and not any(key in state for key in ('Seconds', 'SecondsPath',
+                                                                         'Timestamp', 'TimestampPath')):
+            problems.append(f"{name}: Wait state without Seconds or Timestamp")
+        if state['Type'] == 'Task':
+            resource = state.get('Resource', '')
+            action = state.get('Parameters', {}).get(dispatcher.ACTION_KEY)
+            if action is None and resource.endswith('lambda:invoke.waitForTaskToken'):
+                action = state['Parameters'].get('Payload', {}).get(dispatcher.ACTION_KEY)
+            if action is not None and action not in dispatcher.ACTIONS:
+                problems.append(f"{name}: unknown dispatcher action {action!r}")
+            if express and resource.endswith(EXPRESS_UNSUPPORTED_SUFFIXES):
+                problems.append(f"{name}: Express workflows cannot use {resource}")
+        for text in _strings(state):
+            for placeholder in _PLACEHOLDER.findall(text):
+                problems.append(f"{name}: unfilled placeholder <{placeholder}>")
+        problems.extend(f"{name}: {problem}" for problem in _path_problems(state))
+
+    reachable, pending = set(), [definition.get('StartAt')]
+    while pending:
+        name = pending.pop()
+        if name in reachable or name not in states:
+            continue
+        reachable.add(name)
+        pending.extend(transitions[name])
+    for name in states:
+        if name not in reachable:
+            problems.append(f"{name}: not reachable from {definition.get('StartAt')}")
+    return problems
+
+
+def _path_problems(node: Any) -> List[str]:
+    problems = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key.endswith('.$') and (not isinstance(value, str) or not value.startswith(('$', 'States.'))):
+                problems.append(f"{key} must be a path or an intrinsic function, got {value!r}")
+            elif key in ('InputPath', 'OutputPath', 'ResultPath', 'SecondsPath', 'Variable',
+                         'ErrorPath', 'CausePath') and value is not None and not str(value).startswith('$'):
+                problems.append(f"{key} {value!r} is not a path")
+            else:
+                problems.extend(_path_problems(value))
+    elif isinstance(node, list):
+        for item in node:
+            problems.extend(_path_problems(item))
+    return problems
+
+
+def build(definition: Dict, config: BakeConfig = None, compact: bool = True,
+          express: bool = False) -> Tuple[Dict, Dict[str, Dict]]:
+    """Render a checked-in definition and return it with its Express children."""
+    if compact:
+        definition = compact_results(definition)
+    children = {}
+    if express:
+        definition, children = split_poll_loops(definition)
+    if config is not None:
+        definition = render(definition, config)
+        children = {name: render(child, config) for name, child in children.items()}
+    return definition, children
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description='Render and validate the bake state machines')
+    parser.add_argument('config', help='JSON file with the placeholder values, e.g. {"LambdaArn": ...}')
+    parser.add_argument('definitions', nargs='+', help='Checked-in definitions, e.g. StepFunction_v4')
+    parser.add_argument('--out', default='build', help='Directory for the rendered definitions')
+    parser.add_argument('--express', action='store_true',
+                        help='Run the short polling loops as Express child workflows')
+    parser.add_argument('--no-compact', dest='compact', action='store_false',
+                        help='Keep the full service integration responses in the state')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = BakeConfig.from_dict(json.load(f))
+    os.makedirs(args.out, exist_ok=True)
+    failed = False
+    for path in args.definitions:
+        with open(path) as f:
+            definition, children = build(json.load(f), config, args.compact, args.express)
+        base = os.path.join(args.out, os.path.basename(path))
+        outputs = [(f"{base}.json", definition, False)] + [
+            (f"{base}.{name}.json", child, True) for name, child in children.items()]
+        for output_path, output, express in outputs:
+            problems = validate(output, express)
+            for problem in problems:
+                logger.error(f"{output_path}: {problem}")
+            failed = failed or bool(problems)
+            with open(output_path, 'w') as f:
+                json.dump(output, f, indent=2)
+                f.write('\n')
+            print(f"{output_path}: {'EXPRESS' if express else 'STANDARD'}, "
+                  f"{len(output['States'])} states, {len(problems)} problems")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
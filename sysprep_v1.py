@@ -1,27 +1,51 @@
-import boto3
 import logging
+from aws_clients import get_client
+from backup_job_resolver import chunked
+from instrumentation import instrumented
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# SendCommand targets at most 50 instance IDs per call
+SEND_COMMAND_BATCH_SIZE = 50
+
+def send_sysprep(ssm, instance_ids):
+    """Run AWSEC2-RunSysprep on the instances and return the command ID."""
+    response = ssm.send_command(
+        InstanceIds=instance_ids,
+        DocumentName="AWSEC2-RunSysprep",
+        TimeoutSeconds=3600  # Set a timeout value in seconds
+    )
+    return response['Command']['CommandId']
+
+def sysprep_batch(ssm, instance_ids):
+    """Start Sysprep on many instances, 50 per command."""
+    command_ids = [send_sysprep(ssm, chunk) for chunk in chunked(instance_ids, SEND_COMMAND_BATCH_SIZE)]
+    logger.info(f"Started Sysprep on {len(instance_ids)} instances with commands {command_ids}")
+    return {
+        'statusCode': 200,
+        'body': f"Sysprep executed on {len(instance_ids)} EC2 instances",
+        'commandIds': command_ids,
+        'instanceIds': instance_ids
+    }
+
+@instrumented
 def lambda_handler(event, context):
     try:
+        # Get the shared AWS clients
+        ssm = get_client('ssm')
+
+        # Batch mode: the status handler tracks every invocation of the returned commands
+        if 'InstanceIds' in event:
+            return sysprep_batch(ssm, event['InstanceIds'])
+
         instance_id = event['InstanceId']
         logger.info(f"Starting Sysprep for instance: {instance_id}")
 
-        # Initialize AWS clients
-        ssm = boto3.client('ssm')
-
         try:
             # Execute the Sysprep command using AWS Systems Manager
-            response = ssm.send_command(
-                InstanceIds=[instance_id],
-                DocumentName="AWSEC2-RunSysprep",
-                TimeoutSeconds=3600  # Set a timeout value in seconds
-            )
-            
-            command_id = response['Command']['CommandId']
+            command_id = send_sysprep(ssm, [instance_id])
             logger.info(f"Command execution ID: {command_id}")
 
             return {
@@ -0,0 +1,58 @@
+import logging
+from typing import Dict, Any
+from completion_events import parse_event, FAILURE
+from task_token_store import complete_task, get_task_token_store
+from instrumentation import instrumented
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Complete a waiting Step Functions task from an EventBridge event.
+
+    Handles EC2 instance state-change, EC2 AMI state change and SSM command
+    invocation status-change events. Events that nobody waits for, or that do
+    not end a wait, are ignored.
+
+    Args:
+        event (dict): EventBridge event
+        context (Any): Lambda context object
+
+    Returns:
+        dict: What was matched and whether a task was completed
+    """
+    try:
+        wait_for, resource_id, outcome, output = parse_event(event)
+        if wait_for is None:
+            logger.info(f"Ignoring unsupported event: {event.get('detail-type')}")
+            return {'Matched': False}
+        if outcome is None:
+            logger.info(f"{wait_for} {resource_id} not finished yet: {output}")
+            return {'Matched': False, 'WaitFor': wait_for, 'ResourceId': resource_id}
+
+        # Popping the token makes duplicate event deliveries harmless
+        task_token = get_task_token_store().pop(wait_for, resource_id)
+        if task_token is None:
+            logger.info(f"No task is waiting for {wait_for} {resource_id}")
+            return {'Matched': False, 'WaitFor': wait_for, 'ResourceId': resource_id}
+
+        logger.info(f"Completing task waiting for {wait_for} {resource_id}: {outcome}")
+        if outcome == FAILURE:
+            completed = complete_task(task_token, error=f"{wait_for}.Failed", cause=str(output))
+        else:
+            completed = complete_task(task_token, output)
+
+        return {
+            'Matched': True,
+            'WaitFor': wait_for,
+            'ResourceId': resource_id,
+            'Outcome': outcome,
+            'Completed': completed
+        }
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import threading
+import logging
+from typing import Dict, Optional
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Tokens are only useful while the waiting state is open; expire them with it
+DEFAULT_TOKEN_TTL_SECONDS = int(os.environ.get('TASK_TOKEN_TTL_SECONDS', str(24 * 3600)))
+
+
+def token_key(wait_for: str, resource_id: str) -> str:
+    """Build the store key for a wait, e.g. 'ami#ami-0123'."""
+    return f"{wait_for}#{resource_id}"
+
+
+class DynamoDBTaskTokenStore:
+    """Task tokens in a DynamoDB table with a 'TokenKey' string partition key.
+
+    Items carry an 'ExpiresAt' epoch attribute suitable for DynamoDB TTL.
+    """
+
+    def __init__(self, table_name: str, dynamodb_client=None):
+        self.table_name = table_name
+        self.dynamodb = dynamodb_client or get_client('dynamodb')
+
+    def put(self, wait_for: str, resource_id: str, task_token: str,
+            ttl_seconds: int = DEFAULT_TOKEN_TTL_SECONDS) -> None:
+        self.dynamodb.put_item(
+            TableName=self.table_name,
+            Item={
+                'TokenKey': {'S': token_key(wait_for, resource_id)},
+                'TaskToken': {'S': task_token},
+                'ExpiresAt': {'N': str(int(time.time()) + ttl_seconds)}
+            }
+        )
+
+    def pop(self, wait_for: str, resource_id: str) -> Optional[str]:
+        """Atomically remove and return the token, so duplicate events are ignored."""
+        response = self.dynamodb.delete_item(
+            TableName=self.table_name,
+            Key={'TokenKey': {'S': token_key(wait_for, resource_id)}},
+            ReturnValues='ALL_OLD'
+        )
+        item = response.get('Attributes')
+        return item['TaskToken']['S'] if item else None
+
+
+class InMemoryTaskTokenStore:
+    """Process-local token store for running the callback handlers locally."""
+
+    def __init__(self):
+        self.tokens: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def put(self, wait_for: str, resource_id: str, task_token: str,
+            ttl_seconds: int = DEFAULT_TOKEN_TTL_SECONDS) -> None:
+        with self._lock:
+            self.tokens[token_key(wait_for, resource_id)] = task_token
+
+    def pop(self, wait_for: str, resource_id: str) -> Optional[str]:
+        with self._lock:
+            return self.tokens.pop(token_key(wait_for, resource_id), None)
+
+
+_store = None
+
+
+def get_task_token_store():
+    """Return the configured store, the DynamoDB table named by TASK_TOKEN_TABLE.
+
+    The callback runs in another Lambda than the registration, so a
+    process-local store is only used when installed with set_task_token_store.
+    """
+    global _store
+    if _store is None:
+        table_name = os.environ.get('TASK_TOKEN_TABLE')
+        if not table_name:
+            raise RuntimeError("TASK_TOKEN_TABLE is not set; task tokens need a DynamoDB table")
+        _store = DynamoDBTaskTokenStore(table_name)
+    return _store
+
+
+def set_task_token_store(store) -> None:
+    """Replace the configured store, e.g. with an InMemoryTaskTokenStore locally."""
+    global _store
+    _store = store
+
+
+def complete_task(task_token: str, output: Dict = None, error: str = None,
+                  cause: str = None) -> bool:
+    """Send task success (or failure when error is given); False if the token is stale."""
+    sfn = get_client('stepfunctions')
+    try:
+        if error:
+            sfn.send_task_failure(taskToken=task_token, error=error, cause=cause or '')
+        else:
+            sfn.send_task_success(taskToken=task_token, output=json.dumps(output or {}))
+        return True
+    except ClientError as e:
+        # The execution may have timed out or been stopped in the meantime
+        if e.response['Error']['Code'] in ('TaskTimedOut', 'InvalidToken', 'TaskDoesNotExist'):
+            logger.warning(f"Task token no longer valid: {str(e)}")
+            return False
+        raise
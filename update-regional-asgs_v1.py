@@ -0,0 +1,61 @@
+import logging
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from ami_distribution import AVAILABLE, DISTRIBUTION_WORKERS, distribution_report, regional_target
+from rollout_orchestrator import run_rollout
+import polling
+from instrumentation import instrumented
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def regional_update_pipeline(asg_name: str):
+    """Pipeline that switches the group of the same name in a copy's region using updateASG_v1."""
+    import updateASG_v1
+
+    def run(copy: Dict) -> Dict:
+        event = regional_target(get_client('autoscaling', copy['Region']), asg_name, copy)
+        # Unwrapped: the calls are recorded by this function's own invocation
+        result = updateASG_v1.lambda_handler.__wrapped__(event, None)
+        return dict(result, UpdatedAt=polling.clock())
+    return run
+
+@instrumented
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
+    """
+    Switch the Auto Scaling group in every region with an available AMI copy.
+
+    Args:
+        event (dict): Must contain AutoScalingGroupName and Copies, the records
+                     returned by the last copy check
+        context (Any): Lambda context object
+
+    Returns:
+        dict: Regions, one entry per copy with its Status ('Updated',
+              'CopyFailed' or 'UpdateFailed') and completion times, plus
+              UpdatedCount and FailedCount
+    """
+    try:
+        asg_name = event['AutoScalingGroupName']
+        copies = event['Copies']
+        targets = [copy for copy in copies if copy['State'] == AVAILABLE]
+
+        # A failing region is reported and never stops the others
+        rollout = run_rollout(targets, regional_update_pipeline(asg_name), DISTRIBUTION_WORKERS,
+                              rate_limits={}, name_key='Region')
+        report = distribution_report(copies, rollout)
+        logger.info(f"Updated {asg_name} in {report['UpdatedCount']} regions, "
+                    f"{report['FailedCount']} failed")
+        return report
+
+    except KeyError as e:
+        logger.error(f"Missing required parameter: {str(e)}")
+        raise
+    except ClientError as e:
+        logger.error(f"AWS API error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise
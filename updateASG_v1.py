@@ -1,29 +1,40 @@
-import boto3
 import logging
 from typing import Dict, Any
 from botocore.exceptions import ClientError
+from aws_clients import get_client
+import metadata_cache
+from launch_template_retention import check_keep_last, get_template_pinned_versions, prune_launch_template
+from instance_refresh import start_refresh
+from capacity_guard import PIN_MAX, SUSPEND_PROCESSES, restore_capacity
+from instrumentation import instrumented
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 def get_latest_template_version(ec2_client, launch_template_name: str) -> tuple:
-    """Get the latest template version and current AMI ID."""
+    """Get the latest template version and the AMI ID of the default version.
+
+    Only the $Latest and $Default versions are requested, so the response size
+    does not grow with the number of versions the template has accumulated.
+    """
     try:
         versions = ec2_client.describe_launch_template_versions(
-            LaunchTemplateName=launch_template_name
+            LaunchTemplateName=launch_template_name,
+            Versions=['$Latest', '$Default']
         )["LaunchTemplateVersions"]
         
-        latest_version = max(version['VersionNumber'] for version in versions)
-        current_ami_id = versions[-1]['LaunchTemplateData']['ImageId']
+        latest = max(versions, key=lambda version: version['VersionNumber'])
+        default = next((version for version in versions if version.get('DefaultVersion')), latest)
+        current_ami_id = default['LaunchTemplateData'].get('ImageId')
         
-        return latest_version, current_ami_id
+        return latest['VersionNumber'], current_ami_id
     except ClientError as e:
         logger.error(f"Error getting launch template versions: {str(e)}")
         raise
 
 def update_launch_template(ec2_client, launch_template_name: str, 
-                         latest_version: int, latest_ami_id: str) -> Dict:
+                         latest_version: int, latest_ami_id: str, region_name: str = None) -> Dict:
     """Update launch template with new AMI ID."""
     try:
         new_version = ec2_client.create_launch_template_version(
@@ -36,6 +47,7 @@ def update_launch_template(ec2_client, launch_template_name: str,
             LaunchTemplateName=launch_template_name,
             DefaultVersion=str(new_version['VersionNumber'])
         )
+        metadata_cache.invalidate_launch_template(launch_template_name, region_name)
         
         return new_version
     except ClientError as e:
@@ -43,7 +55,7 @@ def update_launch_template(ec2_client, launch_template_name: str,
         raise
 
 def update_asg(autoscaling_client, asg_name: str, 
-               launch_template_name: str, version_number: str) -> None:
+               launch_template_name: str, version_number: str, region_name: str = None) -> None:
     """Update Auto Scaling group with new launch template version."""
     try:
         autoscaling_client.update_auto_scaling_group(
@@ -53,51 +65,77 @@ def update_asg(autoscaling_client, asg_name: str,
                 'Version': version_number
             }
         )
+        metadata_cache.invalidate_auto_scaling_group(asg_name, region_name)
     except ClientError as e:
         logger.error(f"Error updating Auto Scaling group: {str(e)}")
         raise
 
-def revert_asg_capacity(asg_client, asg_name: str, 
-                       original_max_capacity: int) -> None:
-    """Revert ASG maximum capacity to original value."""
+def restore_asg_capacity(asg_client, asg_name: str, original_max_capacity: int = None) -> Dict:
+    """Restore the maximum capacity or scaling processes the bake changed."""
     try:
-        asg_client.update_auto_scaling_group(
-            AutoScalingGroupName=asg_name,
-            MaxSize=original_max_capacity
-        )
-        logger.info(f"Reverted maximum capacity of ASG {asg_name} to {original_max_capacity}")
+        return restore_capacity(asg_client, asg_name, original_max_capacity)
     except ClientError as e:
-        logger.error(f"Error reverting ASG capacity: {str(e)}")
+        logger.error(f"Error restoring ASG capacity: {str(e)}")
         raise
 
+def prune_old_versions(ec2_client, autoscaling_client, launch_template_id: str,
+                       keep_last: int, asg_name: str) -> Dict:
+    """Prune old launch template versions without failing the update.
+
+    Only this group and the groups tagged as sharing the template are checked
+    for pinned versions, so the cost does not grow with the number of groups.
+    """
+    try:
+        pinned = get_template_pinned_versions(autoscaling_client, launch_template_id, [asg_name])
+        return prune_launch_template(ec2_client, launch_template_id, keep_last, pinned)
+    except ClientError as e:
+        logger.warning(f"Error pruning launch template {launch_template_id}: {str(e)}")
+        return {'LaunchTemplateId': launch_template_id, 'Error': str(e)}
+
+@instrumented
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
     """
     Update Auto Scaling group with new AMI ID.
     
     Args:
         event (dict): Must contain LaunchTemplateId, ImageId, AutoScalingGroupName,
-                     LaunchTemplateName, and optionally OriginalMaxCapacity
+                     LaunchTemplateName, and optionally CapacityMode and
+                     OriginalMaxCapacity (what the bake changed on the group),
+                     RetainVersions (prune all but that many recent versions) and
+                     InstanceRefresh (true or refresh Preferences to replace the
+                     running instances) and Region (update the group in another
+                     region, e.g. with a copy of the AMI made there)
         context (Any): Lambda context object
     
     Returns:
         dict: Update result containing ASG and launch template details
     """
     try:
+        metadata_cache.start_invocation()
+
         # Extract input parameters
         launch_template_id = event['LaunchTemplateId']
         latest_ami_id = event['ImageId']
         asg_name = event['AutoScalingGroupName']
         launch_template_name = event['LaunchTemplateName']
+        mode = event.get('CapacityMode')
         original_max_capacity = event.get('OriginalMaxCapacity')
+        retain_versions = event.get('RetainVersions')
+        instance_refresh = event.get('InstanceRefresh')
+        region = event.get('Region')
+        if retain_versions is not None:
+            # Fail before the switch rather than when pruning after it
+            check_keep_last(int(retain_versions))
 
-        # Initialize AWS clients with config for retries
-        #config = boto3.Config(retries={'max_attempts': 3})
-        ec2_client = boto3.client('ec2')
-        autoscaling_client = boto3.client('autoscaling')
+        # Retries and client-side rate limiting come from the shared client config
+        ec2_client = get_client('ec2', region)
+        autoscaling_client = get_client('autoscaling', region)
 
         # Get current template version and AMI ID
-        latest_version, current_ami_id = get_latest_template_version(
-            ec2_client, launch_template_name
+        latest_version, current_ami_id = metadata_cache.get_launch_template_metadata(
+            launch_template_name,
+            lambda: get_latest_template_version(ec2_client, launch_template_name),
+            region
         )
 
         logger.info(f"Current AMI ID: {current_ami_id}")
@@ -109,30 +147,48 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict:
             
             # Update launch template
             new_version = update_launch_template(
-                ec2_client, launch_template_name, latest_version, latest_ami_id
+                ec2_client, launch_template_name, latest_version, latest_ami_id, region
             )
             
             # Update ASG
             update_asg(
                 autoscaling_client, asg_name, launch_template_name, 
-                str(new_version['VersionNumber'])
+                str(new_version['VersionNumber']), region
             )
             
             logger.info(f"Updated ASG {asg_name} with new launch template version {new_version['VersionNumber']}")
         else:
             logger.info(f"Current launch template version for {launch_template_name} is already up-to-date")
 
-        # Revert ASG capacity if needed
-        if original_max_capacity is not None:
-            revert_asg_capacity(autoscaling_client, asg_name, original_max_capacity)
+        # Restore the capacity or scaling processes from the state recorded on the group
+        capacity_restore = None
+        if mode in (PIN_MAX, SUSPEND_PROCESSES) or original_max_capacity is not None:
+            capacity_restore = restore_asg_capacity(autoscaling_client, asg_name, original_max_capacity)
 
-        return {
+        result = {
             "UpdateResult": {
                 "AutoScalingGroupName": asg_name,
                 "LaunchTemplateId": launch_template_id,
                 "LaunchTemplateName": launch_template_name
             }
         }
+        if region is not None:
+            result["UpdateResult"]["Region"] = region
+        if capacity_restore is not None:
+            result["CapacityRestore"] = capacity_restore
+
+        # Optionally replace the running instances; matching ones are skipped,
+        # so a retried update does not replace them twice
+        if instance_refresh not in (None, False):
+            result["InstanceRefresh"] = start_refresh(autoscaling_client, asg_name, instance_refresh)
+
+        # Optionally prune versions outside the retention window
+        if retain_versions is not None:
+            result["PruneResult"] = prune_old_versions(
+                ec2_client, autoscaling_client, launch_template_id, int(retain_versions), asg_name
+            )
+
+        return result
 
     except KeyError as e:
         logger.error(f"Missing required parameter: {str(e)}")